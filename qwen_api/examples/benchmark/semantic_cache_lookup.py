@@ -0,0 +1,80 @@
+"""
+Benchmark: lookup latency of the semantic cache index against its size.
+
+Fills a ``VectorIndex`` with random unit vectors and times single-query
+searches with the exact flat search and with IVF partitions, and the
+throughput of batched searches. IVF recall is the share of queries for
+which it finds the same nearest row as the flat search. The cost of
+embedding a question with ``HashingEmbedder`` is printed for comparison.
+
+Requires numpy (pip install qwen-api[semantic]).
+Run with: python examples/benchmark/semantic_cache_lookup.py
+"""
+
+import timeit
+
+import numpy as np
+
+from qwen_api.core.semantic_cache import HashingEmbedder, VectorIndex, normalize
+
+DIM = 384
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 200
+BATCH = 64
+
+
+def build(vectors: np.ndarray, nlist=None, nprobe: int = 8) -> VectorIndex:
+    index = VectorIndex(DIM, nlist=nlist, nprobe=nprobe, capacity=len(vectors))
+    for vector in vectors:
+        index.add(vector)
+    return index
+
+
+def per_query_us(index: VectorIndex, queries: np.ndarray) -> float:
+    def run():
+        for query in queries:
+            index.search(query, 1)
+
+    seconds = min(timeit.repeat(run, number=1, repeat=3))
+    return seconds / len(queries) * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    embedder = HashingEmbedder()
+    question = "How do I reset the password of my account?"
+    seconds = min(timeit.repeat(lambda: embedder([question]), number=200, repeat=3))
+    print(f"HashingEmbedder: {seconds / 200 * 1e6:.1f} us/question\n")
+
+    print(
+        f"{'entries':>8} {'flat us/query':>14} {'ivf us/query':>13} "
+        f"{'ivf recall':>11} {'batched us/query':>17}"
+    )
+    for size in SIZES:
+        vectors = normalize(rng.standard_normal((size, DIM)))
+        # Queries close to stored vectors, like paraphrases of cached questions
+        targets = vectors[rng.choice(size, QUERIES, replace=False)]
+        queries = normalize(targets + 0.05 * rng.standard_normal(targets.shape))
+
+        flat = build(vectors)
+        nlist = max(1, int(np.sqrt(size)))
+        ivf = build(vectors, nlist=nlist)
+
+        flat_us = per_query_us(flat, queries)
+        ivf_us = per_query_us(ivf, queries)
+        exact = [found[0][1] for found in flat.search(queries, 1)]
+        approx = [found[0][1] if found else -1 for found in ivf.search(queries, 1)]
+        recall = np.mean(np.array(exact) == np.array(approx))
+
+        batch = queries[:BATCH]
+        seconds = min(timeit.repeat(lambda: flat.search(batch, 1), number=5, repeat=3))
+        batched_us = seconds / 5 / len(batch) * 1e6
+
+        print(
+            f"{size:>8} {flat_us:>14.1f} {ivf_us:>13.1f} "
+            f"{recall:>11.3f} {batched_us:>17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: coordination overhead of the SQLite shared rate-limit state.
+
+Measures the per-request cost of the limiter and credential pool operations
+(token acquire, credential acquire/report/release) with in-process state and
+with ``SQLiteSharedState``, then checks that several processes sharing one
+database stay within the configured request rate.
+
+Run with: python examples/benchmark/shared_state_overhead.py
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+import timeit
+
+from qwen_api.core.auth_manager import AuthManager
+from qwen_api.core.rate_limiter import RateLimiter
+from qwen_api.core.shared_state import SQLiteSharedState
+
+CREDENTIALS = [
+    {"token": f"token-{i}", "cookie": f"cookie-{i}", "name": f"account-{i}"}
+    for i in range(4)
+]
+NUMBER = 2000
+PROCESSES = 4
+RATE = 50
+DURATION = 2.0
+
+
+def request_cycle(limiter: RateLimiter, auth: AuthManager) -> None:
+    limiter.acquire()
+    credential = auth.acquire()
+    auth.limiter(credential).acquire()
+    auth.report(credential, 200)
+    auth.release(credential)
+
+
+def measure(label: str, shared_state=None) -> None:
+    # A rate high enough to never wait, so only bookkeeping is measured
+    limiter = RateLimiter(requests_per_second=1e9, shared_state=shared_state)
+    auth = AuthManager(credentials=CREDENTIALS, shared_state=shared_state)
+    seconds = min(
+        timeit.repeat(lambda: request_cycle(limiter, auth), number=NUMBER, repeat=3)
+    )
+    print(f"{label:<28}{seconds / NUMBER * 1e6:10.1f} µs/request")
+
+
+def worker(path: str, deadline: float, counter) -> None:
+    limiter = RateLimiter(
+        requests_per_second=RATE, burst=1, shared_state=SQLiteSharedState(path)
+    )
+    sent = 0
+    while True:
+        limiter.acquire()
+        if time.monotonic() >= deadline:
+            break
+        sent += 1
+    with counter.get_lock():
+        counter.value += sent
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "qwen-state.db")
+
+        measure("in-process state")
+        measure("SQLite shared state", SQLiteSharedState(path))
+
+        counter = multiprocessing.Value("i", 0)
+        deadline = time.monotonic() + DURATION
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, deadline, counter))
+            for _ in range(PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print(
+            f"{PROCESSES} processes, limit {RATE} req/s for {DURATION:.0f}s: "
+            f"{counter.value} requests ({counter.value / DURATION:.1f} req/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: per-chunk cost of decoding and validating SSE events.
+
+Compares the previous path (``json.loads`` followed by
+``ChatResponseStream(**data)``) with the precompiled ``TypeAdapter``
+validation that parses and validates the raw bytes in one pass.
+
+Run with: python examples/benchmark/sse_chunk_validation.py
+"""
+
+import json
+import timeit
+
+from qwen_api.core.types.chat import ChatMessage, ChatResponseStream
+from qwen_api.core.types.sse_event import SSE_EVENT_ADAPTER, STREAM_EVENT_ADAPTER
+
+PAYLOAD = json.dumps(
+    {
+        "choices": [
+            {
+                "delta": {
+                    "role": "assistant",
+                    "content": " token",
+                    "phase": "answer",
+                    "status": "typing",
+                }
+            }
+        ],
+        "usage": {"input_tokens": 12, "output_tokens": 345, "total_tokens": 357},
+        "response.created": {"chat_id": "c" * 36, "response_id": "r" * 36},
+    }
+).encode()
+
+MESSAGE = ChatMessage(role="assistant", content="")
+
+
+def legacy_model():
+    data = json.loads(PAYLOAD)
+    return ChatResponseStream(**data, message=MESSAGE)
+
+
+def adapter_model():
+    event = STREAM_EVENT_ADAPTER.validate_json(PAYLOAD)
+    return ChatResponseStream.model_construct(
+        choices=event.choices, usage=event.usage, message=MESSAGE
+    )
+
+
+def legacy_delta():
+    data = json.loads(PAYLOAD)
+    delta = data["choices"][0]["delta"]
+    return delta.get("role"), delta.get("content")
+
+
+def adapter_delta():
+    delta = SSE_EVENT_ADAPTER.validate_json(PAYLOAD)["choices"][0]["delta"]
+    return delta.get("role"), delta.get("content")
+
+
+def main(number: int = 50_000):
+    cases = [
+        ("json.loads + ChatResponseStream(**data)", legacy_model),
+        ("StreamEvent adapter validate_json", adapter_model),
+        ("json.loads + dict access (delta)", legacy_delta),
+        ("SSEEvent adapter validate_json (delta)", adapter_delta),
+    ]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:<45} {seconds / number * 1e6:8.2f} us/chunk")
+
+
+if __name__ == "__main__":
+    main()
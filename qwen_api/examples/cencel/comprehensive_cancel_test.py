@@ -256,7 +256,7 @@ def test_session_tracking():
         client = Qwen(log_level="INFO")
 
         try:
-            print(f"Initial active sessions: {len(client._active_sessions)}")
+            print(f"Initial active responses: {len(client._active_responses)}")
 
             messages = [
                 ChatMessage(
@@ -272,7 +272,7 @@ def test_session_tracking():
                 stream=True,
             )
 
-            print(f"Active sessions during request: {len(client._active_sessions)}")
+            print(f"Active responses during request: {len(client._active_responses)}")
 
             chunk_count = 0
             async for chunk in response:
@@ -282,7 +282,7 @@ def test_session_tracking():
                         f"Chunk {chunk_count}: {chunk.choices[0].delta.content[:30]}..."
                     )
 
-            print(f"Active sessions after completion: {len(client._active_sessions)}")
+            print(f"Active responses after completion: {len(client._active_responses)}")
             print("✅ Session tracking test completed\n")
 
         finally:
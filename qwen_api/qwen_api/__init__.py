@@ -1,3 +1,32 @@
 from .client import Qwen
+from .core.auth_manager import Credential
+from .core.circuit_breaker import CircuitBreaker
+from .core.concurrency import AdaptiveConcurrencyLimiter
+from .core.conversation import Conversation
+from .core.hedging import HedgePolicy
+from .core.multipart import MultipartPolicy
+from .core.rate_limiter import RateLimiter
+from .core.response_cache import ResponseCache, SQLiteResponseCache
+from .core.retry import RetryPolicy
+from .core.semantic_cache import SemanticCache
+from .core.shared_state import SQLiteSharedState
+from .core.timeouts import Timeouts
+from .core.upload_cache import UploadCache
 
-__all__ = ["Qwen"]
+__all__ = [
+    "Qwen",
+    "AdaptiveConcurrencyLimiter",
+    "CircuitBreaker",
+    "Credential",
+    "Conversation",
+    "HedgePolicy",
+    "MultipartPolicy",
+    "RateLimiter",
+    "ResponseCache",
+    "RetryPolicy",
+    "SemanticCache",
+    "SQLiteResponseCache",
+    "SQLiteSharedState",
+    "Timeouts",
+    "UploadCache",
+]
@@ -1,15 +1,72 @@
+import asyncio
+import itertools
 import json
-from typing import AsyncGenerator, Generator, List, Optional, cast, Any
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 import requests
 import aiohttp
-from sseclient import SSEClient
 from pydantic import ValidationError
-from .core.auth_manager import AuthManager
+from .core.auth_manager import AUTH_ERROR_STATUSES, AuthManager, Credential
+from .core import json_codec
+from .core.session import SyncSessionPool, AsyncSessionPool
+from .core.multipart import MultipartPolicy
+from .core.oss_pool import OSSPool
+from .core.concurrency import AdaptiveConcurrencyLimiter
+from .core.rate_limiter import RateLimiter
+from .core.shared_state import SQLiteSharedState
+from .core.timeouts import (
+    Timeouts,
+    Watchdog,
+    abort_response,
+    awatch_response,
+    is_read_timeout,
+    watch_response,
+)
+from .core.hedging import HedgeAttempt, HedgePolicy, aprepend
+from .core.circuit_breaker import BreakerCall, CircuitBreaker
+from .core.coalescing import Coalescer
+from .core.response_cache import ResponseCache
+from .core.semantic_cache import SemanticCache
+from .core.upload_cache import UploadCache
+from .core.retry import (
+    ASYNC_RETRYABLE_ERRORS,
+    SYNC_RETRYABLE_ERRORS,
+    RetryPolicy,
+    parse_retry_after,
+)
+from .core.wire import build_payload_head, dict_to_wire, message_to_wire
+from .core.conversation import Conversation
+from .core.sse import iter_sse_response, aiter_sse_response
+from .core.stream import TextAccumulator
 from .logger import setup_logger
-from .core.types.chat import ChatResponse, ChatResponseStream, ChatMessage, MessageRole
+from .core.types.sse_event import SSE_EVENT_ADAPTER, STREAM_EVENT_ADAPTER
+from .core.types.chat import (
+    ChatResponse,
+    ChatResponseStream,
+    ChatMessage,
+    StreamChunk,
+)
 from .resources.completions import Completion
-from .utils.promp_system import WEB_DEVELOPMENT_PROMPT
-from .core.exceptions import QwenAPIError
+from .core.exceptions import (
+    AuthError,
+    QwenAPIError,
+    RateLimitError,
+    StreamTimeoutError,
+)
 from .core.types.response.function_tool import ToolCall, Function
 
 
@@ -22,128 +79,783 @@ class Qwen:
         timeout: int = 600,
         log_level: str = "INFO",
         save_logs: bool = False,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: int = 0,
+        keep_alive: bool = True,
+        connector_limit: int = 100,
+        connector_limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_ttl: Optional[int] = 300,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        requests_per_second: Optional[float] = None,
+        max_concurrent_streams: Optional[int] = None,
+        concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        credentials: Optional[Iterable[Union[Credential, dict]]] = None,
+        credentials_file: Optional[str] = None,
+        shared_state: Optional[SQLiteSharedState] = None,
+        timeouts: Optional[Timeouts] = None,
+        hedge_policy: Optional[HedgePolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        coalesce_requests: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        upload_cache: Optional[UploadCache] = None,
+        multipart_policy: Optional[MultipartPolicy] = None,
     ):
         self.chat = Completion(self)
         self.timeout = timeout
-        self.auth = AuthManager(token=api_key, cookie=cookie)
+        self.timeouts = timeouts or Timeouts(total=timeout)
+        self.auth = AuthManager(
+            token=api_key,
+            cookie=cookie,
+            credentials=credentials,
+            credentials_file=credentials_file,
+            shared_state=shared_state,
+        )
         self.logger = setup_logger(log_level=log_level, save_logs=save_logs)
         self.base_url = base_url
-        self._active_sessions = []
+        self._active_responses = []
         self._is_cancelled = False
+        self._sync_pool = SyncSessionPool(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+            keep_alive=keep_alive,
+        )
+        # Connections to OSS, shared by the file uploads
+        self.oss_pool = OSSPool(pool_size=pool_maxsize)
+        self._async_pool = AsyncSessionPool(
+            limit=connector_limit,
+            limit_per_host=connector_limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            dns_ttl=dns_ttl,
+        )
+        self._default_headers: Optional[dict] = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter or RateLimiter(
+            requests_per_second=requests_per_second,
+            max_concurrent_streams=max_concurrent_streams,
+            shared_state=shared_state,
+        )
+        self.concurrency_limiter = concurrency_limiter
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        # Identical chat requests in flight at the same time share a response
+        self.coalescer = (
+            Coalescer(self._release_response) if coalesce_requests else None
+        )
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.upload_cache = upload_cache
+        self.multipart_policy = multipart_policy or MultipartPolicy()
+        # Threads sending both attempts of hedged sync requests, started as
+        # needed; each request in flight holds one or two of them
+        self._hedge_pool = (
+            ThreadPoolExecutor(
+                max_workers=max(32, 2 * pool_maxsize), thread_name_prefix="qwen-hedge"
+            )
+            if hedge_policy is not None
+            else None
+        )
+        # Slots held by responses, released when they are consumed or garbage
+        # collected
+        self._release_hooks = weakref.WeakKeyDictionary()
+        self._watchdogs = weakref.WeakKeyDictionary()
+        # Breaker calls of chat responses, settled by their first event
+        self._breaker_calls = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self) -> requests.Session:
+        """Pooled HTTP session shared by all sync requests of this client."""
+        return self._sync_pool.get()
 
     def _build_headers(self) -> dict:
+        # Headers only depend on the credentials, so build them once and hand
+        # out copies that callers are free to mutate.
+        if self._default_headers is None:
+            self._default_headers = {
+                "Content-Type": "application/json",
+                "Authorization": self.auth.get_token(),
+                "Cookie": self.auth.get_cookie(),
+                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
+                "Host": "chat.qwen.ai",
+                "Origin": "https://chat.qwen.ai",
+            }
+        return dict(self._default_headers)
+
+    def _cache_for(self, temperature: float) -> Optional[ResponseCache]:
+        """The response cache, if calls at ``temperature`` may use it."""
+        cache = self.response_cache
+        if cache is None or not cache.cacheable(temperature):
+            return None
+        return cache
+
+    def _semantic_cache_for(self, temperature: float) -> Optional[SemanticCache]:
+        """The semantic cache, if calls at ``temperature`` may use it."""
+        cache = self.semantic_cache
+        if cache is None or not cache.cacheable(temperature):
+            return None
+        return cache
+
+    def _encode_payload(
+        self,
+        messages: Union[List[ChatMessage], Conversation],
+        temperature: float,
+        model: str,
+        max_tokens: Optional[int],
+        validate: bool = True,
+    ) -> bytes:
+        if isinstance(messages, Conversation):
+            # Reuses the fragments the conversation encoded when its
+            # messages were added
+            return messages.encode_payload(model, temperature, max_tokens)
+        return json_codec.dumps(
+            self._build_payload(
+                messages=messages,
+                temperature=temperature,
+                model=model,
+                max_tokens=max_tokens,
+                validate=validate,
+            )
+        )
+
+    def _raise_for_status(self, status: int, error_text: str) -> None:
+        self.logger.error(f"API Error: {status} {error_text}")
+        if status == 429:
+            raise RateLimitError(f"Too many requests: {error_text}")
+        if status in AUTH_ERROR_STATUSES:
+            raise AuthError(f"Authentication failed: {status} {error_text}")
+        raise QwenAPIError(f"API Error: {status} {error_text}")
+
+    def _on_release(self, response, callback, *args) -> None:
+        self._release_hooks.setdefault(response, []).append(
+            weakref.finalize(response, callback, *args)
+        )
+
+    def _release_response(self, response, drop: bool = False) -> None:
+        """
+        Stop tracking a response, free its stream slot and hand its connection
+        back to the pool (or drop the connection when ``drop`` is set).
+        """
+        if response is None:
+            # Events of a coalesced request, owned by its flight
+            return
+        if response in self._active_responses:
+            self._active_responses.remove(response)
+        for hook in self._release_hooks.pop(response, ()):
+            hook()
+        if isinstance(response, requests.Response) or drop:
+            response.close()
+        else:
+            response.release()
+
+    def _track_call(self, response, call: Optional[BreakerCall], hold_stream: bool):
+        # Chat responses succeed with their first event, others right away
+        if call is None:
+            return
+        if hold_stream:
+            self._breaker_calls[response] = call
+            self._on_release(response, call.abandon)
+        else:
+            call.succeed()
+
+    def _settle_call(self, response, failed: Optional[bool]) -> None:
+        # Report the outcome of a chat response's breaker call, None for none
+        call = self._breaker_calls.pop(response, None)
+        if call is None:
+            return
+        if failed is None:
+            call.abandon()
+        elif failed:
+            call.fail()
+        else:
+            call.succeed()
+
+    def _watch(self, response, watchdog: Watchdog) -> None:
+        self._watchdogs[response] = watchdog
+        self._on_release(response, watchdog.stop)
+
+    def _iter_events(self, response: requests.Response) -> Iterator[bytes]:
+        """
+        SSE payloads of a response, fed to its watchdog. The first one
+        settles the response's circuit breaker call.
+        """
+        watchdog = self._watchdogs.get(response)
+        pending = response in self._breaker_calls
+        if watchdog is None and not pending:
+            yield from iter_sse_response(response)
+            return
+        try:
+            for payload in iter_sse_response(response):
+                if watchdog is not None:
+                    watchdog.feed()
+                if pending:
+                    pending = False
+                    self._settle_call(response, False)
+                yield payload
+        except Exception as e:
+            self._settle_call(response, True)
+            # The socket read timeout only backs up the watchdog, but report
+            # it as the stall it is
+            if watchdog is not None and is_read_timeout(e):
+                watchdog.expire_read()
+            # Aborted reads fail in various ways depending on timing
+            if watchdog is not None and watchdog.expired:
+                raise StreamTimeoutError(
+                    watchdog.error_message(), watchdog.expired
+                ) from e
+            raise
+        if watchdog is not None and watchdog.expired:
+            self._settle_call(response, True)
+            raise StreamTimeoutError(watchdog.error_message(), watchdog.expired)
+
+    async def _aiter_events(
+        self, response: aiohttp.ClientResponse
+    ) -> AsyncIterator[bytes]:
+        """Async version of :meth:`_iter_events`."""
+        watchdog = self._watchdogs.get(response)
+        pending = response in self._breaker_calls
+        try:
+            async for payload in aiter_sse_response(response):
+                if watchdog is not None:
+                    watchdog.feed()
+                if pending:
+                    pending = False
+                    self._settle_call(response, False)
+                yield payload
+        except Exception as e:
+            self._settle_call(response, True)
+            if watchdog is not None and is_read_timeout(e):
+                watchdog.expire_read()
+            if watchdog is not None and watchdog.expired:
+                raise StreamTimeoutError(
+                    watchdog.error_message(), watchdog.expired
+                ) from e
+            raise
+        if watchdog is not None and watchdog.expired:
+            self._settle_call(response, True)
+            raise StreamTimeoutError(watchdog.error_message(), watchdog.expired)
+
+    def _retry_stalled(
+        self, error: StreamTimeoutError, call: Callable, timeouts: Timeouts
+    ):
+        """
+        Repeat ``call`` after it failed with ``error`` when ``timeouts``
+        allow retrying stalled requests, per :attr:`retry_policy`.
+        """
+        if not timeouts.retry_stalled:
+            raise error
+        retry = self.retry_policy.start()
+        while True:
+            delay = retry.backoff()
+            if delay is None:
+                raise error
+            self.logger.warning(f"{error}, retry {retry.attempt} in {delay:.2f}s")
+            time.sleep(delay)
+            try:
+                return call()
+            except StreamTimeoutError as e:
+                error = e
+
+    async def _aretry_stalled(
+        self, error: StreamTimeoutError, call: Callable, timeouts: Timeouts
+    ):
+        """Async version of :meth:`_retry_stalled`; ``call`` returns an awaitable."""
+        if not timeouts.retry_stalled:
+            raise error
+        retry = self.retry_policy.start()
+        while True:
+            delay = retry.backoff()
+            if delay is None:
+                raise error
+            self.logger.warning(f"{error}, retry {retry.attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            try:
+                return await call()
+            except StreamTimeoutError as e:
+                error = e
+
+    def _retry_stalled_stream(
+        self, chunks: Iterator, reopen: Callable[[], Iterator], timeouts: Timeouts
+    ) -> Generator:
+        """
+        Yield from ``chunks``, reopening the stream when it stalls before its
+        first chunk, per :attr:`retry_policy`.
+        """
+        retry = None
+        while True:
+            delivered = False
+            try:
+                for chunk in chunks:
+                    delivered = True
+                    yield chunk
+                return
+            except StreamTimeoutError as e:
+                if delivered or not timeouts.retry_stalled:
+                    raise
+                retry = retry or self.retry_policy.start()
+                delay = retry.backoff()
+                if delay is None:
+                    raise
+                self.logger.warning(f"{e}, retry {retry.attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                chunks = reopen()
+
+    async def _aretry_stalled_stream(
+        self,
+        chunks: AsyncIterator,
+        reopen: Callable,
+        timeouts: Timeouts,
+    ) -> AsyncGenerator:
+        """Async version of :meth:`_retry_stalled_stream`; ``reopen`` is awaited."""
+        retry = None
+        while True:
+            delivered = False
+            try:
+                async for chunk in chunks:
+                    delivered = True
+                    yield chunk
+                return
+            except StreamTimeoutError as e:
+                if delivered or not timeouts.retry_stalled:
+                    raise
+                retry = retry or self.retry_policy.start()
+                delay = retry.backoff()
+                if delay is None:
+                    raise
+                self.logger.warning(f"{e}, retry {retry.attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                chunks = await reopen()
+
+    def _open_attempt(
+        self, send: Callable, attempt: HedgeAttempt, lock: threading.Lock
+    ) -> None:
+        # Send one attempt of a hedged request and read its first event
+        attempt.started = time.monotonic()
+        try:
+            response = send()
+            with lock:
+                attempt.response = response
+                lost = attempt.lost
+            if lost:
+                return
+            events = self._iter_events(response)
+            first = next(events, None)
+            attempt.latency = time.monotonic() - attempt.started
+            attempt.events = (
+                events if first is None else itertools.chain([first], events)
+            )
+        except Exception as e:
+            attempt.error = e
+
+    def _hedged(
+        self, send: Callable, policy: HedgePolicy
+    ) -> Tuple[requests.Response, Iterator[bytes]]:
+        """
+        Send a request through ``send`` and, when its first event is slower
+        than ``policy`` allows, a duplicate. Both attempts run on the hedge
+        threads, so the caller returns with the first one to answer even if
+        the other has not got its headers yet. The other is closed, or
+        released from its thread once it gets them.
+        """
+        delay = policy.start()
+        lock = threading.Lock()
+        # Set once an attempt won or the primary failed
+        settled = threading.Event()
+        winner: List[HedgeAttempt] = []
+        primary, hedge = HedgeAttempt(), HedgeAttempt()
+
+        def run(attempt: HedgeAttempt, other: HedgeAttempt) -> None:
+            self._open_attempt(send, attempt, lock)
+            with lock:
+                won = attempt.error is None and not attempt.lost and not winner
+                if won:
+                    winner.append(attempt)
+                    other.lost = True
+                loser = other.response if won else None
+            if won or attempt is primary:
+                settled.set()
+            if won:
+                if loser is not None:
+                    # Losing the race says nothing about the API's health
+                    self._settle_call(loser, None)
+                    abort_response(loser)
+            elif attempt.response is not None:
+                self._release_response(attempt.response)
+
+        futures = [self._hedge_pool.submit(run, primary, hedge)]
+        if not settled.wait(delay) and policy.try_hedge():
+            self.logger.debug("First event late, sending a hedged request")
+            futures.append(self._hedge_pool.submit(run, hedge, primary))
+        settled.wait()
+        if not winner:
+            # The primary failed, the duplicate may still answer
+            futures[-1].result()
+        if not winner:
+            raise primary.error
+        attempt = winner[0]
+        policy.record(attempt.latency, hedge_won=attempt is hedge)
+        return attempt.response, attempt.events
+
+    async def _aopen_attempt(
+        self, send: Callable, attempt: HedgeAttempt
+    ) -> HedgeAttempt:
+        attempt.started = time.monotonic()
+        response = await send()
+        attempt.response = response
+        try:
+            events = self._aiter_events(response)
+            try:
+                first = await events.__anext__()
+            except StopAsyncIteration:
+                first = None
+        except BaseException:
+            self._release_response(response, drop=True)
+            raise
+        attempt.latency = time.monotonic() - attempt.started
+        attempt.events = aprepend(first, events)
+        return attempt
+
+    async def _ahedged(
+        self, send: Callable, policy: HedgePolicy
+    ) -> Tuple[aiohttp.ClientResponse, AsyncIterator[bytes]]:
+        """Async version of :meth:`_hedged`, racing two tasks."""
+        delay = policy.start()
+        primary = asyncio.ensure_future(self._aopen_attempt(send, HedgeAttempt()))
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and policy.try_hedge():
+                self.logger.debug("First event late, sending a hedged request")
+                tasks.append(
+                    asyncio.ensure_future(self._aopen_attempt(send, HedgeAttempt()))
+                )
+            pending = set(tasks)
+            while winner is None and pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next(
+                    (t for t in tasks if t in done and t.exception() is None), None
+                )
+            if winner is None:
+                return primary.result()
+            attempt = winner.result()
+            policy.record(attempt.latency, hedge_won=winner is not primary)
+            return attempt.response, attempt.events
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    # Closes the connection of the slower attempt
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    self._release_response(task.result().response, drop=True)
+
+    @staticmethod
+    def _credential_headers(headers: dict, credential: Credential) -> dict:
         return {
-            "Content-Type": "application/json",
-            "Authorization": self.auth.get_token(),
-            "Cookie": self.auth.get_cookie(),
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-            "Host": "chat.qwen.ai",
-            "Origin": "https://chat.qwen.ai",
+            **headers,
+            "Authorization": credential.authorization,
+            "Cookie": credential.cookie,
         }
 
+    def _post(
+        self,
+        endpoint: str,
+        payload: Union[dict, bytes],
+        headers: Optional[dict] = None,
+        hold_stream: bool = False,
+        timeouts: Optional[Timeouts] = None,
+        model: Optional[str] = None,
+    ) -> requests.Response:
+        """
+        POST to the API, waiting on :attr:`rate_limiter` and retrying per
+        :attr:`retry_policy`.
+
+        The body is always streamed so that only failures before the first
+        response byte are retried. Non-2xx answers that are not retried raise
+        ``RateLimitError`` (429) or ``QwenAPIError``. With ``hold_stream`` the
+        response occupies a stream slot and is watched for ``timeouts`` (the
+        client's by default) until :meth:`_release_response`. With a
+        :attr:`circuit_breaker`, every attempt is gated by the circuit of
+        ``endpoint`` and ``model``.
+        """
+        data = payload if isinstance(payload, bytes) else json_codec.dumps(payload)
+        headers = headers or self._build_headers()
+        timeouts = timeouts or self.timeouts
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.check(endpoint, model)
+        if hold_stream:
+            self.rate_limiter.acquire_stream()
+        try:
+            response, started, call = self._send(
+                endpoint, data, headers, timeouts, model
+            )
+        except BaseException:
+            if hold_stream:
+                self.rate_limiter.release_stream()
+            raise
+        self._track_call(response, call, hold_stream)
+        if hold_stream:
+            self._on_release(response, self.rate_limiter.release_stream)
+            self._watch(response, watch_response(response, timeouts, started))
+        return response
+
+    def _send(
+        self,
+        endpoint: str,
+        data: bytes,
+        headers: dict,
+        timeouts: Timeouts,
+        model: Optional[str] = None,
+    ) -> Tuple[requests.Response, float, Optional[BreakerCall]]:
+        breaker = self.circuit_breaker
+        retry = self.retry_policy.start()
+        while True:
+            call = breaker.begin(endpoint, model) if breaker is not None else None
+            try:
+                self.rate_limiter.acquire()
+                credential = self.auth.acquire()
+            except BaseException:
+                if call is not None:
+                    call.abandon()
+                raise
+            try:
+                self.auth.limiter(credential).acquire()
+                started = time.monotonic()
+                if call is not None:
+                    call.start()
+                response = self.session.post(
+                    url=self.base_url + endpoint,
+                    headers=self._credential_headers(headers, credential),
+                    data=data,
+                    timeout=timeouts.requests_timeout(),
+                    stream=True,
+                )
+            except BaseException as e:
+                self.auth.release(credential)
+                if not isinstance(e, SYNC_RETRYABLE_ERRORS):
+                    if call is not None:
+                        call.abandon()
+                    raise
+                if call is not None:
+                    call.fail()
+                self.auth.report(credential, None)
+                delay = retry.backoff()
+                if delay is None:
+                    raise
+                self.logger.warning(
+                    f"Request failed ({e}), retry {retry.attempt} in {delay:.2f}s"
+                )
+                time.sleep(delay)
+                continue
+
+            retry_after = parse_retry_after(response.headers)
+            self.auth.report(credential, response.status_code, retry_after)
+            if response.ok:
+                self._on_release(response, self.auth.release, credential)
+                return response, started, call
+            self.auth.release(credential)
+            if call is not None:
+                if response.status_code >= 500:
+                    call.fail()
+                else:
+                    call.abandon()
+            if response.status_code in self.retry_policy.retry_statuses:
+                delay = retry.backoff(retry_after)
+                if delay is not None:
+                    self.logger.warning(
+                        f"API returned {response.status_code}, "
+                        f"retry {retry.attempt} in {delay:.2f}s"
+                    )
+                    response.close()
+                    time.sleep(delay)
+                    continue
+            try:
+                error_text = response.text
+            finally:
+                response.close()
+            self._raise_for_status(response.status_code, error_text)
+
+    async def _apost(
+        self,
+        endpoint: str,
+        payload: Union[dict, bytes],
+        headers: Optional[dict] = None,
+        hold_stream: bool = False,
+        model: Optional[str] = None,
+        timeouts: Optional[Timeouts] = None,
+    ) -> aiohttp.ClientResponse:
+        """
+        Async version of :meth:`_post`. When a ``model`` is given and the
+        client has a :attr:`concurrency_limiter`, the request also waits for
+        a concurrency slot of that model and feeds its outcome back.
+        """
+        data = payload if isinstance(payload, bytes) else json_codec.dumps(payload)
+        headers = headers or self._build_headers()
+        timeouts = timeouts or self.timeouts
+        limiter = self.concurrency_limiter if model is not None else None
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.check(endpoint, model)
+        if hold_stream:
+            await self.rate_limiter.aacquire_stream()
+        try:
+            if limiter is not None:
+                await limiter.acquire(model)
+            try:
+                response, started, call = await self._asend(
+                    endpoint, data, headers, timeouts, model
+                )
+            except BaseException:
+                if limiter is not None:
+                    limiter.release(model)
+                raise
+        except BaseException:
+            if hold_stream:
+                self.rate_limiter.release_stream()
+            raise
+        self._track_call(response, call, hold_stream)
+        if hold_stream:
+            self._on_release(response, self.rate_limiter.release_stream)
+            self._watch(response, awatch_response(response, timeouts, started))
+        if limiter is not None:
+            self._on_release(response, limiter.release, model)
+        return response
+
+    async def _asend(
+        self,
+        endpoint: str,
+        data: bytes,
+        headers: dict,
+        timeouts: Timeouts,
+        model: Optional[str] = None,
+    ) -> Tuple[aiohttp.ClientResponse, float, Optional[BreakerCall]]:
+        limiter = self.concurrency_limiter if model is not None else None
+        breaker = self.circuit_breaker
+        retry = self.retry_policy.start()
+        while True:
+            call = breaker.begin(endpoint, model) if breaker is not None else None
+            try:
+                await self.rate_limiter.aacquire()
+                credential = self.auth.acquire()
+            except BaseException:
+                if call is not None:
+                    call.abandon()
+                raise
+            started = time.monotonic()
+            try:
+                await self.auth.limiter(credential).aacquire()
+                if call is not None:
+                    call.start()
+                response = await self._async_pool.get().post(
+                    url=self.base_url + endpoint,
+                    headers=self._credential_headers(headers, credential),
+                    data=data,
+                    timeout=timeouts.aiohttp_timeout(),
+                )
+            except BaseException as e:
+                self.auth.release(credential)
+                if not isinstance(e, ASYNC_RETRYABLE_ERRORS):
+                    if call is not None:
+                        call.abandon()
+                    raise
+                if call is not None:
+                    call.fail()
+                self.auth.report(credential, None)
+                if limiter is not None:
+                    limiter.record(model, started)
+                delay = retry.backoff()
+                if delay is None:
+                    raise
+                self.logger.warning(
+                    f"Request failed ({e}), retry {retry.attempt} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            if limiter is not None:
+                if response.ok:
+                    limiter.record(model, started, time.monotonic() - started)
+                elif response.status == 429 or response.status >= 500:
+                    limiter.record(model, started, rate_limited=response.status == 429)
+            retry_after = parse_retry_after(response.headers)
+            self.auth.report(credential, response.status, retry_after)
+            if response.ok:
+                self._on_release(response, self.auth.release, credential)
+                return response, started, call
+            self.auth.release(credential)
+            if call is not None:
+                if response.status >= 500:
+                    call.fail()
+                else:
+                    call.abandon()
+            if response.status in self.retry_policy.retry_statuses:
+                delay = retry.backoff(retry_after)
+                if delay is not None:
+                    self.logger.warning(
+                        f"API returned {response.status}, "
+                        f"retry {retry.attempt} in {delay:.2f}s"
+                    )
+                    response.release()
+                    await asyncio.sleep(delay)
+                    continue
+            try:
+                error_text = await response.text()
+            finally:
+                response.release()
+            self._raise_for_status(response.status, error_text)
+
     def _build_payload(
         self,
         messages: List[ChatMessage],
         temperature: float,
         model: str,
         max_tokens: Optional[int],
+        validate: bool = True,
     ) -> dict:
-        validated_messages = []
-
-        for msg in messages:
-            if isinstance(msg, dict):
-                try:
-                    validated_msg = ChatMessage(**msg)
-                except ValidationError as e:
-                    raise QwenAPIError(f"Error validating message: {e}")
-            else:
-                validated_msg = msg
-
-            if validated_msg.role == "system":
-                if (
-                    validated_msg.web_development
-                    and validated_msg.content
-                    and WEB_DEVELOPMENT_PROMPT not in validated_msg.content
-                ):
-                    updated_content = (
-                        f"{validated_msg.content}\n\n{WEB_DEVELOPMENT_PROMPT}"
-                    )
-                    validated_msg = ChatMessage(
-                        **{**validated_msg.model_dump(), "content": updated_content}
-                    )
-
-            validated_messages.append(
-                {
-                    "role": (
-                        MessageRole.FUNCTION
-                        if validated_msg.role == MessageRole.TOOL
-                        else (
-                            validated_msg.role
-                            if validated_msg.role == MessageRole.SYSTEM
-                            else MessageRole.USER
-                        )
-                    ),
-                    "content": (
-                        validated_msg.blocks[0].text
-                        if len(validated_msg.blocks) == 1
-                        and validated_msg.blocks[0].block_type == "text"
-                        else [
-                            (
-                                {"type": "text", "text": block.text}
-                                if block.block_type == "text"
-                                else (
-                                    {"type": "image", "image": str(block.url)}
-                                    if block.block_type == "image"
-                                    else {"type": block.block_type}
-                                )
-                            )
-                            for block in validated_msg.blocks
-                        ]
-                    ),
-                    "chat_type": (
-                        "artifacts"
-                        if getattr(validated_msg, "web_development", False)
-                        else (
-                            "search"
-                            if getattr(validated_msg, "web_search", False)
-                            else "t2t"
-                        )
-                    ),
-                    "feature_config": {
-                        "thinking_enabled": getattr(validated_msg, "thinking", False),
-                        "thinking_budget": getattr(validated_msg, "thinking_budget", 0),
-                        "output_schema": getattr(validated_msg, "output_schema", None),
-                    },
-                    "extra": {},
-                }
-            )
+        if validate:
+            validated_messages = [message_to_wire(msg) for msg in messages]
+        else:
+            # Trusted dicts are mapped straight to the wire format
+            validated_messages = [
+                dict_to_wire(msg) if isinstance(msg, dict) else message_to_wire(msg)
+                for msg in messages
+            ]
 
+        # Same field order as Conversation.encode_payload, so that identical
+        # requests encode to identical bytes
         return {
-            "stream": True,
-            "model": model,
-            "incremental_output": True,
+            **build_payload_head(model, temperature, max_tokens),
             "messages": validated_messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
         }
 
-    def _process_response(self, response: requests.Response) -> ChatResponse:
+    def _process_response(
+        self, response: requests.Response, events: Optional[Iterator[bytes]] = None
+    ) -> ChatResponse:
         from .core.types.chat import Choice, Message, Extra
 
-        client = SSEClient(cast(Any, response))
         extra = None
         text = ""
-        for event in client.events():
-            if event.data:
-                try:
-                    data = json.loads(event.data)
-                    if data["choices"][0]["delta"].get("role") == "function":
-                        extra_data = data["choices"][0]["delta"].get("extra")
-                        if extra_data:
-                            extra = Extra(**extra_data)
-                    text += data["choices"][0]["delta"].get("content")
-                except json.JSONDecodeError:
-                    continue
+        try:
+            for payload in events or self._iter_events(response):
+                if payload:
+                    try:
+                        event = SSE_EVENT_ADAPTER.validate_json(payload)
+                        delta = event["choices"][0]["delta"]
+                        if delta.get("role") == "function":
+                            extra_data = delta.get("extra")
+                            if extra_data:
+                                extra = Extra(**extra_data)
+                        text += delta.get("content", "")
+                    except ValidationError:
+                        continue
+        finally:
+            self._release_response(response)
         message = Message(role="assistant", content=text)
         choice = Choice(message=message, extra=extra)
         return ChatResponse(choices=choice)
@@ -153,20 +865,23 @@ class Qwen:
     ) -> ChatResponse | QwenAPIError:
         from .core.types.chat import Choice, Message, Extra
 
-        client = SSEClient(cast(Any, response))
         extra = None
         text = ""
-        for event in client.events():
-            if event.data:
-                try:
-                    data = json.loads(event.data)
-                    if data["choices"][0]["delta"].get("role") == "function":
-                        extra_data = data["choices"][0]["delta"].get("extra")
-                        if extra_data:
-                            extra = Extra(**extra_data)
-                    text += data["choices"][0]["delta"].get("content")
-                except json.JSONDecodeError:
-                    continue
+        try:
+            for payload in self._iter_events(response):
+                if payload:
+                    try:
+                        event = SSE_EVENT_ADAPTER.validate_json(payload)
+                        delta = event["choices"][0]["delta"]
+                        if delta.get("role") == "function":
+                            extra_data = delta.get("extra")
+                            if extra_data:
+                                extra = Extra(**extra_data)
+                        text += delta.get("content", "")
+                    except ValidationError:
+                        continue
+        finally:
+            self._release_response(response)
         try:
             self.logger.debug(f"text: {text}")
             parse_json = json.loads(text)
@@ -186,31 +901,35 @@ class Qwen:
             return QwenAPIError(f"Error decoding JSON response: {e}")
 
     async def _process_aresponse(
-        self, response: aiohttp.ClientResponse, session: aiohttp.ClientSession
+        self,
+        response: aiohttp.ClientResponse,
+        events: Optional[AsyncIterator[bytes]] = None,
     ) -> ChatResponse:
         from .core.types.chat import Choice, Message, Extra
 
-        # Track this session
-        self._active_sessions.append(session)
+        # Track this response
+        if response is not None:
+            self._active_responses.append(response)
 
         try:
             extra = None
             text = ""
-            async for line in response.content:
+            async for payload in events or self._aiter_events(response):
                 # Check if cancelled
                 if self._is_cancelled:
                     self.logger.info("Async response processing cancelled")
                     break
 
-                if line.startswith(b"data:"):
+                if payload:
                     try:
-                        data = json.loads(line[5:].decode())
-                        if data["choices"][0]["delta"].get("role") == "function":
-                            extra_data = data["choices"][0]["delta"].get("extra")
+                        event = SSE_EVENT_ADAPTER.validate_json(payload)
+                        delta = event["choices"][0]["delta"]
+                        if delta.get("role") == "function":
+                            extra_data = delta.get("extra")
                             if extra_data:
                                 extra = Extra(**extra_data)
-                        text += data["choices"][0]["delta"].get("content")
-                    except json.JSONDecodeError:
+                        text += delta.get("content", "")
+                    except ValidationError:
                         continue
             message = Message(role="assistant", content=text)
             choice = Choice(message=message, extra=extra)
@@ -220,37 +939,37 @@ class Qwen:
             raise
 
         finally:
-            # Remove from active sessions
-            if session in self._active_sessions:
-                self._active_sessions.remove(session)
-            await session.close()
+            # Stop tracking and release the connection
+            self._release_response(response)
 
     async def _process_aresponse_tool(
-        self, response: aiohttp.ClientResponse, session: aiohttp.ClientSession
+        self, response: aiohttp.ClientResponse
     ) -> ChatResponse | QwenAPIError:
         from .core.types.chat import Choice, Message, Extra
 
-        # Track this session
-        self._active_sessions.append(session)
+        # Track this response
+        if response is not None:
+            self._active_responses.append(response)
 
         try:
             extra = None
             text = ""
-            async for line in response.content:
+            async for payload in self._aiter_events(response):
                 # Check if cancelled
                 if self._is_cancelled:
                     self.logger.info("Async tool response processing cancelled")
                     break
 
-                if line.startswith(b"data:"):
+                if payload:
                     try:
-                        data = json.loads(line[5:].decode())
-                        if data["choices"][0]["delta"].get("role") == "function":
-                            extra_data = data["choices"][0]["delta"].get("extra")
+                        event = SSE_EVENT_ADAPTER.validate_json(payload)
+                        delta = event["choices"][0]["delta"]
+                        if delta.get("role") == "function":
+                            extra_data = delta.get("extra")
                             if extra_data:
                                 extra = Extra(**extra_data)
-                        text += data["choices"][0]["delta"].get("content")
-                    except json.JSONDecodeError:
+                        text += delta.get("content", "")
+                    except ValidationError:
                         continue
             try:
                 self.logger.debug(f"text: {text}")
@@ -278,78 +997,106 @@ class Qwen:
             raise
 
         finally:
-            # Remove from active sessions
-            if session in self._active_sessions:
-                self._active_sessions.remove(session)
-            await session.close()
+            # Stop tracking and release the connection
+            self._release_response(response)
 
     def _process_stream(
-        self, response: requests.Response
-    ) -> Generator[ChatResponseStream, None, None]:
-        client = SSEClient(cast(Any, response))
+        self,
+        response: Optional[requests.Response],
+        accumulator: Optional[TextAccumulator] = None,
+        events: Optional[Iterator[bytes]] = None,
+    ) -> Generator[Union[ChatResponseStream, StreamChunk], None, None]:
+        """
+        Yield stream chunks. Without an accumulator every chunk is a
+        ``ChatResponseStream`` carrying the cumulative text; with one
+        (``stream_mode="delta"``) chunks are ``StreamChunk`` objects carrying
+        only the new text, and the full text is collected by the accumulator.
+        ``events`` replaces the payloads of ``response``, which is ``None``
+        for coalesced requests.
+        """
         content = ""
-        for event in client.events():
-            # Check if cancelled
-            if self._is_cancelled:
-                self.logger.info("Stream processing cancelled")
-                break
-
-            if event.data:
-                try:
-                    data = json.loads(event.data)
-                    content += data["choices"][0]["delta"].get("content")
-                    yield ChatResponseStream(
-                        **data,
-                        message=ChatMessage(
-                            role=data["choices"][0]["delta"].get("role"),
-                            content=content,
-                        ),
-                    )
-                except json.JSONDecodeError:
-                    continue
+        if response is not None:
+            self._active_responses.append(response)
+        try:
+            for payload in events or self._iter_events(response):
+                # Check if cancelled
+                if self._is_cancelled:
+                    self.logger.info("Stream processing cancelled")
+                    break
+
+                if payload:
+                    try:
+                        if accumulator is not None:
+                            delta = SSE_EVENT_ADAPTER.validate_json(payload)[
+                                "choices"
+                            ][0]["delta"]
+                            text = delta.get("content")
+                            accumulator.append(text)
+                            yield StreamChunk(delta.get("role"), text, payload=payload)
+                            continue
+                        event = STREAM_EVENT_ADAPTER.validate_json(payload)
+                        content += event.choices[0].delta.content
+                        yield ChatResponseStream.model_construct(
+                            choices=event.choices,
+                            usage=event.usage,
+                            message=ChatMessage(
+                                role=event.choices[0].delta.role,
+                                content=content,
+                            ),
+                        )
+                    except ValidationError:
+                        continue
+        finally:
+            # Hand the connection back to the pool
+            self._release_response(response)
 
     async def _process_astream(
-        self, response: aiohttp.ClientResponse, session: aiohttp.ClientSession
-    ) -> AsyncGenerator[ChatResponseStream, None]:
-        # Track this session
-        self._active_sessions.append(session)
+        self,
+        response: Optional[aiohttp.ClientResponse],
+        accumulator: Optional[TextAccumulator] = None,
+        events: Optional[AsyncIterator[bytes]] = None,
+    ) -> AsyncGenerator[Union[ChatResponseStream, StreamChunk], None]:
+        """Async version of :meth:`_process_stream`."""
+        # Track this response
+        if response is not None:
+            self._active_responses.append(response)
 
         try:
             content = ""
-            import asyncio
-
-            # Create a task for reading content
-            async def read_content():
-                async for line in response.content:
-                    if self._is_cancelled:
-                        break
-                    yield line
 
             # Process stream with cancellation support
-            async for line in read_content():
-                # Check if cancelled before processing each line
+            async for payload in events or self._aiter_events(response):
+                # Check if cancelled before processing each event
                 if self._is_cancelled:
                     self.logger.info("Async stream processing cancelled")
                     break
 
-                if line.startswith(b"data:"):
+                if payload:
                     try:
-                        data = json.loads(line[5:].decode())
-                        content += data["choices"][0]["delta"].get("content")
-
                         # Yield the chunk
-                        yield ChatResponseStream(
-                            **data,
-                            message=ChatMessage(
-                                role=data["choices"][0]["delta"].get("role"),
-                                content=content,
-                            ),
-                        )
+                        if accumulator is not None:
+                            delta = SSE_EVENT_ADAPTER.validate_json(payload)[
+                                "choices"
+                            ][0]["delta"]
+                            text = delta.get("content")
+                            accumulator.append(text)
+                            yield StreamChunk(delta.get("role"), text, payload=payload)
+                        else:
+                            event = STREAM_EVENT_ADAPTER.validate_json(payload)
+                            content += event.choices[0].delta.content
+                            yield ChatResponseStream.model_construct(
+                                choices=event.choices,
+                                usage=event.usage,
+                                message=ChatMessage(
+                                    role=event.choices[0].delta.role,
+                                    content=content,
+                                ),
+                            )
 
                         # Give other coroutines a chance to run and check cancellation
                         await asyncio.sleep(0)
 
-                    except json.JSONDecodeError:
+                    except ValidationError:
                         continue
 
         except (aiohttp.ClientError, asyncio.CancelledError) as e:
@@ -362,14 +1109,9 @@ class Qwen:
                 raise
 
         finally:
-            self.logger.debug(f"Closing session")
-            # Remove from active sessions
-            if session in self._active_sessions:
-                self._active_sessions.remove(session)
-
-            # Force close the session immediately when cancelled
-            if not session.closed:
-                await session.close()
+            self.logger.debug(f"Releasing response")
+            # Drop the connection when cancelled, otherwise reuse it
+            self._release_response(response, drop=self._is_cancelled)
 
     def cancel(self):
         """
@@ -378,49 +1120,47 @@ class Qwen:
         self._is_cancelled = True
         self.logger.info("Cancelling all active requests...")
 
-        # Close all active sessions aggressively
-        for session in self._active_sessions[
+        # Close all active responses aggressively; the pooled sessions stay
+        # open so the client remains usable afterwards.
+        for response in self._active_responses[
             :
         ]:  # Copy list to avoid modification during iteration
             try:
-                if hasattr(session, "close") and not session.closed:
-                    # For aiohttp sessions, close immediately
-                    if hasattr(session, "_connector") and session._connector:
-                        # Force close connector immediately
-                        session._connector._ssl_shutdown_timeout = 0.1
-                        session._connector.close()
-
-                    # Also try to close the session itself
-                    import asyncio
-
-                    if asyncio.iscoroutinefunction(session.close):
-                        # Schedule session closure if we're in an async context
-                        try:
-                            loop = asyncio.get_running_loop()
-                            task = loop.create_task(session.close())
-                            # Cancel the task immediately to force close
-                            task.cancel()
-                        except RuntimeError:
-                            # No running loop, can't close async session synchronously
-                            pass
-
-                    self.logger.debug(f"Session {id(session)} marked for closure")
+                self._release_response(response, drop=True)
+                self.logger.debug(f"Response {id(response)} closed")
             except Exception as e:
                 # Suppress SSL shutdown timeout warnings as they're expected during cancellation
                 if "SSL shutdown timed out" not in str(
                     e
                 ) and "CancelledError" not in str(e):
-                    self.logger.warning(f"Error closing session {id(session)}: {e}")
+                    self.logger.warning(f"Error closing response {id(response)}: {e}")
 
-        # Clear the sessions list
-        self._active_sessions.clear()
-        self.logger.info("All active sessions cancelled")
+        # Clear the responses list
+        self._active_responses.clear()
+        self.logger.info("All active requests cancelled")
 
     def close(self):
         """
         Close the client and clean up resources.
         """
         self.cancel()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self._sync_pool.close()
+        self._async_pool.close()
+        self.oss_pool.close()
+        self.logger.info("Qwen client closed")
+
+    async def aclose(self):
+        """
+        Close the client and await the shared async session.
+        """
+        self.cancel()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self._sync_pool.close()
+        self.oss_pool.close()
+        await self._async_pool.aclose()
         self.logger.info("Qwen client closed")
 
     def __enter__(self):
@@ -430,3 +1170,11 @@ class Qwen:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit."""
         self.close()
+
+    async def __aenter__(self):
+        """Async context manager entry."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit."""
+        await self.aclose()
@@ -1,21 +1,314 @@
 import os
-from typing import Optional
+import threading
+import time
+import json
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Union
 from dotenv import load_dotenv
-from qwen_api.core.exceptions import AuthError
+from qwen_api.core.exceptions import AuthError, QwenAPIError
+from qwen_api.core.rate_limiter import RateLimiter
+from qwen_api.core.shared_state import CREDENTIAL_FIELDS, SQLiteSharedState
+
+AUTH_ERROR_STATUSES = frozenset({401, 403})
+
+
+@dataclass(frozen=True)
+class Credential:
+    """
+    One account of a credential pool.
+
+    Attributes:
+        token: auth token, without the ``Bearer`` prefix.
+        cookie: cookie string of the account.
+        name: label used in stats and logs (default: ``credential-<index>``).
+        weight: relative share of the traffic the account should take.
+        requests_per_second: rate limit of the account, ``None`` for none.
+    """
+
+    token: Optional[str]
+    cookie: Optional[str]
+    name: Optional[str] = None
+    weight: float = 1.0
+    requests_per_second: Optional[float] = None
+
+    @property
+    def authorization(self) -> str:
+        return f"Bearer {self.token}"
+
+
+@dataclass
+class CredentialStats:
+    name: str
+    requests: int
+    in_flight: int
+    successes: int
+    rate_limited: int
+    auth_errors: int
+    errors: int
+    # Moving average of successful attempts, between 0 and 1
+    health: float
+    # Seconds until the credential is picked again, 0 when available
+    cooldown: float
+
+
+class _CredentialState:
+    __slots__ = (
+        "credential",
+        "limiter",
+        "in_flight",
+        "requests",
+        "successes",
+        "rate_limited",
+        "auth_errors",
+        "errors",
+        "health",
+        "cooldown_until",
+        "strikes",
+    )
+
+    def __init__(
+        self, credential: Credential, shared_state: Optional[SQLiteSharedState] = None
+    ):
+        self.credential = credential
+        self.limiter = RateLimiter(
+            requests_per_second=credential.requests_per_second,
+            shared_state=shared_state,
+            shared_key=self.key,
+        )
+        self.in_flight = 0
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.auth_errors = 0
+        self.errors = 0
+        self.health = 1.0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+
+    @property
+    def key(self) -> str:
+        return f"credential:{self.credential.name}"
+
+    def fields(self) -> Dict[str, float]:
+        return {field: getattr(self, field) for field in CREDENTIAL_FIELDS}
+
+    def load(self, fields: Dict[str, float]) -> None:
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+    def score(self, now: float) -> tuple:
+        # Available before cooling down, idle rate limits before busy ones,
+        # then the least load relative to weight and health, then the fewest
+        # requests so idle credentials are used in weighted rotation
+        capacity = self.credential.weight * max(self.health, 0.05)
+        return (
+            max(0.0, self.cooldown_until - now),
+            self.limiter.wait_time > 0,
+            self.in_flight / capacity,
+            self.requests / capacity,
+        )
 
 
 class AuthManager:
-    def __init__(self, token: Optional[str] = None, cookie: Optional[str] = None):
+    """
+    Credentials of the client: a single token/cookie pair from the arguments
+    or ``.env``, or a pool of accounts.
+
+    With a pool every attempt goes to the available credential with the
+    least load relative to its weight and health. Credentials are put on
+    cooldown after a 429 (``cooldown`` seconds, doubling on consecutive
+    429s) or an auth error (``auth_cooldown`` seconds).
+
+    Args:
+        token: auth token, defaults to ``QWEN_AUTH_TOKEN``.
+        cookie: cookie string, defaults to ``QWEN_COOKIE``.
+        credentials: pool of ``Credential`` objects or dicts of their fields.
+        credentials_file: JSON file holding a list of credential objects,
+            defaults to ``QWEN_CREDENTIALS_FILE``.
+        cooldown: base cooldown after a 429, in seconds.
+        auth_cooldown: cooldown after a 401 or 403, in seconds.
+        shared_state: share load, cooldowns, counters and per-credential rate
+            limits with other processes using the same store.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        cookie: Optional[str] = None,
+        credentials: Optional[Iterable[Union[Credential, dict]]] = None,
+        credentials_file: Optional[str] = None,
+        cooldown: float = 30.0,
+        auth_cooldown: float = 300.0,
+        shared_state: Optional[SQLiteSharedState] = None,
+    ):
         load_dotenv()
-        self._token = token or os.getenv("QWEN_AUTH_TOKEN")
-        self._cookie = cookie or os.getenv("QWEN_COOKIE")
+        self.cooldown = cooldown
+        self.auth_cooldown = auth_cooldown
+        self.shared_state = shared_state
+        credentials_file = credentials_file or os.getenv("QWEN_CREDENTIALS_FILE")
+        if credentials is None and credentials_file and not (token or cookie):
+            credentials = self._load_file(credentials_file)
+        if credentials is None:
+            credentials = [
+                Credential(
+                    token=token or os.getenv("QWEN_AUTH_TOKEN"),
+                    cookie=cookie or os.getenv("QWEN_COOKIE"),
+                )
+            ]
+
+        self._lock = threading.Lock()
+        self._states: Dict[str, _CredentialState] = {}
+        for index, credential in enumerate(credentials):
+            if isinstance(credential, dict):
+                credential = Credential(**credential)
+            if credential.name is None:
+                credential = Credential(
+                    token=credential.token,
+                    cookie=credential.cookie,
+                    name=f"credential-{index}",
+                    weight=credential.weight,
+                    requests_per_second=credential.requests_per_second,
+                )
+            if credential.weight <= 0:
+                raise QwenAPIError(f"Credential {credential.name} needs a positive weight")
+            if credential.name in self._states:
+                raise QwenAPIError(f"Duplicate credential name: {credential.name}")
+            self._states[credential.name] = _CredentialState(credential, shared_state)
+        if not self._states:
+            raise AuthError("Credential pool is empty")
+        self._default = next(iter(self._states.values())).credential
+
+    @staticmethod
+    def _load_file(path: str) -> List[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            raise AuthError(f"Cannot read credentials file {path}: {e}")
+        if isinstance(data, dict):
+            data = data.get("credentials", [])
+        if not isinstance(data, list):
+            raise AuthError(f"Credentials file {path} must hold a list")
+        return data
+
+    @contextmanager
+    def _synced(self, states: List[_CredentialState]):
+        # Hold the lock and, when shared, load the states from the store and
+        # write them back afterwards. The store is locked first, like in
+        # RateLimiter, to avoid lock cycles.
+        if self.shared_state is None:
+            with self._lock:
+                yield
+            return
+        with self.shared_state.transaction() as tx, self._lock:
+            in_flight = tx.slot_counts(state.key for state in states)
+            for state in states:
+                fields = tx.load_credential(state.credential.name)
+                if fields is not None:
+                    state.load(fields)
+                state.in_flight = in_flight[state.key]
+            yield
+            for state in states:
+                tx.store_credential(state.credential.name, state.fields())
+                delta = state.in_flight - in_flight[state.key]
+                if delta:
+                    tx.add_slot(state.key, delta)
+
+    @property
+    def credentials(self) -> List[Credential]:
+        return [state.credential for state in self._states.values()]
 
     def get_token(self) -> str:
-        if not self._token:
+        if not self._default.token:
             raise AuthError("Authentication token not found in .env")
-        return f"Bearer {self._token}"
+        return self._default.authorization
 
     def get_cookie(self) -> str:
-        if not self._cookie:
+        if not self._default.cookie:
             raise AuthError("Cookie not found in .env")
-        return self._cookie
+        return self._default.cookie
+
+    def acquire(self) -> Credential:
+        """
+        Pick the credential for the next attempt and count it as in flight.
+        Pair with :meth:`release`.
+        """
+        with self._synced(list(self._states.values())):
+            now = time.monotonic()
+            state = min(self._states.values(), key=lambda s: s.score(now))
+            state.in_flight += 1
+            state.requests += 1
+        credential = state.credential
+        if not credential.token:
+            self.release(credential)
+            raise AuthError(f"Authentication token not found for {credential.name}")
+        if not credential.cookie:
+            self.release(credential)
+            raise AuthError(f"Cookie not found for {credential.name}")
+        return credential
+
+    def limiter(self, credential: Credential) -> RateLimiter:
+        """Rate limiter of ``credential``."""
+        return self._states[credential.name].limiter
+
+    def release(self, credential: Credential) -> None:
+        """Mark a request sent with ``credential`` as finished."""
+        state = self._states[credential.name]
+        with self._synced([state]):
+            state.in_flight -= 1
+
+    def report(
+        self,
+        credential: Credential,
+        status: Optional[int],
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        Record the outcome of an attempt: its HTTP status, or ``None`` when
+        no response was received.
+        """
+        state = self._states[credential.name]
+        with self._synced([state]):
+            ok = status is not None and status < 400
+            state.health = 0.9 * state.health + (0.1 if ok else 0.0)
+            if ok:
+                state.successes += 1
+                state.strikes = 0
+                return
+            if status == 429:
+                state.rate_limited += 1
+                state.strikes += 1
+                cooldown = self.cooldown * 2 ** min(state.strikes - 1, 6)
+                if retry_after is not None:
+                    cooldown = max(cooldown, retry_after)
+            elif status in AUTH_ERROR_STATUSES:
+                state.auth_errors += 1
+                cooldown = self.auth_cooldown
+            else:
+                state.errors += 1
+                return
+            # A single credential has nothing to fall back to
+            if len(self._states) > 1:
+                state.cooldown_until = max(
+                    state.cooldown_until, time.monotonic() + cooldown
+                )
+
+    def stats(self) -> List[CredentialStats]:
+        """Per-credential counters, in pool order."""
+        with self._synced(list(self._states.values())):
+            now = time.monotonic()
+            return [
+                CredentialStats(
+                    name=name,
+                    requests=state.requests,
+                    in_flight=state.in_flight,
+                    successes=state.successes,
+                    rate_limited=state.rate_limited,
+                    auth_errors=state.auth_errors,
+                    errors=state.errors,
+                    health=state.health,
+                    cooldown=max(0.0, state.cooldown_until - now),
+                )
+                for name, state in self._states.items()
+            ]
@@ -0,0 +1,333 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Literal, Optional, Tuple
+
+from .exceptions import CircuitOpenError
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+logger = logging.getLogger("qwen_api")
+
+
+@dataclass(frozen=True)
+class BreakerTransition:
+    """A change of state of the circuit of one endpoint and model."""
+
+    timestamp: float
+    endpoint: str
+    model: Optional[str]
+    previous: BreakerState
+    state: BreakerState
+    reason: str
+
+
+class _Circuit:
+    __slots__ = (
+        "state",
+        "outcomes",
+        "failures",
+        "slow",
+        "opened_at",
+        "probes",
+        "probe_successes",
+    )
+
+    def __init__(self, window: int):
+        self.state: BreakerState = "closed"
+        # (failed, slow) of the most recent calls
+        self.outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self.failures = 0
+        self.slow = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+
+    def reset(self) -> None:
+        self.outcomes.clear()
+        self.failures = 0
+        self.slow = 0
+        self.probes = 0
+        self.probe_successes = 0
+
+
+class BreakerCall:
+    """
+    Outcome of one attempt let through by :meth:`CircuitBreaker.begin`.
+    Only the first of :meth:`succeed`, :meth:`fail` and :meth:`abandon`
+    counts.
+    """
+
+    __slots__ = ("_breaker", "key", "probe", "started", "done")
+
+    def __init__(
+        self, breaker: "CircuitBreaker", key: Tuple[str, Optional[str]], probe: bool
+    ):
+        self._breaker = breaker
+        self.key = key
+        # Let through to test a half-open circuit
+        self.probe = probe
+        self.started = time.monotonic()
+        self.done = False
+
+    def start(self) -> None:
+        """Start measuring the latency, once the request is actually sent."""
+        self.started = time.monotonic()
+
+    def succeed(self) -> None:
+        self._breaker._finish(self, False, time.monotonic() - self.started)
+
+    def fail(self) -> None:
+        self._breaker._finish(self, True, None)
+
+    def abandon(self) -> None:
+        """Release the call without an outcome, e.g. after a 429 or a 4xx."""
+        self._breaker._finish(self, None, None)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker tracked per endpoint and model, failing fast while the
+    API is down instead of piling up requests that wait for their timeout.
+
+    A closed circuit lets every call through and opens once at least
+    ``min_calls`` of the last ``window`` calls were seen and the share of
+    failures reaches ``failure_rate``, or the share of calls slower than
+    ``slow_call_duration`` reaches ``slow_call_rate``. An open circuit
+    rejects calls with ``CircuitOpenError`` for ``open_duration`` seconds
+    and then turns half-open: ``half_open_probes`` calls are let through,
+    and the circuit closes when they all succeed or opens again as soon as
+    one fails or is slow.
+
+    Failures are 5xx answers, connection errors and timeouts. Latency is
+    measured until the first event of chat responses and until the response
+    headers otherwise.
+
+    Args:
+        failure_rate: share of failed calls that opens the circuit.
+        slow_call_duration: seconds after which a call counts as slow,
+            ``None`` to ignore latency.
+        slow_call_rate: share of slow calls that opens the circuit.
+        window: number of recent calls evaluated.
+        min_calls: calls needed in the window before the circuit may open.
+        open_duration: seconds calls are rejected before probing.
+        half_open_probes: calls let through while half-open.
+        on_state_change: hook called with a ``BreakerTransition`` on every
+            state change; more can be added with :meth:`add_listener`.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        slow_call_duration: Optional[float] = None,
+        slow_call_rate: float = 0.8,
+        window: int = 20,
+        min_calls: int = 10,
+        open_duration: float = 30.0,
+        half_open_probes: int = 3,
+        on_state_change: Optional[Callable[[BreakerTransition], None]] = None,
+    ):
+        if not 0 < failure_rate <= 1 or not 0 < slow_call_rate <= 1:
+            raise ValueError("failure_rate and slow_call_rate must be in (0, 1]")
+        if min_calls < 1 or window < min_calls:
+            raise ValueError("min_calls must be positive and at most window")
+        if half_open_probes < 1:
+            raise ValueError("half_open_probes must be at least 1")
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._circuits: Dict[Tuple[str, Optional[str]], _Circuit] = {}
+        self._listeners: List[Callable[[BreakerTransition], None]] = []
+        if on_state_change is not None:
+            self._listeners.append(on_state_change)
+
+    def add_listener(self, callback: Callable[[BreakerTransition], None]) -> None:
+        """Call ``callback`` with a ``BreakerTransition`` on every state change."""
+        self._listeners.append(callback)
+
+    def _circuit(self, key: Tuple[str, Optional[str]]) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit(self.window)
+        return circuit
+
+    def _transition(
+        self,
+        key: Tuple[str, Optional[str]],
+        circuit: _Circuit,
+        state: BreakerState,
+        reason: str,
+    ) -> BreakerTransition:
+        transition = BreakerTransition(
+            timestamp=time.time(),
+            endpoint=key[0],
+            model=key[1],
+            previous=circuit.state,
+            state=state,
+            reason=reason,
+        )
+        circuit.state = state
+        circuit.reset()
+        if state == "open":
+            circuit.opened_at = time.monotonic()
+        return transition
+
+    def _notify(self, transition: Optional[BreakerTransition]) -> None:
+        # Called outside the lock so that hooks may use the breaker
+        if transition is None:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(transition)
+            except Exception as e:
+                logger.error(f"Circuit breaker hook failed: {e}")
+
+    def _rejection(
+        self, key: Tuple[str, Optional[str]], circuit: _Circuit
+    ) -> Optional[CircuitOpenError]:
+        # The error a call would get now, None if it may go through
+        endpoint, model = key
+        name = endpoint + (f" ({model})" if model else "")
+        if circuit.state == "open":
+            remaining = circuit.opened_at + self.open_duration - time.monotonic()
+            if remaining > 0:
+                return CircuitOpenError(
+                    f"Circuit open for {name}, retry in {remaining:.1f}s",
+                    endpoint=endpoint,
+                    model=model,
+                    retry_after=remaining,
+                )
+        elif circuit.state == "half_open":
+            if circuit.probes + circuit.probe_successes >= self.half_open_probes:
+                return CircuitOpenError(
+                    f"Circuit half-open for {name}, probes in flight",
+                    endpoint=endpoint,
+                    model=model,
+                    retry_after=0.0,
+                )
+        return None
+
+    def check(self, endpoint: str, model: Optional[str] = None) -> None:
+        """
+        Raise ``CircuitOpenError`` if a call would be rejected now, without
+        letting one through. Lets callers fail before queueing for a slot.
+        """
+        with self._lock:
+            circuit = self._circuits.get((endpoint, model))
+            error = (
+                None if circuit is None else self._rejection((endpoint, model), circuit)
+            )
+        if error is not None:
+            raise error
+
+    def begin(self, endpoint: str, model: Optional[str] = None) -> BreakerCall:
+        """
+        Let a call through or raise ``CircuitOpenError``. Report its outcome
+        on the returned ``BreakerCall``.
+        """
+        key = (endpoint, model)
+        transition = None
+        with self._lock:
+            circuit = self._circuit(key)
+            error = self._rejection(key, circuit)
+            if error is not None:
+                raise error
+            if circuit.state == "open":
+                transition = self._transition(
+                    key, circuit, "half_open", "open duration elapsed"
+                )
+            if circuit.state == "half_open":
+                circuit.probes += 1
+                call = BreakerCall(self, key, probe=True)
+            else:
+                call = BreakerCall(self, key, probe=False)
+        self._notify(transition)
+        return call
+
+    def _finish(
+        self, call: BreakerCall, failed: Optional[bool], latency: Optional[float]
+    ) -> None:
+        transition = None
+        with self._lock:
+            if call.done:
+                return
+            call.done = True
+            circuit = self._circuit(call.key)
+            slow = (
+                latency is not None
+                and self.slow_call_duration is not None
+                and latency >= self.slow_call_duration
+            )
+            if call.probe:
+                if circuit.state != "half_open":
+                    # Probe of an earlier half-open period
+                    pass
+                elif failed or slow:
+                    transition = self._transition(
+                        call.key,
+                        circuit,
+                        "open",
+                        "probe failed" if failed else f"probe took {latency:.2f}s",
+                    )
+                else:
+                    circuit.probes -= 1
+                    if failed is False:
+                        circuit.probe_successes += 1
+                    if circuit.probe_successes >= self.half_open_probes:
+                        transition = self._transition(
+                            call.key, circuit, "closed", "probes succeeded"
+                        )
+            elif circuit.state == "closed" and failed is not None:
+                # Calls that started before a state change are not counted
+                outcomes = circuit.outcomes
+                if len(outcomes) == outcomes.maxlen:
+                    old_failed, old_slow = outcomes[0]
+                    circuit.failures -= old_failed
+                    circuit.slow -= old_slow
+                outcomes.append((failed, slow))
+                circuit.failures += failed
+                circuit.slow += slow
+                calls = len(outcomes)
+                if calls >= self.min_calls:
+                    if circuit.failures / calls >= self.failure_rate:
+                        transition = self._transition(
+                            call.key,
+                            circuit,
+                            "open",
+                            f"{circuit.failures} of {calls} calls failed",
+                        )
+                    elif circuit.slow / calls >= self.slow_call_rate:
+                        transition = self._transition(
+                            call.key,
+                            circuit,
+                            "open",
+                            f"{circuit.slow} of {calls} calls slower than "
+                            f"{self.slow_call_duration}s",
+                        )
+        self._notify(transition)
+
+    def state(self, endpoint: str, model: Optional[str] = None) -> BreakerState:
+        with self._lock:
+            circuit = self._circuits.get((endpoint, model))
+            return "closed" if circuit is None else circuit.state
+
+    def stats(self) -> Dict[str, dict]:
+        """State and window counts per ``endpoint`` or ``endpoint (model)``."""
+        with self._lock:
+            return {
+                endpoint + (f" ({model})" if model else ""): {
+                    "state": circuit.state,
+                    "calls": len(circuit.outcomes),
+                    "failures": circuit.failures,
+                    "slow": circuit.slow,
+                }
+                for (endpoint, model), circuit in self._circuits.items()
+            }
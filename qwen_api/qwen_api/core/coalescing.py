@@ -0,0 +1,285 @@
+"""
+Singleflight coalescing of identical requests.
+
+Requests with the same encoded payload that are in flight at the same time
+share one upstream response. Its SSE payloads are buffered and replayed to
+every caller, so streaming and non-streaming callers can share a flight and
+late joiners still see the whole answer. A flight is forgotten as soon as
+its response ends; identical requests made afterwards go upstream again.
+"""
+
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .exceptions import QwenAPIError
+
+# Opens the upstream request, returning the response and its SSE payloads
+Opener = Callable[[], Tuple[Any, Iterator[bytes]]]
+AsyncOpener = Callable[[], Awaitable[Tuple[Any, AsyncIterator[bytes]]]]
+
+
+@dataclass
+class CoalescerStats:
+    # Flights sent upstream
+    flights: int
+    # Requests served by a flight another request had started
+    coalesced: int
+    in_flight: int
+
+
+class _Flight:
+    __slots__ = (
+        "key",
+        "events",
+        "opened",
+        "done",
+        "error",
+        "subscribers",
+        "response",
+        "source",
+        "pumping",
+        "condition",
+        "changed",
+        "task",
+    )
+
+    def __init__(self, key: tuple, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.key = key
+        self.events: List[bytes] = []
+        self.opened = False
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.response = None
+        self.source = None
+        # Sync flights are read by whichever subscriber needs the next event
+        self.pumping = False
+        self.condition = threading.Condition() if loop is None else None
+        # Async flights are read by their own task
+        self.changed = asyncio.Event() if loop is not None else None
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        if self.condition is not None:
+            with self.condition:
+                self.condition.notify_all()
+        else:
+            # Waiters hold the previous event
+            changed, self.changed = self.changed, asyncio.Event()
+            changed.set()
+
+
+class Coalescer:
+    """
+    Registry of the requests in flight of one client.
+
+    Args:
+        release: called with the upstream response and whether to drop its
+            connection once a flight ends or is abandoned by every caller.
+    """
+
+    def __init__(self, release: Callable[[Any, bool], None]):
+        self._release = release
+        self._lock = threading.Lock()
+        self._flights: Dict[tuple, _Flight] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    def _join(self, key: tuple, loop=None) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(key, loop)
+                self._started += 1
+            else:
+                self._coalesced += 1
+            flight.subscribers += 1
+            return flight, leader
+
+    def _leave(self, flight: _Flight) -> None:
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers == 0 and not flight.done
+        if not abandoned:
+            return
+        if flight.task is not None:
+            flight.task.cancel()
+        else:
+            self._finish(flight, QwenAPIError("Coalesced request abandoned"))
+
+    def _finish(self, flight: _Flight, error: Optional[BaseException]) -> None:
+        with self._lock:
+            if flight.done:
+                return
+            flight.done = True
+            flight.error = error
+            flight.pumping = False
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if flight.response is not None:
+            self._release(flight.response, error is not None)
+        flight.notify()
+
+    # Sync
+
+    def subscribe(self, key: str, open: Opener) -> Iterator[bytes]:
+        """
+        Payloads of the flight of ``key``, opening it with ``open`` when no
+        identical request is in flight. Errors of opening are raised here.
+        """
+        flight, leader = self._join(("sync", key))
+        subscription = _Subscription(self, flight)
+        if leader:
+            try:
+                flight.response, flight.source = open()
+            except BaseException as e:
+                self._finish(flight, e)
+                subscription.close()
+                raise
+            with flight.condition:
+                flight.opened = True
+                flight.condition.notify_all()
+        else:
+            with flight.condition:
+                while not flight.opened and not flight.done:
+                    flight.condition.wait()
+            if not flight.opened:
+                subscription.close()
+                raise flight.error
+        return subscription
+
+    def _pump(self, flight: _Flight) -> None:
+        # Read one payload from upstream, called without the condition held
+        try:
+            payload = next(flight.source)
+        except StopIteration:
+            self._finish(flight, None)
+        except BaseException as e:
+            self._finish(flight, e)
+        else:
+            with flight.condition:
+                flight.events.append(payload)
+                flight.pumping = False
+                flight.condition.notify_all()
+
+    # Async
+
+    async def asubscribe(self, key: str, open: AsyncOpener) -> AsyncIterator[bytes]:
+        """Async version of :meth:`subscribe`; flights are read by a task."""
+        loop = asyncio.get_running_loop()
+        flight, leader = self._join(("async", id(loop), key), loop)
+        subscription = _AsyncSubscription(self, flight)
+        if leader:
+            flight.task = loop.create_task(self._apump(flight, open))
+        try:
+            while not flight.opened and not flight.done:
+                await flight.changed.wait()
+        except BaseException:
+            subscription.close()
+            raise
+        if not flight.opened:
+            subscription.close()
+            raise flight.error
+        return subscription
+
+    async def _apump(self, flight: _Flight, open: AsyncOpener) -> None:
+        try:
+            flight.response, source = await open()
+            flight.opened = True
+            flight.notify()
+            async for payload in source:
+                flight.events.append(payload)
+                flight.notify()
+        except asyncio.CancelledError:
+            self._finish(flight, QwenAPIError("Coalesced request abandoned"))
+        except BaseException as e:
+            self._finish(flight, e)
+        else:
+            self._finish(flight, None)
+
+    def stats(self) -> CoalescerStats:
+        with self._lock:
+            return CoalescerStats(
+                flights=self._started,
+                coalesced=self._coalesced,
+                in_flight=len(self._flights),
+            )
+
+
+class _Subscription:
+    """Iterator over the payloads of a sync flight."""
+
+    def __init__(self, coalescer: Coalescer, flight: _Flight):
+        self._coalescer = coalescer
+        self._flight = flight
+        self._index = 0
+        # Leave the flight even if the iterator is dropped without being
+        # exhausted or even started
+        self._finalizer = weakref.finalize(self, coalescer._leave, flight)
+
+    def __iter__(self) -> "_Subscription":
+        return self
+
+    def __next__(self) -> bytes:
+        flight = self._flight
+        while True:
+            with flight.condition:
+                while True:
+                    if self._index < len(flight.events):
+                        self._index += 1
+                        return flight.events[self._index - 1]
+                    if flight.done:
+                        self.close()
+                        if flight.error is not None:
+                            raise flight.error
+                        raise StopIteration
+                    if not flight.pumping:
+                        flight.pumping = True
+                        break
+                    flight.condition.wait()
+            self._coalescer._pump(flight)
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+class _AsyncSubscription:
+    """Async iterator over the payloads of an async flight."""
+
+    def __init__(self, coalescer: Coalescer, flight: _Flight):
+        self._flight = flight
+        self._index = 0
+        self._finalizer = weakref.finalize(self, coalescer._leave, flight)
+
+    def __aiter__(self) -> "_AsyncSubscription":
+        return self
+
+    async def __anext__(self) -> bytes:
+        flight = self._flight
+        while True:
+            if self._index < len(flight.events):
+                self._index += 1
+                return flight.events[self._index - 1]
+            if flight.done:
+                self.close()
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await flight.changed.wait()
+
+    def close(self) -> None:
+        self._finalizer()
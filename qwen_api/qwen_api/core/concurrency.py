@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Literal, Optional
+
+from .rate_limiter import _Waiter
+
+
+@dataclass(frozen=True)
+class LimitDecision:
+    """A change of the concurrency limit of one model."""
+
+    timestamp: float
+    model: str
+    action: Literal["increase", "decrease"]
+    previous: int
+    limit: int
+    reason: str
+
+
+class _ModelState:
+    __slots__ = ("limit", "in_flight", "waiters", "latency", "samples", "last_decrease")
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters: Deque[_Waiter] = deque()
+        # Exponentially weighted moving average of healthy latencies
+        self.latency: Optional[float] = None
+        self.samples = 0
+        self.last_decrease = 0.0
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) limit on the number of
+    requests in flight, tracked separately per model.
+
+    Every healthy response grows the limit by ``increase / limit`` (about
+    ``increase`` per round of ``limit`` requests). A 429, a failed attempt or
+    a latency above ``latency_tolerance`` times the moving average cuts it by
+    ``decrease_factor``. Failures of requests started before the last cut are
+    ignored so that one overload does not collapse the limit repeatedly.
+
+    Args:
+        initial_limit: starting limit of every model.
+        min_limit: lower bound of the limit.
+        max_limit: upper bound of the limit.
+        increase: additive increase per round of requests.
+        decrease_factor: multiplier applied on overload.
+        latency_tolerance: latency spike threshold relative to the average.
+        warmup: healthy samples needed before latency spikes are detected.
+        history: number of decisions kept for :attr:`decisions`.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        warmup: int = 5,
+        history: int = 100,
+    ):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("Limits must satisfy 1 <= min <= initial <= max")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.warmup = warmup
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelState] = {}
+        self._decisions: Deque[LimitDecision] = deque(maxlen=history)
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState(float(self.initial_limit))
+        return state
+
+    def _wake(self, state: _ModelState) -> None:
+        # Hand free slots to queued callers; caller holds the lock
+        while state.waiters and state.in_flight < int(state.limit):
+            waiter = state.waiters.popleft()
+            waiter.granted = True
+            if waiter.wake():
+                state.in_flight += 1
+
+    async def acquire(self, model: str) -> None:
+        """Wait until a request for ``model`` may be sent."""
+        with self._lock:
+            state = self._state(model)
+            if state.in_flight < int(state.limit) and not state.waiters:
+                state.in_flight += 1
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            state.waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    state.waiters.remove(waiter)
+            if granted:
+                self.release(model)
+            raise
+
+    def release(self, model: str) -> None:
+        """Mark a request for ``model`` as finished."""
+        with self._lock:
+            state = self._state(model)
+            state.in_flight -= 1
+            self._wake(state)
+
+    def record(
+        self,
+        model: str,
+        started: float,
+        latency: Optional[float] = None,
+        rate_limited: bool = False,
+    ) -> None:
+        """
+        Feed the outcome of one attempt started at ``started``
+        (``time.monotonic()``): a ``latency`` for a healthy response, or no
+        latency for a failure.
+        """
+        with self._lock:
+            state = self._state(model)
+            previous = int(state.limit)
+            reason = None
+            if latency is None:
+                reason = "rate limited" if rate_limited else "request failed"
+            elif (
+                state.samples >= self.warmup
+                and latency > self.latency_tolerance * state.latency
+            ):
+                reason = (
+                    f"latency {latency:.2f}s above {self.latency_tolerance}x "
+                    f"average {state.latency:.2f}s"
+                )
+
+            if reason is not None:
+                if started < state.last_decrease:
+                    return
+                state.limit = max(self.min_limit, state.limit * self.decrease_factor)
+                state.last_decrease = time.monotonic()
+                self._decide(model, "decrease", previous, int(state.limit), reason)
+                return
+
+            state.latency = (
+                latency
+                if state.latency is None
+                else 0.9 * state.latency + 0.1 * latency
+            )
+            state.samples += 1
+            state.limit = min(self.max_limit, state.limit + self.increase / state.limit)
+            if int(state.limit) != previous:
+                self._decide(model, "increase", previous, int(state.limit), "healthy")
+                self._wake(state)
+
+    def _decide(self, model, action, previous, limit, reason) -> None:
+        self._decisions.append(
+            LimitDecision(time.time(), model, action, previous, limit, reason)
+        )
+
+    def limit(self, model: str) -> int:
+        """Current concurrency limit of ``model``."""
+        with self._lock:
+            return int(self._state(model).limit)
+
+    def in_flight(self, model: str) -> int:
+        """Requests for ``model`` currently in flight."""
+        with self._lock:
+            return self._state(model).in_flight
+
+    def decisions(self, model: Optional[str] = None) -> List[LimitDecision]:
+        """Recent limit changes, oldest first, optionally for one model."""
+        with self._lock:
+            return [d for d in self._decisions if model is None or d.model == model]
+
+    def stats(self) -> Dict[str, dict]:
+        """Limit, in-flight and queued requests and average latency per model."""
+        with self._lock:
+            return {
+                model: {
+                    "limit": int(state.limit),
+                    "in_flight": state.in_flight,
+                    "queued": len(state.waiters),
+                    "latency": state.latency,
+                }
+                for model, state in self._models.items()
+            }
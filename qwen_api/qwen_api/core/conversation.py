@@ -0,0 +1,108 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union, overload
+from pydantic import ValidationError
+from . import json_codec
+from .exceptions import QwenAPIError
+from .types.chat import ChatMessage
+from .wire import build_payload_head, message_to_wire
+
+MessageLike = Union[ChatMessage, Dict[str, Any]]
+
+
+class Conversation:
+    """
+    Chat history that can be passed as ``messages`` to ``create``/``acreate``.
+
+    Each message is validated, converted to the wire format and JSON-encoded
+    once, when it is added. Assembling a payload only joins the cached
+    fragments, so a new turn costs the encoding of that turn instead of the
+    whole history.
+
+    Example:
+        >>> conversation = Conversation([ChatMessage(role="user", content="Hi")])
+        >>> response = client.chat.create(messages=conversation)
+        >>> conversation.append(response.choices.message.model_dump())
+    """
+
+    def __init__(self, messages: Optional[Iterable[MessageLike]] = None):
+        self._messages: List[ChatMessage] = []
+        self._fragments: List[bytes] = []
+        # Comma-separated fragments, grown in place as turns are appended
+        self._joined = bytearray()
+        if messages:
+            self.extend(messages)
+
+    @staticmethod
+    def _validate(message: MessageLike) -> ChatMessage:
+        if isinstance(message, ChatMessage):
+            return message
+        if not isinstance(message, dict):
+            raise QwenAPIError(f"Invalid message type: {type(message).__name__}")
+        try:
+            return ChatMessage(**message)
+        except ValidationError as e:
+            raise QwenAPIError(f"Error validating message: {e}")
+
+    def append(self, message: MessageLike) -> None:
+        message = self._validate(message)
+        fragment = json_codec.dumps(message_to_wire(message))
+        if self._fragments:
+            self._joined += b","
+        self._joined += fragment
+        self._messages.append(message)
+        self._fragments.append(fragment)
+
+    def extend(self, messages: Iterable[MessageLike]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def clear(self) -> None:
+        self._messages.clear()
+        self._fragments.clear()
+        self._joined.clear()
+
+    @property
+    def messages(self) -> List[ChatMessage]:
+        return list(self._messages)
+
+    def encode_payload(
+        self,
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        pending: Iterable[MessageLike] = (),
+    ) -> bytes:
+        """
+        Assemble the encoded request payload.
+
+        Args:
+            pending: extra messages appended to this request only, without
+                being stored in the conversation.
+        """
+        head = json_codec.dumps(build_payload_head(model, temperature, max_tokens))
+        body = bytearray(head[:-1])
+        body += b',"messages":['
+        body += self._joined
+        for message in pending:
+            if body[-1] != 91:  # "["
+                body += b","
+            body += json_codec.dumps(message_to_wire(self._validate(message)))
+        body += b"]}"
+        return bytes(body)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        return iter(self._messages)
+
+    @overload
+    def __getitem__(self, index: int) -> ChatMessage: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[ChatMessage]: ...
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def __repr__(self) -> str:
+        return f"Conversation(messages={len(self._messages)})"
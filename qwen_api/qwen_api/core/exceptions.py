@@ -11,4 +11,24 @@ class AuthError(QwenAPIError):
 class RateLimitError(QwenAPIError):
     """Error rate limiting"""
     def __init__(self, message: str = "Rate limit exceeded"):
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+class StreamTimeoutError(QwenAPIError):
+    """Error timeout koneksi, token pertama, jeda stream, atau batas total"""
+    def __init__(self, message: str = "Stream timed out", phase: str = "total"):
+        super().__init__(message)
+        self.phase = phase
+
+class CircuitOpenError(QwenAPIError):
+    """Error circuit breaker terbuka, request ditolak tanpa dikirim"""
+    def __init__(
+        self,
+        message: str = "Circuit breaker is open",
+        endpoint: str = None,
+        model: str = None,
+        retry_after: float = None,
+    ):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.model = model
+        self.retry_after = retry_after
@@ -0,0 +1,125 @@
+"""
+Request hedging: when a non-streaming request is slower than usual to send
+its first event, a duplicate is sent and the first one to answer is used.
+"""
+
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Optional
+
+from .retry import RetryBudget
+
+
+@dataclass
+class HedgeStats:
+    requests: int
+    # Requests for which a duplicate was sent
+    hedged: int
+    # Hedged requests answered first by the duplicate
+    hedge_wins: int
+    # Seconds a request currently waits for its first event before hedging
+    delay: float
+
+
+@dataclass
+class HedgePolicy:
+    """
+    Hedging settings of non-streaming chat completions.
+
+    Attributes:
+        percentile: send a duplicate when the first event takes longer than
+            this percentile of the recently observed first-event latencies.
+        initial_delay: delay used until ``min_samples`` latencies are known,
+            in seconds.
+        min_delay: lower bound of the delay, in seconds.
+        max_extra_load: duplicates allowed as a fraction of the requests, so
+            hedging never adds more than this share of extra load.
+        min_samples: latencies needed before ``percentile`` is used.
+        history: number of recent latencies kept.
+    """
+
+    percentile: float = 95.0
+    initial_delay: float = 2.0
+    min_delay: float = 0.05
+    max_extra_load: float = 0.05
+    min_samples: int = 20
+    history: int = 200
+
+    def __post_init__(self):
+        if not 0 < self.percentile <= 100:
+            raise ValueError("percentile must be in (0, 100]")
+        if self.max_extra_load < 0:
+            raise ValueError("max_extra_load must not be negative")
+        # Tokens come only from requests, never from elapsed time
+        self._budget = RetryBudget(self.max_extra_load, 0.0)
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=self.history)
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def start(self) -> float:
+        """Count a request and return the seconds to wait before hedging it."""
+        self._budget.deposit()
+        with self._lock:
+            self._requests += 1
+        return self.delay()
+
+    def delay(self) -> float:
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return max(self.min_delay, self.initial_delay)
+            latencies = sorted(self._latencies)
+        # Nearest-rank percentile
+        rank = max(0, math.ceil(self.percentile / 100 * len(latencies)) - 1)
+        return max(self.min_delay, latencies[rank])
+
+    def try_hedge(self) -> bool:
+        """Take budget for one duplicate, ``False`` if none is left."""
+        if not self._budget.withdraw():
+            return False
+        with self._lock:
+            self._hedged += 1
+        return True
+
+    def record(self, latency: float, hedge_won: bool = False) -> None:
+        """Record the first-event latency of the attempt that answered."""
+        with self._lock:
+            self._latencies.append(latency)
+            if hedge_won:
+                self._hedge_wins += 1
+
+    def stats(self) -> HedgeStats:
+        delay = self.delay()
+        with self._lock:
+            return HedgeStats(
+                requests=self._requests,
+                hedged=self._hedged,
+                hedge_wins=self._hedge_wins,
+                delay=delay,
+            )
+
+
+class HedgeAttempt:
+    """One of the requests racing for a hedged call."""
+
+    __slots__ = ("response", "events", "started", "latency", "error", "lost")
+
+    def __init__(self):
+        self.response = None
+        # Event payloads, starting with the first one
+        self.events = None
+        self.started: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.lost = False
+
+
+async def aprepend(first: Optional[bytes], events: AsyncIterator[bytes]):
+    """Async iterator yielding ``first`` (unless ``None``) and then ``events``."""
+    if first is not None:
+        yield first
+    async for payload in events:
+        yield payload
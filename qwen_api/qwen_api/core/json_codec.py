@@ -0,0 +1,118 @@
+"""
+JSON codec used for request payloads and SSE events.
+
+``orjson`` or ``msgspec`` are used when installed (``pip install
+qwen-api[speedups]``), otherwise the standard library. Payloads are always
+encoded straight to compact UTF-8 ``bytes`` and decoding accepts ``bytes``,
+``bytearray``, ``memoryview`` or ``str``.
+"""
+
+import json
+from typing import Any, Callable, Optional, Tuple, Type
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+backend: str = "json"
+JSON_DECODE_ERRORS: Tuple[Type[Exception], ...] = (json.JSONDecodeError,)
+
+_dumps: Callable[[Any], bytes]
+_loads: Callable[[Any], Any]
+
+
+def _default(obj: Any) -> Any:
+    # Pydantic models and other rich objects that may end up in a payload
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _use_json() -> None:
+    global _dumps, _loads
+
+    encoder = json.JSONEncoder(
+        ensure_ascii=False, separators=(",", ":"), default=_default
+    )
+
+    def dumps(obj: Any) -> bytes:
+        return encoder.encode(obj).encode("utf-8")
+
+    def loads(data: Any) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    _dumps, _loads = dumps, loads
+
+
+def _use_orjson() -> None:
+    global _dumps, _loads
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default)
+
+    _dumps, _loads = dumps, orjson.loads
+
+
+def _use_msgspec() -> None:
+    global _dumps, _loads
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    decoder = msgspec.json.Decoder()
+    _dumps, _loads = encoder.encode, decoder.decode
+
+
+def use_backend(name: Optional[str] = None) -> str:
+    """
+    Select the JSON backend.
+
+    Args:
+        name (str, optional): one of ``"orjson"``, ``"msgspec"`` or ``"json"``.
+            When omitted the fastest installed backend is picked.
+
+    Returns:
+        The name of the backend now in use.
+    """
+    global backend, JSON_DECODE_ERRORS
+
+    candidates = BACKENDS if name is None else (name,)
+    for candidate in candidates:
+        if candidate not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {candidate}")
+        try:
+            if candidate == "orjson":
+                _use_orjson()
+                import orjson
+
+                errors: Tuple[Type[Exception], ...] = (orjson.JSONDecodeError,)
+            elif candidate == "msgspec":
+                _use_msgspec()
+                import msgspec
+
+                errors = (msgspec.DecodeError,)
+            else:
+                _use_json()
+                errors = (json.JSONDecodeError,)
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+        backend = candidate
+        # Stdlib errors stay catchable whatever backend is active
+        JSON_DECODE_ERRORS = tuple(dict.fromkeys(errors + (json.JSONDecodeError,)))
+        return backend
+    raise ValueError(f"JSON backend {name} is not available")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` to compact UTF-8 JSON bytes."""
+    return _dumps(obj)
+
+
+def loads(data: Any) -> Any:
+    """Deserialize JSON from bytes-like or str data."""
+    return _loads(data)
+
+
+use_backend()
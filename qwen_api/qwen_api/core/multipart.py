@@ -0,0 +1,227 @@
+"""
+Multipart uploads of large files to OSS.
+
+A single ``put_object`` of a file of hundreds of megabytes may outlast its
+timeout, and any error restarts it from the first byte. Above
+``MultipartPolicy.threshold`` an upload is split into parts sent by a
+bounded pool of threads, each part retried on its own. An
+``UploadCheckpoint`` records the upload (the ``getstsToken`` response, the
+multipart upload id and the finished parts) in a JSON file after every
+part, so that an interrupted upload of the same file resumes where it
+stopped instead of starting over.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional
+
+from .exceptions import QwenAPIError
+from .upload_cache import url_expiry
+from .upload_source import READ_CHUNK_SIZE, UploadSource
+
+logger = logging.getLogger("qwen_api")
+
+# Part limits of OSS multipart uploads
+MIN_PART_SIZE = 100 * 1024
+MAX_PARTS = 10_000
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(tempfile.gettempdir(), "qwen-api-uploads")
+
+
+@dataclass(frozen=True)
+class MultipartPolicy:
+    """
+    When and how uploads are split into parts.
+
+    Attributes:
+        threshold: uploads of at least this many bytes are sent in parts,
+            ``None`` to always send them with a single request.
+        part_size: bytes per part, raised for files that would need more
+            than 10,000 parts.
+        max_workers: parts uploaded at the same time. At most this many
+            parts, plus the one being read, are held in memory.
+        checkpoint_dir: directory of the checkpoint files that let an
+            interrupted upload resume, ``None`` to not keep any. Checkpoints
+            hold the short-lived upload credentials of their upload.
+        resume_margin: seconds before the file URL of a checkpoint expires
+            that it is no longer resumed.
+    """
+
+    threshold: Optional[int] = 64 * 1024 * 1024
+    part_size: int = 8 * 1024 * 1024
+    max_workers: int = 4
+    checkpoint_dir: Optional[str] = DEFAULT_CHECKPOINT_DIR
+    resume_margin: float = 300.0
+
+    def __post_init__(self):
+        if self.part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE}")
+        if self.max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+    def applies(self, size: int) -> bool:
+        return self.threshold is not None and size >= self.threshold
+
+    def part_size_for(self, size: int) -> int:
+        return max(self.part_size, math.ceil(size / MAX_PARTS))
+
+    def checkpoint(
+        self, source: UploadSource, digest: Optional[str] = None
+    ) -> "UploadCheckpoint":
+        """
+        Checkpoint of the upload of ``source``, resumed from its file when
+        an earlier upload of the same bytes was interrupted. Sources are
+        told apart by their fingerprint or, failing that, by ``digest``;
+        the uploads of sources with neither are not kept in a file.
+        """
+        part_size = self.part_size_for(source.size)
+        identity = source.fingerprint or digest
+        if self.checkpoint_dir is None or identity is None:
+            return UploadCheckpoint(None, source.size, part_size)
+        name = hashlib.blake2b(
+            f"{identity}:{source.filename}:{source.mime_type}".encode(),
+            digest_size=16,
+        ).hexdigest()
+        path = os.path.join(self.checkpoint_dir, f"{name}.json")
+        return UploadCheckpoint.load(path, source.size, part_size, self.resume_margin)
+
+
+class UploadCheckpoint:
+    """
+    Progress of one multipart upload.
+
+    Attributes:
+        path: JSON file the checkpoint is saved to, ``None`` to keep it in
+            memory only.
+        size: bytes of the upload.
+        part_size: bytes per part, the last part excepted.
+        upload: ``getstsToken`` response the upload goes to.
+        upload_id: id of the OSS multipart upload.
+        parts: ETags of the uploaded parts, by part number.
+    """
+
+    def __init__(self, path: Optional[str], size: int, part_size: int):
+        self.path = path
+        self.size = size
+        self.part_size = part_size
+        self.upload: Optional[dict] = None
+        self.upload_id: Optional[str] = None
+        self.parts: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls, path: str, size: int, part_size: int, margin: float = 0.0
+    ) -> "UploadCheckpoint":
+        checkpoint = cls(path, size, part_size)
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            upload = state["upload"]
+            upload_id = state["upload_id"]
+            parts = {int(n): etag for n, etag in state["parts"].items()}
+            expires = url_expiry(upload["file_url"])
+        except FileNotFoundError:
+            return checkpoint
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable upload checkpoint {path}: {e}")
+            checkpoint.remove()
+            return checkpoint
+        if (
+            state.get("size") != size
+            or state.get("part_size") != part_size
+            or (expires is not None and expires - margin <= time.time())
+        ):
+            checkpoint.remove()
+            return checkpoint
+        checkpoint.upload = upload
+        checkpoint.upload_id = upload_id
+        checkpoint.parts = parts
+        return checkpoint
+
+    @property
+    def part_count(self) -> int:
+        return max(1, math.ceil(self.size / self.part_size))
+
+    def part_range(self, number: int):
+        """Offset and length of part ``number``, counted from 1."""
+        offset = (number - 1) * self.part_size
+        return offset, min(self.part_size, self.size - offset)
+
+    def add_part(self, number: int, etag: str) -> None:
+        with self._lock:
+            self.parts[number] = etag
+            self._save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        if self.path is None or self.upload_id is None:
+            return
+        state = {
+            "size": self.size,
+            "part_size": self.part_size,
+            "upload": self.upload,
+            "upload_id": self.upload_id,
+            "parts": self.parts,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            # The credentials of the upload are in the file
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Upload checkpoint write failed: {e}")
+
+    def reset(self) -> None:
+        """Forget the upload, so that it starts over."""
+        with self._lock:
+            self.upload = None
+            self.upload_id = None
+            self.parts = {}
+        self.remove()
+
+    def remove(self) -> None:
+        if self.path is None:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Upload checkpoint removal failed: {e}")
+
+
+def read_exactly(reader: BinaryIO, size: int) -> bytes:
+    """The next ``size`` bytes of ``reader``."""
+    data = reader.read(size)
+    while len(data) < size:
+        more = reader.read(size - len(data))
+        if not more:
+            raise QwenAPIError("Upload source ended before its size")
+        data += more
+    return data
+
+
+def skip_bytes(reader: BinaryIO, size: int) -> None:
+    """Move ``reader`` ``size`` bytes forward, seeking when it can."""
+    if hasattr(reader, "seek"):
+        reader.seek(size, os.SEEK_CUR)
+        return
+    while size > 0:
+        chunk = reader.read(min(size, READ_CHUNK_SIZE))
+        if not chunk:
+            raise QwenAPIError("Upload source ended before its size")
+        size -= len(chunk)
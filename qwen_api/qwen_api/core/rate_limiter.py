@@ -0,0 +1,304 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Deque, Optional
+
+if TYPE_CHECKING:
+    from .shared_state import SQLiteSharedState
+
+
+@dataclass
+class RateLimiterStats:
+    requests_per_second: Optional[float]
+    max_concurrent_streams: Optional[int]
+    # Seconds a request issued now would wait for a token
+    wait_time: float
+    # Callers currently waiting for a token or a stream slot
+    queue_depth: int
+    active_streams: int
+    acquired: int
+    # Seconds spent waiting for tokens, summed over all callers
+    total_wait: float
+
+
+class _Waiter:
+    """A caller queued for a stream slot, either a thread or an asyncio task."""
+
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def wake(self) -> bool:
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        except RuntimeError:
+            # Event loop already closed
+            return False
+        return True
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """
+    Client-side token bucket limiting the request rate, plus a cap on the
+    number of responses streamed at the same time.
+
+    One instance can be shared by any number of threads, asyncio tasks and
+    ``Qwen`` clients. Tokens are reserved under a lock and waited for outside
+    of it, so callers are served in arrival order without busy waiting.
+
+    Args:
+        requests_per_second: sustained request rate, ``None`` for no limit.
+        burst: requests that may be sent at once after an idle period
+            (default: ``requests_per_second`` rounded up).
+        max_concurrent_streams: responses read concurrently, ``None`` for no
+            limit.
+        shared_state: keep the bucket and stream slots in a store shared with
+            other processes. Stats other than ``wait_time`` stay per process.
+        shared_key: name of this limiter in ``shared_state``.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_concurrent_streams: Optional[int] = None,
+        shared_state: Optional["SQLiteSharedState"] = None,
+        shared_key: str = "global",
+    ):
+        if requests_per_second is not None and requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive")
+        if max_concurrent_streams is not None and max_concurrent_streams < 1:
+            raise ValueError("max_concurrent_streams must be at least 1")
+        self.requests_per_second = requests_per_second
+        self.burst = burst or (
+            max(1, math.ceil(requests_per_second)) if requests_per_second else 0
+        )
+        self.max_concurrent_streams = max_concurrent_streams
+        self.shared_state = shared_state
+        self.shared_key = shared_key
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._waiting = 0
+        self._streams = 0
+        self._stream_waiters: Deque[_Waiter] = deque()
+        self._acquired = 0
+        self._total_wait = 0.0
+
+    # Request rate
+
+    @contextmanager
+    def _bucket(self):
+        # Hold the lock and, when shared, sync the bucket with the store. The
+        # store is locked first, like everywhere else, to avoid lock cycles.
+        if self.shared_state is None:
+            with self._lock:
+                yield
+            return
+        with self.shared_state.transaction() as tx, self._lock:
+            self._tokens, self._updated = tx.load_bucket(self.shared_key, self.burst)
+            yield
+            tx.store_bucket(self.shared_key, self._tokens, self._updated)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.requests_per_second
+        )
+        self._updated = now
+
+    def _reserve(self) -> float:
+        with self._bucket():
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            self._acquired += 1
+            if self._tokens >= 0:
+                return 0.0
+            wait = -self._tokens / self.requests_per_second
+            self._waiting += 1
+            self._total_wait += wait
+            return wait
+
+    def _done_waiting(self, refund: bool = False) -> None:
+        if not refund:
+            with self._lock:
+                self._waiting -= 1
+            return
+        with self._bucket():
+            self._waiting -= 1
+            self._tokens = min(self.burst, self._tokens + 1)
+            self._acquired -= 1
+
+    def acquire(self) -> float:
+        """Block until a request may be sent. Returns the seconds waited."""
+        if self.requests_per_second is None:
+            return 0.0
+        wait = self._reserve()
+        if wait:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def aacquire(self) -> float:
+        """Async version of :meth:`acquire`."""
+        if self.requests_per_second is None:
+            return 0.0
+        wait = self._reserve()
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Give the reserved token back to the callers behind us
+                self._done_waiting(refund=True)
+                raise
+            self._done_waiting()
+        return wait
+
+    # Concurrent streams
+
+    def _try_acquire_stream(self, waiter_loop=None) -> Optional[_Waiter]:
+        with self._lock:
+            if (
+                self._streams < self.max_concurrent_streams
+                and not self._stream_waiters
+            ):
+                self._streams += 1
+                return None
+            waiter = _Waiter(waiter_loop)
+            self._stream_waiters.append(waiter)
+            return waiter
+
+    def _try_shared_stream(self, interval: float) -> Optional[float]:
+        # Take a slot held in the shared store, or return the next interval
+        # to sleep before trying again
+        if self.shared_state.try_acquire_slot(
+            self.shared_key, self.max_concurrent_streams
+        ):
+            return None
+        return min(interval * 2, self.shared_state.poll_interval)
+
+    def _count_waiting(self, delta: int) -> None:
+        with self._lock:
+            self._waiting += delta
+
+    def acquire_stream(self) -> None:
+        """Block until a stream slot is free. Pair with :meth:`release_stream`."""
+        if self.max_concurrent_streams is None:
+            return
+        if self.shared_state is not None:
+            interval = self._try_shared_stream(0.0025)
+            if interval is not None:
+                self._count_waiting(1)
+                try:
+                    while interval is not None:
+                        time.sleep(interval)
+                        interval = self._try_shared_stream(interval)
+                finally:
+                    self._count_waiting(-1)
+            return
+        waiter = self._try_acquire_stream()
+        if waiter is not None:
+            waiter.event.wait()
+
+    async def aacquire_stream(self) -> None:
+        """Async version of :meth:`acquire_stream`."""
+        if self.max_concurrent_streams is None:
+            return
+        if self.shared_state is not None:
+            interval = self._try_shared_stream(0.0025)
+            if interval is not None:
+                self._count_waiting(1)
+                try:
+                    while interval is not None:
+                        await asyncio.sleep(interval)
+                        interval = self._try_shared_stream(interval)
+                finally:
+                    self._count_waiting(-1)
+            return
+        waiter = self._try_acquire_stream(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._stream_waiters.remove(waiter)
+            if granted:
+                self.release_stream()
+            raise
+
+    def release_stream(self) -> None:
+        """Free a stream slot, handing it to the oldest waiter if any."""
+        if self.max_concurrent_streams is None:
+            return
+        if self.shared_state is not None:
+            self.shared_state.release_slot(self.shared_key)
+            return
+        with self._lock:
+            while self._stream_waiters:
+                waiter = self._stream_waiters.popleft()
+                waiter.granted = True
+                if waiter.wake():
+                    return
+            self._streams -= 1
+
+    # Introspection
+
+    @property
+    def wait_time(self) -> float:
+        """Seconds a request issued now would wait for a token."""
+        if self.requests_per_second is None:
+            return 0.0
+        with self._bucket():
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.requests_per_second)
+
+    @property
+    def queue_depth(self) -> int:
+        """Callers currently waiting for a token or a stream slot."""
+        with self._lock:
+            return self._waiting + len(self._stream_waiters)
+
+    def _shared_streams(self) -> int:
+        with self.shared_state.transaction() as tx:
+            return tx.slot_counts([self.shared_key])[self.shared_key]
+
+    def stats(self) -> RateLimiterStats:
+        wait_time = self.wait_time
+        active_streams = (
+            self._shared_streams()
+            if self.shared_state is not None and self.max_concurrent_streams
+            else None
+        )
+        with self._lock:
+            return RateLimiterStats(
+                requests_per_second=self.requests_per_second,
+                max_concurrent_streams=self.max_concurrent_streams,
+                wait_time=wait_time,
+                queue_depth=self._waiting + len(self._stream_waiters),
+                active_streams=(
+                    self._streams if active_streams is None else active_streams
+                ),
+                acquired=self._acquired,
+                total_wait=self._total_wait,
+            )
@@ -0,0 +1,414 @@
+"""
+Cache of finished chat responses.
+
+A response is stored as the SSE payloads it was made of, keyed by the hash
+of the encoded request payload (model, temperature, max_tokens, messages and,
+for tool calls, the tools prompt). Replaying the payloads rebuilds the very
+same ``ChatResponse`` or stream, so one entry serves streaming and
+non-streaming callers alike. Only responses read to their end are stored.
+
+``ResponseCache`` keeps responses in memory; ``SQLiteResponseCache`` keeps
+them compressed in a SQLite file shared by the processes of a node and
+surviving restarts. Any object with the same ``cacheable``, ``get`` and
+``set`` methods can be passed to ``Qwen`` instead.
+"""
+
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    AsyncIterator,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+Events = Tuple[bytes, ...]
+
+logger = logging.getLogger("qwen_api")
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    # Entries dropped to stay within max_entries or max_bytes
+    evictions: int
+    # Entries dropped because their TTL had passed
+    expirations: int
+    entries: int
+    bytes: int
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of chat responses with a TTL per entry.
+
+    Args:
+        max_entries: number of responses kept.
+        max_bytes: total size of the kept payloads; larger responses are
+            never stored.
+        ttl: seconds a response stays valid, ``None`` to keep it until it
+            is evicted.
+        max_temperature: only calls with a temperature up to this value are
+            cached, as sampled answers are not meant to repeat; ``None`` to
+            cache every call.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = 3600.0,
+        max_temperature: Optional[float] = 0.0,
+    ):
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError("max_entries and max_bytes must be positive")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+
+        self._lock = threading.Lock()
+        # key -> (payloads, size, expiry), least recently used first
+        self._entries: "OrderedDict[str, Tuple[Events, int, Optional[float]]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.max_temperature is None or temperature <= self.max_temperature
+
+    def get(self, key: str) -> Optional[Events]:
+        """Payloads of the response cached for ``key``, ``None`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None:
+                if entry[2] <= time.monotonic():
+                    self._drop(key)
+                    self._expirations += 1
+                    entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key: str, events: Sequence[bytes], ttl: Optional[float] = None):
+        """Store a response, valid for ``ttl`` seconds instead of the default."""
+        events = tuple(events)
+        size = sum(len(payload) for payload in events)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expiry = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (events, size, expiry)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                entries=len(self._entries),
+                bytes=self._bytes,
+            )
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires);
+"""
+
+# Length prefix of every payload in a stored response
+_LENGTH = struct.Struct("<I")
+
+
+def pack_events(events: Sequence[bytes], level: int = 6) -> bytes:
+    """Payloads of a response as one compressed blob."""
+    body = bytearray()
+    for payload in events:
+        body += _LENGTH.pack(len(payload))
+        body += payload
+    return zlib.compress(bytes(body), level)
+
+
+def unpack_events(data: bytes) -> Events:
+    """Inverse of :func:`pack_events`."""
+    body = zlib.decompress(data)
+    events = []
+    pos = 0
+    while pos < len(body):
+        (length,) = _LENGTH.unpack_from(body, pos)
+        pos += _LENGTH.size
+        events.append(body[pos : pos + length])
+        pos += length
+    return tuple(events)
+
+
+class SQLiteResponseCache:
+    """
+    Response cache in a SQLite (WAL) file, shared by the processes of a node
+    and kept across restarts.
+
+    Responses are stored zlib-compressed. Once the compressed responses
+    exceed ``max_bytes`` (or ``max_entries``), the least recently read ones
+    are deleted. Writes are short ``BEGIN IMMEDIATE`` transactions, so any
+    number of processes may use the same file. Errors of the database are
+    logged and treated as misses, a broken cache never fails a request.
+
+    Hit, miss, eviction and expiration counts of :meth:`stats` are those of
+    this process; entries and bytes are those of the file.
+
+    Args:
+        path: database file, created if missing.
+        max_bytes: total compressed size of the kept responses.
+        max_entries: number of responses kept, ``None`` for no limit.
+        ttl: seconds a response stays valid, ``None`` to keep it until it
+            is evicted. Expiry uses the wall clock, so it holds across
+            restarts.
+        max_temperature: see ``ResponseCache``.
+        compression_level: zlib level, from 1 (fastest) to 9 (smallest).
+        busy_timeout: seconds to wait for the write lock of another process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = 86400.0,
+        max_temperature: Optional[float] = 0.0,
+        compression_level: int = 6,
+        busy_timeout: float = 5.0,
+    ):
+        if max_bytes < 1 or (max_entries is not None and max_entries < 1):
+            raise ValueError("max_entries and max_bytes must be positive")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.compression_level = compression_level
+        self.busy_timeout = busy_timeout
+
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be used across fork(), so reconnect in
+        # child processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.max_temperature is None or temperature <= self.max_temperature
+
+    def get(self, key: str) -> Optional[Events]:
+        """Payloads of the response cached for ``key``, ``None`` on a miss."""
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._connect()
+                row = db.execute(
+                    "SELECT data, expires, accessed FROM responses WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None and row[1] is not None and row[1] <= now:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._expirations += 1
+                    row = None
+                if row is None:
+                    self._misses += 1
+                    return None
+                events = unpack_events(row[0])
+                if now - row[2] > 1.0:
+                    # Recency only needs to be roughly right, which spares
+                    # a write on every hit of a popular response
+                    db.execute(
+                        "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+                    )
+            except (sqlite3.Error, zlib.error, struct.error) as e:
+                logger.warning(f"Response cache read failed: {e}")
+                self._misses += 1
+                return None
+            self._hits += 1
+            return events
+
+    def set(self, key: str, events: Sequence[bytes], ttl: Optional[float] = None):
+        """Store a response, valid for ``ttl`` seconds instead of the default."""
+        data = pack_events(events, self.compression_level)
+        if len(data) > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            try:
+                db = self._connect()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    db.execute(
+                        "INSERT OR REPLACE INTO responses "
+                        "(key, data, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                        (key, data, len(data), expires, now),
+                    )
+                    self._evict(db, now)
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                db.execute("COMMIT")
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {e}")
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        self._expirations += db.execute(
+            "DELETE FROM responses WHERE expires <= ?", (now,)
+        ).rowcount
+        entries, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        excess_entries = (
+            0 if self.max_entries is None else max(0, entries - self.max_entries)
+        )
+        excess_bytes = max(0, size - self.max_bytes)
+        if not excess_entries and not excess_bytes:
+            return
+        victims = []
+        for key, entry_size in db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ):
+            if len(victims) >= excess_entries and excess_bytes <= 0:
+                break
+            victims.append((key,))
+            excess_bytes -= entry_size
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._evictions += len(victims)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            try:
+                self._connect().execute("DELETE FROM responses WHERE key = ?", (key,))
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache delete failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            try:
+                self._connect().execute("DELETE FROM responses")
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache clear failed: {e}")
+
+    def stats(self) -> CacheStats:
+        """Counts of this process; entries and bytes are 0 if unreadable."""
+        with self._lock:
+            try:
+                entries, size = (
+                    self._connect()
+                    .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses")
+                    .fetchone()
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache stats failed: {e}")
+                entries, size = 0, 0
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                entries=entries,
+                bytes=size,
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+def record(
+    events: Iterator[bytes], save: Callable[[Events], None]
+) -> Iterator[bytes]:
+    """Pass ``events`` through and ``save`` them once read to the end."""
+    seen: List[bytes] = []
+    for payload in events:
+        seen.append(payload)
+        yield payload
+    if seen:
+        save(tuple(seen))
+
+
+async def arecord(events: AsyncIterator[bytes], save: Callable[[Events], None]):
+    """Async version of :func:`record`."""
+    seen: List[bytes] = []
+    async for payload in events:
+        seen.append(payload)
+        yield payload
+    if seen:
+        save(tuple(seen))
+
+
+async def areplay(events: Events):
+    """Async iterator over cached payloads."""
+    for payload in events:
+        yield payload
@@ -0,0 +1,140 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import FrozenSet, Mapping, Optional
+
+import aiohttp
+import requests
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Failures that happen before the first response byte, so the request can
+# safely be sent again.
+SYNC_RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout)
+ASYNC_RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retry settings shared by the sync and async request paths.
+
+    Attributes:
+        max_attempts: total attempts per request, including the first one.
+        base_delay: lower bound of the backoff between attempts, in seconds.
+        max_delay: upper bound of a single backoff, in seconds.
+        total_budget: maximum seconds a single request may spend waiting
+            between attempts.
+        retry_statuses: HTTP statuses that are retried.
+        respect_retry_after: wait at least as long as ``Retry-After`` says.
+        budget_ratio: fraction of requests that may be retried client-wide,
+            so an outage does not multiply the load by ``max_attempts``.
+        budget_min_retries: retries per second always allowed regardless of
+            ``budget_ratio``.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    total_budget: float = 60.0
+    retry_statuses: FrozenSet[int] = field(default=RETRYABLE_STATUSES)
+    respect_retry_after: bool = True
+    budget_ratio: float = 0.2
+    budget_min_retries: float = 10.0
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self._budget = RetryBudget(self.budget_ratio, self.budget_min_retries)
+
+    def start(self) -> "RetryState":
+        """Begin tracking the attempts of one request."""
+        self._budget.deposit()
+        return RetryState(self)
+
+
+class RetryBudget:
+    """
+    Client-wide token bucket limiting retries to a fraction of the requests.
+    Every request deposits ``ratio`` tokens and every retry withdraws one.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self._capacity = max(min_per_second * window, 1.0)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self._capacity,
+            self._tokens + (now - self._updated) * self.min_per_second,
+        )
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryState:
+    """Attempt counter and backoff for a single request."""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.attempt = 1
+        self._delay = policy.base_delay
+        self._waited = 0.0
+
+    def backoff(self, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Return the seconds to wait before the next attempt, or ``None`` when
+        the request should not be retried any more.
+        """
+        policy = self.policy
+        if self.attempt >= policy.max_attempts:
+            return None
+        # Decorrelated jitter
+        delay = min(
+            policy.max_delay,
+            random.uniform(policy.base_delay, max(policy.base_delay, self._delay * 3)),
+        )
+        if policy.respect_retry_after and retry_after is not None:
+            delay = max(delay, retry_after)
+        if self._waited + delay > policy.total_budget:
+            return None
+        if not policy._budget.withdraw():
+            return None
+        self._delay = delay
+        self._waited += delay
+        self.attempt += 1
+        return delay
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given in seconds or as an HTTP date."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,551 @@
+"""
+Semantic response cache.
+
+Exact-match caching misses questions asked in other words. ``SemanticCache``
+embeds the last user message of a request and serves the cached response of
+an earlier request whose last message is close enough in meaning, provided
+the model, settings and earlier messages are the same. The embeddings are
+kept in a NumPy matrix searched with one matrix product per lookup; large
+caches can be split into IVF partitions so that a lookup only scans the few
+partitions closest to the query.
+
+NumPy is an optional dependency: ``pip install qwen-api[semantic]``.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import json_codec
+from .response_cache import Events, pack_events, unpack_events
+from .wire import payload_key
+
+# Maps a batch of texts to a 2-D array with one embedding per row
+Embedder = Callable[[Sequence[str]], "np.ndarray"]
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError(
+            "The semantic cache requires numpy: pip install qwen-api[semantic]"
+        )
+
+
+def normalize(vectors) -> "np.ndarray":
+    """Rows of ``vectors`` scaled to unit length, as float32."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbedder:
+    """
+    Dependency-free local embedder hashing the words and character n-grams
+    of a text into a fixed-size vector.
+
+    It matches rewordings that share most of their words and n-grams. For
+    real paraphrases plug in a sentence embedding model instead, e.g.
+    ``SentenceTransformer(...).encode``.
+    """
+
+    def __init__(self, dim: int = 512, ngram: int = 3):
+        _require_numpy()
+        self.dim = dim
+        self.ngram = ngram
+
+    def __call__(self, texts: Sequence[str]) -> "np.ndarray":
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        n = self.ngram
+        for row, text in enumerate(texts):
+            text = " ".join(text.lower().split())
+            padded = f" {text} "
+            features = text.split() + [
+                "#" + padded[i : i + n] for i in range(len(padded) - n + 1)
+            ]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                # Signed hashing keeps collisions from adding up
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vectors
+
+
+class VectorIndex:
+    """
+    Cosine similarity index over unit vectors stored in a NumPy matrix.
+
+    Rows freed by :meth:`remove` are zeroed, so they never match, and reused
+    by later inserts. With ``nlist`` set, the vectors are clustered into
+    ``nlist`` partitions (IVF) once ``32 * nlist`` of them are stored, and
+    re-clustered whenever the index has doubled since; a search then only
+    scans the ``nprobe`` partitions whose centroids are closest to the query.
+
+    Args:
+        dim: dimension of the vectors.
+        nlist: number of IVF partitions, ``None`` for an exact flat search.
+        nprobe: partitions scanned per query.
+        capacity: rows allocated up front; the matrix doubles when full.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        capacity: int = 1024,
+    ):
+        _require_numpy()
+        if nlist is not None and nlist < 1:
+            raise ValueError("nlist must be positive")
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.vectors = np.zeros((max(1, capacity), dim), dtype=np.float32)
+        # Rows below size are in use or free
+        self.size = 0
+        self._free: List[int] = []
+        self._count = 0
+        self.centroids: Optional["np.ndarray"] = None
+        # Partition of every row, -1 when free or not clustered yet
+        self.assignments = np.full(len(self.vectors), -1, dtype=np.int32)
+        self._partitions: List[Set[int]] = []
+        self._partition_rows: Dict[int, "np.ndarray"] = {}
+        self._trained_at = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def train_size(self) -> Optional[int]:
+        return None if self.nlist is None else 32 * self.nlist
+
+    def _grow(self) -> None:
+        # Also moves a memory-mapped matrix into memory
+        capacity = 2 * len(self.vectors)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[: self.size] = self.vectors[: self.size]
+        assignments = np.full(capacity, -1, dtype=np.int32)
+        assignments[: self.size] = self.assignments[: self.size]
+        self.vectors, self.assignments = vectors, assignments
+
+    def add(self, vector: "np.ndarray") -> int:
+        """Insert a unit vector and return its row."""
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self.size == len(self.vectors):
+                self._grow()
+            row = self.size
+            self.size += 1
+        self.vectors[row] = vector
+        self._count += 1
+        if self.nlist is not None and self._count >= max(
+            self.train_size, 2 * self._trained_at
+        ):
+            self.train()
+        elif self.centroids is not None:
+            self._assign(np.array([row]))
+        return row
+
+    def remove(self, row: int) -> None:
+        self.vectors[row] = 0.0
+        partition = int(self.assignments[row])
+        if partition >= 0:
+            self._partitions[partition].discard(row)
+            self._partition_rows.pop(partition, None)
+            self.assignments[row] = -1
+        self._free.append(row)
+        self._count -= 1
+
+    def live_rows(self) -> "np.ndarray":
+        free = np.zeros(self.size, dtype=bool)
+        free[self._free] = True
+        return np.flatnonzero(~free)
+
+    def train(self, iterations: int = 10, sample_size: int = 256) -> None:
+        """Cluster the vectors into ``nlist`` partitions (spherical k-means)."""
+        rows = self.live_rows()
+        if self.nlist is None or len(rows) < self.nlist:
+            return
+        rng = np.random.default_rng(0)
+        if len(rows) > sample_size * self.nlist:
+            sample_rows = rng.choice(rows, sample_size * self.nlist, replace=False)
+        else:
+            sample_rows = rows
+        sample = self.vectors[sample_rows]
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            filled = np.bincount(labels, minlength=self.nlist) > 0
+            # Empty partitions keep their previous centroid
+            centroids[filled] = normalize(sums[filled])
+        self.centroids = centroids
+        self.assignments[:] = -1
+        self._partitions = [set() for _ in range(self.nlist)]
+        self._partition_rows = {}
+        self._assign(rows)
+        self._trained_at = self._count
+
+    def _assign(self, rows: "np.ndarray") -> None:
+        labels = np.argmax(self.vectors[rows] @ self.centroids.T, axis=1)
+        self.assignments[rows] = labels
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            self._partitions[label].add(row)
+            self._partition_rows.pop(label, None)
+
+    def _rows_of(self, partition: int) -> "np.ndarray":
+        rows = self._partition_rows.get(partition)
+        if rows is None:
+            rows = np.fromiter(self._partitions[partition], dtype=np.int64)
+            self._partition_rows[partition] = rows
+        return rows
+
+    def search(self, queries, k: int = 1) -> List[List[Tuple[float, int]]]:
+        """
+        The ``k`` best ``(similarity, row)`` pairs of every query, best first.
+        Queries are normalized and searched with one matrix product.
+        """
+        queries = normalize(queries)
+        if self.size == 0:
+            return [[] for _ in queries]
+        if self.centroids is None:
+            scores = queries @ self.vectors[: self.size].T
+            return [_top_k(row_scores, None, k) for row_scores in scores]
+        probe = min(self.nprobe, len(self.centroids))
+        nearest = np.argpartition(-(queries @ self.centroids.T), probe - 1, axis=1)
+        results = []
+        for query, partitions in zip(queries, nearest[:, :probe]):
+            rows = np.concatenate([self._rows_of(p) for p in partitions])
+            results.append(_top_k(self.vectors[rows] @ query, rows, k))
+        return results
+
+
+def _top_k(
+    scores: "np.ndarray", rows: Optional["np.ndarray"], k: int
+) -> List[Tuple[float, int]]:
+    if len(scores) == 0:
+        return []
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    found = best if rows is None else rows[best]
+    return list(zip(scores[best].tolist(), found.tolist()))
+
+
+@dataclass
+class SemanticCacheStats:
+    hits: int
+    misses: int
+    # Entries dropped to stay within max_entries
+    evictions: int
+    # Entries dropped because their TTL had passed
+    expirations: int
+    entries: int
+
+
+@dataclass
+class SemanticMatch:
+    """Outcome of :meth:`SemanticCache.match`, passed back to :meth:`add`."""
+
+    scope: str
+    text: str
+    vector: "np.ndarray"
+    # Payloads of the cached response, None on a miss
+    events: Optional[Events]
+    similarity: float
+
+
+class _Entry:
+    __slots__ = ("scope", "blob", "expires")
+
+    def __init__(
+        self, scope: str, blob: Union[bytes, memoryview], expires: Optional[float]
+    ):
+        self.scope = scope
+        # Packed payloads, possibly a slice of the memory-mapped payload file
+        self.blob = blob
+        self.expires = expires
+
+
+class SemanticCache:
+    """
+    Cache serving the response of an earlier request whose last user
+    message means the same.
+
+    A request matches a cached one when everything but the text of the last
+    user message is identical and the cosine similarity of the two texts
+    is at least ``threshold``.
+
+    Args:
+        embedder: callable mapping a list of texts to a 2-D array of
+            embeddings (default: ``HashingEmbedder()``).
+        threshold: lowest similarity served from the cache, in (0, 1].
+        max_entries: responses kept, least recently served evicted first.
+        ttl: seconds a response stays valid, ``None`` to keep it until it
+            is evicted.
+        max_temperature: only calls with a temperature up to this value are
+            cached; ``None`` to cache every call.
+        nlist: IVF partitions of the index, ``None`` for an exact search.
+            Worth it from tens of thousands of entries.
+        nprobe: partitions scanned per lookup.
+        candidates: nearest entries checked for a matching scope.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        threshold: float = 0.9,
+        max_entries: int = 10_000,
+        ttl: Optional[float] = 86400.0,
+        max_temperature: Optional[float] = 0.0,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        candidates: int = 8,
+    ):
+        _require_numpy()
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.candidates = candidates
+
+        self._lock = threading.Lock()
+        self.index: Optional[VectorIndex] = None
+        # row -> entry, least recently served first
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._payloads: Optional[mmap.mmap] = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.max_temperature is None or temperature <= self.max_temperature
+
+    @staticmethod
+    def query(payload: bytes) -> Optional[Tuple[str, str]]:
+        """
+        Scope and text of an encoded request: the hash of everything but
+        the last user message's text, and that text. ``None`` when the last
+        message is not a plain user text.
+        """
+        data = json_codec.loads(payload)
+        messages = data.get("messages") or []
+        if not messages:
+            return None
+        last = messages[-1]
+        text = last.get("content")
+        if last.get("role") != "user" or not isinstance(text, str) or not text.strip():
+            return None
+        data["messages"] = messages[:-1] + [{**last, "content": None}]
+        return payload_key(json_codec.dumps(data)), text
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        return normalize(self.embedder(list(texts)))
+
+    def match(self, payload: bytes) -> Optional[SemanticMatch]:
+        """
+        Look an encoded request up. Returns ``None`` if it cannot be cached,
+        otherwise a ``SemanticMatch`` carrying the cached payloads on a hit.
+        """
+        query = self.query(payload)
+        if query is None:
+            return None
+        scope, text = query
+        vector = self.embed([text])[0]
+        with self._lock:
+            found = self._find(scope, vector)
+            if found is None:
+                self._misses += 1
+                return SemanticMatch(scope, text, vector, None, 0.0)
+            self._hits += 1
+        blob, similarity = found
+        return SemanticMatch(scope, text, vector, unpack_events(blob), similarity)
+
+    def _find(
+        self, scope: str, vector: "np.ndarray"
+    ) -> Optional[Tuple[Union[bytes, memoryview], float]]:
+        # Nearest live entry of the scope above the threshold, called locked
+        if self.index is None:
+            return None
+        now = time.time()
+        for similarity, row in self.index.search(vector, self.candidates)[0]:
+            if similarity < self.threshold:
+                return None
+            entry = self._entries.get(row)
+            if entry is None or entry.scope != scope:
+                continue
+            if entry.expires is not None and entry.expires <= now:
+                self._remove(row)
+                self._expirations += 1
+                continue
+            self._entries.move_to_end(row)
+            return entry.blob, similarity
+        return None
+
+    def add(
+        self, match: SemanticMatch, events: Sequence[bytes], ttl: Optional[float] = None
+    ) -> None:
+        """Store the response of a request that missed."""
+        blob = pack_events(events)
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            if self.index is None:
+                self.index = VectorIndex(len(match.vector), self.nlist, self.nprobe)
+            row = self.index.add(match.vector)
+            self._entries[row] = _Entry(match.scope, blob, expires)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _remove(self, row: int) -> None:
+        del self._entries[row]
+        self.index.remove(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            payloads = self._payloads
+            self.index = None
+            self._entries = OrderedDict()
+            self._payloads = None
+        _close_mapping(payloads)
+
+    def close(self) -> None:
+        """Empty the cache and unmap the files of :meth:`load`."""
+        self.clear()
+
+    def stats(self) -> SemanticCacheStats:
+        with self._lock:
+            return SemanticCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                entries=len(self._entries),
+            )
+
+    # Persistence
+
+    def save(self, directory: str) -> None:
+        """
+        Write the cache to ``directory``: the embedding matrix as
+        ``vectors.npy``, the packed responses as ``payloads.bin`` and the
+        entries as ``entries.json``.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        def path(name: str) -> str:
+            return os.path.join(directory, name)
+
+        written = []
+        with self._lock:
+            index = self.index
+            meta = {"dim": None if index is None else index.dim, "entries": []}
+            with open(path("payloads.bin.tmp"), "wb") as f:
+                for row, entry in self._entries.items():
+                    meta["entries"].append(
+                        [row, entry.scope, entry.expires, f.tell(), len(entry.blob)]
+                    )
+                    f.write(entry.blob)
+            written.append("payloads.bin")
+            if index is not None:
+                with open(path("vectors.npy.tmp"), "wb") as f:
+                    np.save(f, index.vectors[: index.size])
+                written.append("vectors.npy")
+                if index.centroids is not None:
+                    with open(path("centroids.npy.tmp"), "wb") as f:
+                        np.save(f, index.centroids)
+                    written.append("centroids.npy")
+            with open(path("entries.json.tmp"), "w") as f:
+                json.dump(meta, f)
+        if "centroids.npy" not in written and os.path.exists(path("centroids.npy")):
+            os.remove(path("centroids.npy"))
+        # The entries go last, so that they never name rows missing from the
+        # other files
+        for name in written + ["entries.json"]:
+            os.replace(path(name + ".tmp"), path(name))
+
+    def load(self, directory: str) -> None:
+        """
+        Replace the cache with the one saved in ``directory``. The matrix and
+        the responses are memory-mapped, so only what lookups touch is read;
+        inserts copy the touched pages and never write to the files.
+        """
+        with open(os.path.join(directory, "entries.json")) as f:
+            meta = json.load(f)
+        now = time.time()
+        index = None
+        entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        payloads = None
+        if meta["dim"] is not None:
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="c")
+            index = VectorIndex(meta["dim"], self.nlist, self.nprobe, capacity=1)
+            index.vectors = vectors
+            index.size = len(vectors)
+            index.assignments = np.full(len(vectors), -1, dtype=np.int32)
+            size = os.path.getsize(os.path.join(directory, "payloads.bin"))
+            if size:
+                with open(os.path.join(directory, "payloads.bin"), "rb") as f:
+                    payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(payloads) if payloads is not None else b""
+            live = set()
+            for row, scope, expires, offset, length in meta["entries"]:
+                if expires is not None and expires <= now:
+                    continue
+                entries[row] = _Entry(scope, view[offset : offset + length], expires)
+                live.add(row)
+            index._free = [row for row in range(index.size) if row not in live]
+            index._count = len(live)
+            for row in index._free:
+                if vectors[row].any():
+                    vectors[row] = 0.0
+            centroids = os.path.join(directory, "centroids.npy")
+            if self.nlist is not None and os.path.exists(centroids):
+                index.centroids = np.load(centroids)
+                if len(index.centroids) == self.nlist:
+                    index._partitions = [set() for _ in range(self.nlist)]
+                    index._assign(index.live_rows())
+                    index._trained_at = len(live)
+                else:
+                    index.centroids = None
+                    index.train()
+        with self._lock:
+            previous = self._payloads
+            self.index = index
+            self._entries = entries
+            self._payloads = payloads
+        _close_mapping(previous)
+
+
+def _close_mapping(payloads: Optional[mmap.mmap]) -> None:
+    # Called once the entries slicing the mapping are dropped
+    if payloads is None:
+        return
+    try:
+        payloads.close()
+    except BufferError:
+        # A lookup still reads a response from it, the mapping is closed
+        # when that is released
+        pass
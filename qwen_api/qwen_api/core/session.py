@@ -0,0 +1,148 @@
+import asyncio
+import threading
+from typing import Optional
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class SyncSessionPool:
+    """
+    Lazily created, thread-safe pooled ``requests.Session`` shared by every
+    sync request of a single ``Qwen`` client.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: int = 0,
+        keep_alive: bool = True,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+
+    def _create(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            # Only retry connection establishment here, never a request that
+            # may already have reached the server.
+            max_retries=Retry(
+                total=self.max_retries,
+                connect=self.max_retries,
+                read=0,
+                status=0,
+                other=0,
+                allowed_methods=None,
+                raise_on_status=False,
+            ),
+            pool_block=False,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def get(self) -> requests.Session:
+        session = self._session
+        if session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create()
+                session = self._session
+        return session
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class AsyncSessionPool:
+    """
+    Lazily created ``aiohttp.ClientSession`` owned by a single ``Qwen``
+    client, so connections, DNS lookups and TLS sessions are reused across
+    async requests.
+
+    The session is bound to the event loop it was created on. When the
+    client is used from a different loop (e.g. successive ``asyncio.run``
+    calls) a fresh session is created for that loop.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_ttl: Optional[int] = 300,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=self.dns_ttl is not None,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def get(self) -> aiohttp.ClientSession:
+        """Return the session for the running loop, creating it if needed."""
+        loop = asyncio.get_running_loop()
+        session = self._session
+        if session is None or session.closed or self._loop is not loop:
+            if session is not None and not session.closed:
+                # Belongs to another (probably finished) loop; it can no
+                # longer be awaited, so just drop its connections.
+                self._detach(session)
+            session = self._create()
+            self._session = session
+            self._loop = loop
+        return session
+
+    @staticmethod
+    def _detach(session: aiohttp.ClientSession) -> None:
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            try:
+                connector._close()
+            except RuntimeError:
+                # The owning loop is already closed
+                pass
+
+    async def aclose(self) -> None:
+        session, self._session, self._loop = self._session, None, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def close(self) -> None:
+        """Close the session from sync code."""
+        session, loop = self._session, self._loop
+        self._session, self._loop = None, None
+        if session is None or session.closed:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and running is loop:
+            running.create_task(session.close())
+        else:
+            self._detach(session)
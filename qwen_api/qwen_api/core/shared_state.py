@@ -0,0 +1,227 @@
+"""
+Rate-limit and credential state shared by the processes of one node.
+
+``SQLiteSharedState`` keeps token buckets, concurrency slots and credential
+health in a SQLite database in WAL mode. Every update is a short ``BEGIN
+IMMEDIATE`` transaction, so processes of a gunicorn or multiprocessing
+deployment coordinate through a local file without an external service.
+
+Timestamps use ``time.monotonic()``, which is system-wide on the supported
+platforms, so the database must only be shared by processes of one machine.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    key TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (key, pid)
+);
+CREATE TABLE IF NOT EXISTS credentials (
+    name TEXT PRIMARY KEY,
+    requests INTEGER NOT NULL,
+    successes INTEGER NOT NULL,
+    rate_limited INTEGER NOT NULL,
+    auth_errors INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    health REAL NOT NULL,
+    cooldown_until REAL NOT NULL,
+    strikes INTEGER NOT NULL
+);
+"""
+
+CREDENTIAL_FIELDS = (
+    "requests",
+    "successes",
+    "rate_limited",
+    "auth_errors",
+    "errors",
+    "health",
+    "cooldown_until",
+    "strikes",
+)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedTransaction:
+    """Operations available inside :meth:`SQLiteSharedState.transaction`."""
+
+    def __init__(self, state: "SQLiteSharedState", connection: sqlite3.Connection):
+        self._state = state
+        self._db = connection
+
+    def load_bucket(self, key: str, default_tokens: float) -> Tuple[float, float]:
+        row = self._db.execute(
+            "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.monotonic()
+        if row is None or row[1] > now:
+            # Unknown bucket, or one written before the last reboot
+            return float(default_tokens), now
+        return row
+
+    def store_bucket(self, key: str, tokens: float, updated: float) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+            (key, tokens, updated),
+        )
+
+    def slot_counts(self, keys: Iterable[str]) -> Dict[str, int]:
+        """Slots held per key by live processes."""
+        keys = list(keys)
+        self._state._prune(self._db)
+        marks = ",".join("?" * len(keys))
+        counts = dict.fromkeys(keys, 0)
+        counts.update(
+            self._db.execute(
+                f"SELECT key, SUM(count) FROM slots WHERE key IN ({marks}) GROUP BY key",
+                keys,
+            ).fetchall()
+        )
+        return counts
+
+    def add_slot(self, key: str, delta: int) -> None:
+        """Add ``delta`` to the slots this process holds for ``key``."""
+        self._db.execute(
+            "INSERT INTO slots (key, pid, count) VALUES (?, ?, MAX(?, 0)) "
+            "ON CONFLICT (key, pid) DO UPDATE SET count = MAX(count + ?, 0)",
+            (key, os.getpid(), delta, delta),
+        )
+
+    def load_credential(self, name: str) -> Optional[Dict[str, float]]:
+        row = self._db.execute(
+            f"SELECT {', '.join(CREDENTIAL_FIELDS)} FROM credentials WHERE name = ?",
+            (name,),
+        ).fetchone()
+        return None if row is None else dict(zip(CREDENTIAL_FIELDS, row))
+
+    def store_credential(self, name: str, fields: Dict[str, float]) -> None:
+        self._db.execute(
+            f"INSERT OR REPLACE INTO credentials (name, {', '.join(CREDENTIAL_FIELDS)}) "
+            f"VALUES (?, {', '.join('?' * len(CREDENTIAL_FIELDS))})",
+            (name, *(fields[field] for field in CREDENTIAL_FIELDS)),
+        )
+
+
+class SQLiteSharedState:
+    """
+    SQLite (WAL) store coordinating rate limits and the credential pool
+    between processes.
+
+    Pass it as ``shared_state`` to ``Qwen`` (or to ``RateLimiter`` and
+    ``AuthManager`` directly). Every process must be configured with the
+    same limits and credential names.
+
+    Args:
+        path: database file, created if missing.
+        busy_timeout: seconds to wait for the write lock of another process.
+        poll_interval: longest sleep between checks while waiting for a
+            concurrency slot held by another process.
+    """
+
+    def __init__(
+        self, path: str, busy_timeout: float = 5.0, poll_interval: float = 0.05
+    ):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.poll_interval = poll_interval
+        # Reentrant so that nested transactions join the outer one
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._pruned = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be used across fork(), so reconnect in
+        # child processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        # Drop slots of processes that exited without releasing them, at
+        # most once per second
+        now = time.monotonic()
+        if now - self._pruned < 1.0:
+            return
+        self._pruned = now
+        for (pid,) in db.execute("SELECT DISTINCT pid FROM slots").fetchall():
+            if pid != os.getpid() and not _pid_alive(pid):
+                db.execute("DELETE FROM slots WHERE pid = ?", (pid,))
+
+    @contextmanager
+    def transaction(self) -> Iterator[SharedTransaction]:
+        """
+        Exclusive write transaction across threads and processes. A nested
+        call from the same thread joins the outer transaction.
+        """
+        with self._lock:
+            db = self._connect()
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield SharedTransaction(self, db)
+                finally:
+                    self._depth -= 1
+                return
+            db.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            try:
+                yield SharedTransaction(self, db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            else:
+                db.execute("COMMIT")
+            finally:
+                self._depth = 0
+
+    def try_acquire_slot(self, key: str, limit: int) -> bool:
+        """Take one of ``limit`` slots of ``key`` if one is free."""
+        with self.transaction() as tx:
+            if tx.slot_counts([key])[key] >= limit:
+                return False
+            tx.add_slot(key, 1)
+            return True
+
+    def release_slot(self, key: str) -> None:
+        with self.transaction() as tx:
+            tx.add_slot(key, -1)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
@@ -0,0 +1,127 @@
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Union
+
+import aiohttp
+import requests
+
+# Size of the reads handed to the decoder. Reads return as soon as some data
+# is available, so this only bounds how much is pulled in one go.
+CHUNK_SIZE = 64 * 1024
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class SSEDecoder:
+    """
+    Incremental decoder for ``text/event-stream`` bodies.
+
+    Feed it raw chunks as they arrive from the network; it returns the
+    ``data`` payload of every event completed by that chunk as ``bytes``.
+    Events may straddle chunk boundaries, multi-line ``data:`` fields are
+    joined with ``\\n`` and comment/other fields are skipped, following the
+    SSE specification. No ``str`` is ever created.
+    """
+
+    __slots__ = ("_buf", "_data", "_has_data", "_pending_cr")
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._data: List[bytes] = []
+        self._has_data = False
+        self._pending_cr = False
+
+    def feed(self, chunk: Buffer) -> List[bytes]:
+        if not chunk:
+            return []
+        buf = self._buf
+        if self._pending_cr:
+            # A CR ended the previous chunk; drop the LF of a split CRLF
+            self._pending_cr = False
+            if chunk[0] == 10:
+                chunk = memoryview(chunk)[1:]
+        start = len(buf)
+        buf += chunk
+        if buf.find(b"\r", start) != -1:
+            # Normalise CRLF and lone CR line endings to LF. A trailing CR
+            # may be the first half of a CRLF, so remember it.
+            if buf[-1] == 13:
+                self._pending_cr = True
+            buf[:] = buf.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        return self._parse(final=False)
+
+    def flush(self) -> List[bytes]:
+        """Dispatch whatever is left once the stream has ended."""
+        self._pending_cr = False
+        events = self._parse(final=True)
+        if self._has_data:
+            events.append(self._dispatch())
+        return events
+
+    def _dispatch(self) -> bytes:
+        data = self._data
+        payload = data[0] if len(data) == 1 else b"\n".join(data)
+        self._data = []
+        self._has_data = False
+        return payload
+
+    def _parse(self, final: bool) -> List[bytes]:
+        buf = self._buf
+        view = memoryview(buf)
+        events: List[bytes] = []
+        pos = 0
+        end = len(buf)
+        try:
+            while pos < end:
+                nl = buf.find(b"\n", pos)
+                if nl == -1:
+                    if not final:
+                        break
+                    nl = end
+                if nl == pos:
+                    # Blank line: dispatch the event
+                    if self._has_data:
+                        events.append(self._dispatch())
+                elif buf.startswith(b"data", pos):
+                    value = pos + 4
+                    if value < nl and buf[value] == 58:  # ":"
+                        value += 1
+                        if value < nl and buf[value] == 32:  # " "
+                            value += 1
+                    elif value != nl:
+                        # Some other field that merely starts with "data"
+                        pos = nl + 1
+                        continue
+                    self._data.append(bytes(view[value:nl]))
+                    self._has_data = True
+                # Comments (":") and event/id/retry fields are ignored
+                pos = nl + 1
+        finally:
+            view.release()
+        if pos:
+            del buf[:pos]
+        return events
+
+
+def iter_sse(chunks: Iterable[Buffer]) -> Iterator[bytes]:
+    """Yield event payloads from an iterable of raw byte chunks."""
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.flush()
+
+
+async def aiter_sse(chunks: AsyncIterable[Buffer]) -> AsyncIterator[bytes]:
+    """Yield event payloads from an async iterable of raw byte chunks."""
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for payload in decoder.feed(chunk):
+            yield payload
+    for payload in decoder.flush():
+        yield payload
+
+
+def iter_sse_response(response: requests.Response) -> Iterator[bytes]:
+    return iter_sse(response.iter_content(chunk_size=CHUNK_SIZE))
+
+
+def aiter_sse_response(response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+    return aiter_sse(response.content.iter_chunked(CHUNK_SIZE))
@@ -0,0 +1,100 @@
+from collections.abc import AsyncGenerator, Generator
+from typing import Any, List, Literal, Optional
+
+StreamMode = Literal["cumulative", "delta"]
+
+
+class TextAccumulator:
+    """
+    Collects streamed text pieces and joins them only when the full text is
+    requested, so building an n-token answer costs O(n) instead of O(n²).
+    """
+
+    __slots__ = ("_parts", "_text")
+
+    def __init__(self) -> None:
+        self._parts: List[str] = []
+        self._text: Optional[str] = None
+
+    def append(self, piece: Optional[str]) -> None:
+        if piece:
+            self._parts.append(piece)
+            self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._parts)
+            # Keep the joined string as the only part so later joins are cheap
+            self._parts = [self._text] if self._text else []
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+
+class ChatStream(Generator):
+    """
+    Generator returned by ``create(stream=True, stream_mode="delta")``.
+
+    Every chunk is a lightweight ``StreamChunk`` carrying only the newly
+    generated text. The full answer received so far is available through
+    :attr:`text`, and :meth:`read` drains the rest of the stream and returns
+    the complete answer.
+    """
+
+    def __init__(self, chunks: Generator, accumulator: TextAccumulator):
+        self._chunks = chunks
+        self._accumulator = accumulator
+
+    def send(self, value: Any) -> Any:
+        return self._chunks.send(value)
+
+    def throw(self, typ, val=None, tb=None):  # type: ignore[override]
+        if val is None and tb is None:
+            return self._chunks.throw(typ)
+        return self._chunks.throw(typ, val, tb)
+
+    def close(self) -> None:
+        self._chunks.close()
+
+    @property
+    def text(self) -> str:
+        return self._accumulator.text
+
+    def read(self) -> str:
+        for _ in self:
+            pass
+        return self.text
+
+
+class AsyncChatStream(AsyncGenerator):
+    """
+    Async generator returned by ``acreate(stream=True, stream_mode="delta")``.
+
+    See :class:`ChatStream`.
+    """
+
+    def __init__(self, chunks: AsyncGenerator, accumulator: TextAccumulator):
+        self._chunks = chunks
+        self._accumulator = accumulator
+
+    async def asend(self, value: Any) -> Any:
+        return await self._chunks.asend(value)
+
+    async def athrow(self, typ, val=None, tb=None):  # type: ignore[override]
+        if val is None and tb is None:
+            return await self._chunks.athrow(typ)
+        return await self._chunks.athrow(typ, val, tb)
+
+    async def aclose(self) -> None:
+        await self._chunks.aclose()
+
+    @property
+    def text(self) -> str:
+        return self._accumulator.text
+
+    async def read(self) -> str:
+        async for _ in self:
+            pass
+        return self.text
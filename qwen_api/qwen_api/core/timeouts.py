@@ -0,0 +1,305 @@
+"""
+Request deadlines and the watchdog enforcing them while a response streams.
+
+Socket timeouts only notice a connection that sends nothing at all. The
+watchdog also catches a server that trickles keep-alive bytes without
+events, and enforces the overall deadline of long streams. When a deadline
+passes it aborts the response, which makes the pending read fail, and the
+stream processors turn that failure into a ``StreamTimeoutError``.
+"""
+
+import asyncio
+import heapq
+import itertools
+import socket
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import aiohttp
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+# Added to the longest silence the deadlines allow to get the socket read
+# timeout, so that the watchdog fires first
+READ_TIMEOUT_SLACK = 5.0
+
+
+@dataclass(frozen=True)
+class Timeouts:
+    """
+    Deadlines of one request, in seconds. ``None`` disables a deadline.
+
+    Attributes:
+        connect: establishing the connection.
+        first_token: from sending the request to its first event.
+        idle: between two events once the stream has started.
+        total: from sending the request to the end of the response.
+        retry_stalled: retry, per the client's ``RetryPolicy``, a request that
+            hit a deadline before any content reached the caller.
+    """
+
+    connect: Optional[float] = 10.0
+    first_token: Optional[float] = 120.0
+    idle: Optional[float] = 60.0
+    total: Optional[float] = 600.0
+    retry_stalled: bool = False
+
+    @property
+    def read(self) -> Optional[float]:
+        """
+        Socket read timeout backing up the watchdog, longer than any silence
+        the deadlines allow.
+        """
+        silence = None
+        if self.first_token is not None and self.idle is not None:
+            silence = max(self.first_token, self.idle)
+        if self.total is not None:
+            silence = self.total if silence is None else min(silence, self.total)
+        return None if silence is None else silence + READ_TIMEOUT_SLACK
+
+    def requests_timeout(self) -> Tuple[Optional[float], Optional[float]]:
+        return (self.connect, self.read)
+
+    def aiohttp_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=None, sock_connect=self.connect, sock_read=self.read
+        )
+
+
+class Watchdog:
+    """
+    Deadlines of one response. Call :meth:`feed` for every event and
+    :meth:`stop` once the response is done; when a deadline passes first the
+    response is aborted and :attr:`expired` names the phase.
+    """
+
+    __slots__ = (
+        "timeouts",
+        "started",
+        "last_event",
+        "expired",
+        "stopped",
+        "handle",
+        "armed",
+        "read_timed_out",
+        "_abort",
+        "_rearm",
+    )
+
+    def __init__(self, timeouts: Timeouts, abort: Callable[[], None], started: float):
+        self.timeouts = timeouts
+        self.started = started
+        self.last_event: Optional[float] = None
+        self.expired: Optional[str] = None
+        self.stopped = False
+        # Pending event loop timer of async watchdogs
+        self.handle: Optional[asyncio.TimerHandle] = None
+        # Deadline the sync scheduler currently holds for this watchdog
+        self.armed: Optional[float] = None
+        # Expired through the socket read timeout rather than the watchdog
+        self.read_timed_out = False
+        self._abort: Optional[Callable[[], None]] = abort
+        self._rearm: Optional[Callable[[], None]] = None
+
+    def feed(self) -> None:
+        first = self.last_event is None
+        self.last_event = time.monotonic()
+        if first and self._rearm is not None:
+            # The watchdog is armed for the first-token deadline, which may
+            # be far later than the idle deadline that applies from now on.
+            # Later timers reschedule themselves from the last event.
+            self._rearm()
+
+    def expire_read(self) -> None:
+        """Record that the socket read timed out before any deadline passed."""
+        if self.expired is None:
+            self.expired = "first_token" if self.last_event is None else "idle"
+            self.read_timed_out = True
+        self.stop()
+
+    def deadline(self) -> Optional[Tuple[float, str]]:
+        """Earliest pending deadline and its phase."""
+        timeouts = self.timeouts
+        deadlines: List[Tuple[float, str]] = []
+        if timeouts.total is not None:
+            deadlines.append((self.started + timeouts.total, "total"))
+        if self.last_event is None:
+            if timeouts.first_token is not None:
+                deadlines.append((self.started + timeouts.first_token, "first_token"))
+        elif timeouts.idle is not None:
+            deadlines.append((self.last_event + timeouts.idle, "idle"))
+        return min(deadlines) if deadlines else None
+
+    def check(self, now: float) -> Optional[float]:
+        """Abort if a deadline has passed, otherwise return the next one."""
+        if self.stopped:
+            return None
+        deadline = self.deadline()
+        if deadline is None:
+            return None
+        if now < deadline[0]:
+            return deadline[0]
+        self.expired = deadline[1]
+        abort = self._abort
+        self.stop()
+        try:
+            abort()
+        except Exception:
+            pass
+        return None
+
+    def stop(self) -> None:
+        self.stopped = True
+        # Drop the reference to the response right away
+        self._abort = None
+        self._rearm = None
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def error_message(self) -> str:
+        timeouts = self.timeouts
+        if self.read_timed_out:
+            return f"No data received for {timeouts.read}s"
+        return {
+            "first_token": f"No event within {timeouts.first_token}s of the request",
+            "idle": f"Stream idle for more than {timeouts.idle}s",
+            "total": f"Response not finished within {timeouts.total}s",
+        }[self.expired]
+
+
+class _Scheduler:
+    """Single background thread checking the watchdogs of sync responses."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap: List[Tuple[float, int, Watchdog]] = []
+        self._counter = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._compact_at = 1024
+
+    def arm(self, watchdog: Watchdog) -> None:
+        deadline = watchdog.deadline()
+        with self._condition:
+            # Entries of earlier deadlines are dropped when they come up
+            watchdog.armed = None if deadline is None else deadline[0]
+            if deadline is None:
+                return
+            if len(self._heap) >= self._compact_at:
+                # Stopped watchdogs are otherwise only dropped at their deadline
+                self._heap = [entry for entry in self._heap if not entry[2].stopped]
+                heapq.heapify(self._heap)
+                self._compact_at = max(1024, 2 * len(self._heap))
+            heapq.heappush(self._heap, (deadline[0], next(self._counter), watchdog))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="qwen-watchdog", daemon=True
+                )
+                self._thread.start()
+            elif self._heap[0][2] is watchdog:
+                self._condition.notify()
+
+    def _run(self) -> None:
+        with self._condition:
+            while True:
+                while not self._heap:
+                    self._condition.wait()
+                when, _, watchdog = self._heap[0]
+                now = time.monotonic()
+                if watchdog.stopped or when != watchdog.armed:
+                    heapq.heappop(self._heap)
+                    continue
+                if now < when:
+                    self._condition.wait(when - now)
+                    continue
+                heapq.heappop(self._heap)
+                next_deadline = watchdog.check(now)
+                watchdog.armed = next_deadline
+                if next_deadline is not None:
+                    heapq.heappush(
+                        self._heap, (next_deadline, next(self._counter), watchdog)
+                    )
+
+
+_scheduler = _Scheduler()
+
+
+def abort_response(response: requests.Response) -> None:
+    """Close a sync response, failing a read blocked on it in another thread."""
+    # Closing alone does not wake a thread blocked in recv(), shutting the
+    # socket down does
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def _abort_sync(response_ref: "weakref.ref[requests.Response]") -> None:
+    response = response_ref()
+    if response is not None:
+        abort_response(response)
+
+
+def watch_response(
+    response: requests.Response, timeouts: Timeouts, started: float
+) -> Watchdog:
+    """Start watching a sync response."""
+    # Weak so that an abandoned response can still be garbage collected
+    response_ref = weakref.ref(response)
+    watchdog = Watchdog(timeouts, lambda: _abort_sync(response_ref), started)
+    watchdog._rearm = lambda: _scheduler.arm(watchdog)
+    _scheduler.arm(watchdog)
+    return watchdog
+
+
+def awatch_response(
+    response: aiohttp.ClientResponse, timeouts: Timeouts, started: float
+) -> Watchdog:
+    """Start watching an async response from within its event loop."""
+    loop = asyncio.get_running_loop()
+    response_ref = weakref.ref(response)
+
+    def abort() -> None:
+        response = response_ref()
+        if response is not None:
+            response.close()
+
+    watchdog = Watchdog(timeouts, abort, started)
+
+    def schedule(when: float) -> None:
+        watchdog.handle = loop.call_at(loop.time() + when - time.monotonic(), check)
+
+    def check() -> None:
+        watchdog.handle = None
+        next_deadline = watchdog.check(time.monotonic())
+        if next_deadline is not None:
+            schedule(next_deadline)
+
+    def arm() -> None:
+        if watchdog.handle is not None:
+            watchdog.handle.cancel()
+            watchdog.handle = None
+        deadline = watchdog.deadline()
+        if deadline is not None:
+            schedule(deadline[0])
+
+    watchdog._rearm = arm
+    arm()
+    return watchdog
+
+
+def is_read_timeout(error: BaseException) -> bool:
+    """Whether ``error`` is a socket read of ``requests`` or ``aiohttp`` timing out."""
+    if isinstance(error, (requests.Timeout, socket.timeout, asyncio.TimeoutError)):
+        return True
+    # requests reports reads timing out mid-body as connection errors
+    return isinstance(error, requests.ConnectionError) and any(
+        isinstance(arg, ReadTimeoutError) for arg in error.args
+    )
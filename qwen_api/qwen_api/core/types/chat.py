@@ -25,6 +25,7 @@ from pydantic import (
     model_validator,
 )
 from ...utils.image_llamaindex import resolve_binary
+from .. import json_codec
 from .response.function_tool import ToolCall
 
 
@@ -286,6 +287,65 @@ class ChatResponseStream(BaseModel):
     message: ChatMessage
 
 
+class StreamChunk:
+    """
+    Lightweight chunk yielded by ``stream_mode="delta"`` streams.
+
+    Only the fields needed on the hot path are extracted; the raw event is
+    kept and only decoded when :attr:`raw` is accessed. Use
+    :meth:`to_response_stream` to get the full pydantic
+    :class:`ChatResponseStream`.
+    """
+
+    __slots__ = ("role", "content", "tool_calls", "_raw", "_payload")
+
+    def __init__(
+        self,
+        role: Optional[str],
+        content: Optional[str],
+        raw: Optional[Dict[str, Any]] = None,
+        tool_calls: Optional[List[ToolCall]] = None,
+        payload: Optional[bytes] = None,
+    ) -> None:
+        self.role = role
+        self.content = content
+        self.tool_calls = tool_calls
+        self._raw = raw
+        self._payload = payload
+
+    @property
+    def raw(self) -> Dict[str, Any]:
+        """The decoded SSE event, decoded on first access."""
+        if self._raw is None and self._payload is not None:
+            self._raw = json_codec.loads(self._payload)
+            self._payload = None
+        if self._raw is None:
+            self._raw = {
+                "choices": [{"delta": {"role": self.role, "content": self.content}}]
+            }
+        return self._raw
+
+    def to_response_stream(self, content: Optional[str] = None) -> ChatResponseStream:
+        """
+        Build the pydantic model for this chunk.
+
+        Args:
+            content (str, optional): text for ``message``, e.g. the cumulative
+                answer; defaults to this chunk's delta.
+        """
+        return ChatResponseStream(
+            **{"usage": None, **self.raw},
+            message=ChatMessage(
+                role=self.role or MessageRole.ASSISTANT,
+                content=self.content if content is None else content,
+                tool_calls=self.tool_calls,
+            ),
+        )
+
+    def __repr__(self) -> str:
+        return f"StreamChunk(role={self.role!r}, content={self.content!r})"
+
+
 ContentBlock = Annotated[
     Union[TextBlock, ImageBlock, AudioBlock, DocumentBlock],
     Field(discriminator="block_type"),
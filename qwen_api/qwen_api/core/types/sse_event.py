@@ -0,0 +1,42 @@
+"""
+Schemas for the SSE events of the completions endpoint.
+
+The adapters are built once at import and validate events straight from the
+raw payload bytes with ``validate_json``, so parsing and validation happen in
+a single pydantic-core pass. Keys that are not declared are skipped.
+"""
+
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, Field, TypeAdapter
+from typing_extensions import Annotated, TypedDict
+
+from .chat import ChoiceStream, Usage
+
+
+class SSEDelta(TypedDict, total=False):
+    role: str
+    content: str
+    # Only turned into ``Extra`` for function events, see the processors
+    extra: Any
+
+
+class SSEChoice(TypedDict):
+    delta: SSEDelta
+
+
+class SSEEvent(TypedDict):
+    """Minimal event read by the aggregating processors and delta streams."""
+
+    choices: Annotated[List[SSEChoice], Field(min_length=1)]
+
+
+class StreamEvent(BaseModel):
+    """Event as exposed by cumulative streams (``ChatResponseStream``)."""
+
+    choices: Annotated[List[ChoiceStream], Field(min_length=1)]
+    usage: Optional[Usage] = None
+
+
+SSE_EVENT_ADAPTER: TypeAdapter[SSEEvent] = TypeAdapter(SSEEvent)
+STREAM_EVENT_ADAPTER: TypeAdapter[StreamEvent] = TypeAdapter(StreamEvent)
@@ -0,0 +1,209 @@
+"""
+Content-addressed cache of uploaded files.
+
+Uploading a file costs a ``getstsToken`` request and a full ``put_object``
+to OSS. ``UploadCache`` maps the SHA-256 of the file bytes to the
+``FileResult`` of its first upload, so uploading the same bytes again only
+costs hashing them. An entry lives as long as the signed file URL stays
+valid, or ``ttl`` when the URL does not say.
+"""
+
+import datetime as dt
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .types.upload_file import FileResult
+
+logger = logging.getLogger("qwen_api")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """
+    Expiry of a signed OSS URL as a Unix timestamp, from its ``Expires``
+    (V1) or ``x-oss-date`` and ``x-oss-expires`` (V4) parameters.
+    """
+    query = {k.lower(): v[0] for k, v in parse_qs(urlparse(url).query).items()}
+    try:
+        if "expires" in query:
+            return float(query["expires"])
+        if "x-oss-date" in query and "x-oss-expires" in query:
+            signed = dt.datetime.strptime(query["x-oss-date"], "%Y%m%dT%H%M%SZ")
+            signed = signed.replace(tzinfo=dt.timezone.utc)
+            return signed.timestamp() + float(query["x-oss-expires"])
+    except ValueError:
+        pass
+    return None
+
+
+@dataclass
+class UploadCacheStats:
+    hits: int
+    misses: int
+    entries: int
+
+
+class UploadCache:
+    """
+    Cache of upload results keyed by the SHA-256 of the file bytes and the
+    MIME type they were uploaded as.
+
+    Entries are kept in memory and, with ``path``, in a SQLite file too, so
+    that they survive restarts and are shared by the processes of a node.
+
+    Args:
+        ttl: seconds an entry is kept when its URL carries no expiry.
+        margin: seconds before the URL expires that its entry is dropped, so
+            that a cached URL is never handed out about to expire.
+        max_entries: entries kept in memory, oldest dropped first, and in
+            the SQLite file, soonest to expire dropped first.
+        path: SQLite file persisting the entries, ``None`` to keep them in
+            memory only.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        margin: float = 300.0,
+        max_entries: int = 10_000,
+        path: Optional[str] = None,
+    ):
+        self.ttl = ttl
+        self.margin = margin
+        self.max_entries = max_entries
+        self.path = path
+
+        self._lock = threading.Lock()
+        # key -> (result, expiry), oldest first
+        self._entries: Dict[str, Tuple[FileResult, float]] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(digest: str, mime_type: Optional[str]) -> str:
+        return f"{digest}:{mime_type or ''}"
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be used across fork(), so reconnect in
+        # child processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def expiry(self, result: FileResult) -> float:
+        """When the entry of ``result`` stops being served."""
+        now = time.time()
+        expires = url_expiry(result.file_url)
+        if expires is None:
+            return now + self.ttl
+        return min(now + self.ttl, expires - self.margin)
+
+    def get(self, digest: str, mime_type: Optional[str]) -> Optional[FileResult]:
+        key = self.key(digest, mime_type)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.path is not None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            if entry is not None and entry[1] <= now:
+                self._entries.pop(key, None)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return entry[0]
+
+    def set(self, digest: str, mime_type: Optional[str], result: FileResult) -> None:
+        expires = self.expiry(result)
+        if expires <= time.time():
+            return
+        key = self.key(digest, mime_type)
+        with self._lock:
+            self._remember(key, (result, expires))
+            if self.path is not None:
+                try:
+                    db = self._connect()
+                    db.execute("BEGIN IMMEDIATE")
+                    try:
+                        db.execute(
+                            "INSERT OR REPLACE INTO uploads (key, result, expires) "
+                            "VALUES (?, ?, ?)",
+                            (key, result.model_dump_json(), expires),
+                        )
+                        self._prune(db)
+                    except BaseException:
+                        db.execute("ROLLBACK")
+                        raise
+                    db.execute("COMMIT")
+                except sqlite3.Error as e:
+                    logger.warning(f"Upload cache write failed: {e}")
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        """Delete the expired rows, then the soonest to expire over the cap."""
+        db.execute("DELETE FROM uploads WHERE expires <= ?", (time.time(),))
+        db.execute(
+            "DELETE FROM uploads WHERE key NOT IN "
+            "(SELECT key FROM uploads ORDER BY expires DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def _remember(self, key: str, entry: Tuple[FileResult, float]) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def _load(self, key: str) -> Optional[Tuple[FileResult, float]]:
+        try:
+            db = self._connect()
+            row = db.execute(
+                "SELECT result, expires FROM uploads WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] <= time.time():
+                db.execute("DELETE FROM uploads WHERE expires <= ?", (time.time(),))
+                return None
+        except sqlite3.Error as e:
+            logger.warning(f"Upload cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        return FileResult.model_validate_json(row[0]), row[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self.path is not None:
+                try:
+                    self._connect().execute("DELETE FROM uploads")
+                except sqlite3.Error as e:
+                    logger.warning(f"Upload cache clear failed: {e}")
+
+    def stats(self) -> UploadCacheStats:
+        with self._lock:
+            return UploadCacheStats(
+                hits=self._hits, misses=self._misses, entries=len(self._entries)
+            )
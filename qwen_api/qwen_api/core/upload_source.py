@@ -0,0 +1,333 @@
+"""
+Sources of file uploads, read in chunks.
+
+An ``UploadSource`` knows the size of the bytes to upload and hands out a
+fresh reader of them for every attempt of the upload, without ever holding
+them in memory: files are read from disk, buffers are sliced, base64
+strings are decoded chunk by chunk, and iterators and unseekable streams
+are spooled to a temporary file (in memory while small) on the way, as
+their size has to be known before the upload starts.
+"""
+
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from typing import (
+    AsyncIterable,
+    BinaryIO,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    Union,
+)
+
+from .exceptions import QwenAPIError
+
+# Size of the chunks read from a source
+READ_CHUNK_SIZE = 1024 * 1024
+# Spooled sources larger than this are moved from memory to a temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# Base64 characters decoded at once, a multiple of 4
+BASE64_CHUNK_SIZE = 4 * 256 * 1024
+
+DEFAULT_FILENAME = "uploaded_file"
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+_NOT_BASE64 = re.compile(r"[^A-Za-z0-9+/=]")
+
+UploadInput = Union[str, "os.PathLike[str]", bytes, bytearray, memoryview, BinaryIO]
+
+
+class ChunkReader:
+    """File-like reader over chunks of bytes of a known total size."""
+
+    def __init__(self, chunks: Iterable[bytes], size: int):
+        self._chunks = iter(chunks)
+        self._size = size
+        self._chunk = memoryview(b"")
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def read(self, amt: Optional[int] = -1) -> bytes:
+        if amt is None:
+            amt = -1
+        parts = []
+        while amt != 0:
+            if self._pos >= len(self._chunk):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._chunk = memoryview(chunk).cast("B")
+                self._pos = 0
+                continue
+            end = len(self._chunk)
+            if amt > 0:
+                end = min(end, self._pos + amt)
+                amt -= end - self._pos
+            parts.append(self._chunk[self._pos : end])
+            self._pos = end
+        return b"".join(parts)
+
+
+def _decode_base64(data: str) -> Iterator[bytes]:
+    """Decode ``data`` in chunks, skipping characters outside the alphabet."""
+    carry = ""
+    for start in range(0, len(data), BASE64_CHUNK_SIZE):
+        piece = data[start : start + BASE64_CHUNK_SIZE]
+        if _NOT_BASE64.search(piece):
+            piece = _NOT_BASE64.sub("", piece)
+        piece = carry + piece
+        cut = len(piece) - len(piece) % 4
+        carry = piece[cut:]
+        if cut:
+            yield base64.b64decode(piece[:cut])
+    if carry:
+        raise binascii.Error("Incorrect padding")
+
+
+def _base64_size(data: str) -> Optional[int]:
+    """Decoded size of ``data``, ``None`` unless it is plain padded base64."""
+    if len(data) % 4 or _BASE64.fullmatch(data) is None:
+        return None
+    return len(data) // 4 * 3 - (len(data) - len(data.rstrip("=")))
+
+
+class UploadSource:
+    """
+    Bytes of an upload, of a known size, that can be read more than once.
+
+    Use the ``from_*`` constructors or :func:`upload_source`, and close the
+    source (or use it as a context manager) once uploaded, which closes the
+    files it opened itself.
+
+    Args:
+        filename: name the file is uploaded as.
+        size: number of bytes.
+        rewind: returns a reader of the bytes from their start.
+        mime_type: MIME type, guessed from ``filename`` when not given, and
+            ``None`` when it cannot be guessed.
+        on_close: releases what the source holds.
+        fingerprint: identifies the bytes without reading them, like the
+            path and modification time of a file, ``None`` when unknown.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        size: int,
+        rewind: Callable[[], BinaryIO],
+        mime_type: Optional[str] = None,
+        on_close: Optional[Callable[[], None]] = None,
+        fingerprint: Optional[str] = None,
+    ):
+        self.filename = filename
+        self.size = size
+        self.mime_type = mime_type or mimetypes.guess_type(filename)[0]
+        self.fingerprint = fingerprint
+        self._rewind = rewind
+        self._on_close = on_close
+
+    @classmethod
+    def from_path(cls, path: str, filename: Optional[str] = None) -> "UploadSource":
+        if not os.path.isfile(path):
+            raise QwenAPIError(f"File {path} does not exist")
+        stat = os.stat(path)
+        handle: Optional[BinaryIO] = None
+
+        def rewind() -> BinaryIO:
+            nonlocal handle
+            if handle is None:
+                handle = open(path, "rb")
+            handle.seek(0)
+            return handle
+
+        def close() -> None:
+            if handle is not None:
+                handle.close()
+
+        return cls(
+            filename or os.path.basename(path),
+            stat.st_size,
+            rewind,
+            on_close=close,
+            fingerprint=f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}",
+        )
+
+    @classmethod
+    def from_buffer(
+        cls,
+        data: Union[bytes, bytearray, memoryview],
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+    ) -> "UploadSource":
+        view = memoryview(data).cast("B")
+
+        def rewind() -> ChunkReader:
+            chunks = (
+                view[start : start + READ_CHUNK_SIZE]
+                for start in range(0, len(view), READ_CHUNK_SIZE)
+            )
+            return ChunkReader(chunks, len(view))
+
+        return cls(filename or DEFAULT_FILENAME, len(view), rewind, mime_type)
+
+    @classmethod
+    def from_file(
+        cls, file: BinaryIO, filename: Optional[str] = None
+    ) -> "UploadSource":
+        """
+        Source reading an open binary file from its current position. The
+        file is left open. Unseekable files are spooled.
+        """
+        if filename is None:
+            name = getattr(file, "name", None)
+            filename = os.path.basename(name) if isinstance(name, str) else None
+        seekable = getattr(file, "seekable", None)
+        if seekable is None or not seekable():
+            return cls.from_iterable(
+                iter(lambda: file.read(READ_CHUNK_SIZE), b""), filename
+            )
+        start = file.tell()
+        size = file.seek(0, os.SEEK_END) - start
+        file.seek(start)
+
+        def rewind() -> BinaryIO:
+            file.seek(start)
+            return file
+
+        return cls(filename or DEFAULT_FILENAME, size, rewind)
+
+    @classmethod
+    def from_iterable(
+        cls,
+        chunks: Iterable[bytes],
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+    ) -> "UploadSource":
+        """Source spooling an iterable of byte chunks, read only once."""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            for chunk in chunks:
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        return cls._spooled(spool, filename, mime_type)
+
+    @classmethod
+    async def from_async_iterable(
+        cls,
+        chunks: AsyncIterable[bytes],
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+    ) -> "UploadSource":
+        """Async version of :meth:`from_iterable`."""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            async for chunk in chunks:
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        return cls._spooled(spool, filename, mime_type)
+
+    @classmethod
+    def _spooled(
+        cls, spool, filename: Optional[str], mime_type: Optional[str]
+    ) -> "UploadSource":
+        size = spool.tell()
+
+        def rewind() -> BinaryIO:
+            spool.seek(0)
+            return spool
+
+        return cls(filename or DEFAULT_FILENAME, size, rewind, mime_type, spool.close)
+
+    @classmethod
+    def from_base64(cls, data: str) -> "UploadSource":
+        """
+        Source decoding base64 ``data``, optionally a ``data:image/...`` URI,
+        in chunks. Data that is not plain padded base64 (line breaks, for
+        instance) is decoded once into a spool, as its size is not known
+        up front.
+        """
+        # The type of a data URI only names the file, the upload itself is
+        # sent as image/png
+        filename = "uploaded_image.png"
+        if data.startswith("data:image/") and "," in data:
+            header, data = data.split(",", 1)
+            ext = header.split(";")[0].split("/")[-1].lower()
+            if ext in ["jpeg", "jpg"]:
+                filename = "uploaded_image.jpg"
+            elif ext in ["gif", "webp"]:
+                filename = f"uploaded_image.{ext}"
+
+        size = _base64_size(data)
+        try:
+            if size is None:
+                return cls.from_iterable(_decode_base64(data), filename, "image/png")
+        except binascii.Error as e:
+            raise QwenAPIError(f"Invalid base64 data: {e}")
+
+        def rewind() -> ChunkReader:
+            return ChunkReader(_decode_base64(data), size)
+
+        return cls(filename, size, rewind, "image/png")
+
+    def reader(self) -> BinaryIO:
+        """Reader of the bytes from their start, for one upload attempt."""
+        return self._rewind()
+
+    def chunks(self, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        reader = self.reader()
+        remaining = self.size
+        while remaining > 0:
+            chunk = reader.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def sha256(self) -> str:
+        digest = hashlib.sha256()
+        for chunk in self.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def close(self) -> None:
+        if self._on_close is not None:
+            self._on_close()
+
+    def __enter__(self) -> "UploadSource":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def upload_source(
+    file: Union[UploadInput, Iterable[bytes]], filename: Optional[str] = None
+) -> UploadSource:
+    """
+    Source of a path, an open binary file, a bytes-like object or an
+    iterable of byte chunks. An ``UploadSource`` is returned as is, and
+    stays its owner's to close.
+    """
+    if isinstance(file, UploadSource):
+        return file
+    if isinstance(file, (str, os.PathLike)):
+        return UploadSource.from_path(os.fspath(file), filename)
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return UploadSource.from_buffer(file, filename)
+    if hasattr(file, "read"):
+        return UploadSource.from_file(file, filename)
+    if isinstance(file, Iterable):
+        return UploadSource.from_iterable(file, filename)
+    raise QwenAPIError(f"Cannot upload a {type(file).__name__}")
@@ -0,0 +1,185 @@
+"""
+Conversion of chat messages to the wire format of the completions endpoint.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Literal, Optional, Union
+from pydantic import ValidationError
+from typing_extensions import NotRequired, Required, TypedDict
+from .exceptions import QwenAPIError
+from .types.chat import ChatMessage, MessageRole
+from ..utils.promp_system import WEB_DEVELOPMENT_PROMPT
+
+
+def message_to_wire(message: Union[ChatMessage, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convert a ``ChatMessage`` (or a dict of its fields) to the dict sent in
+    the ``messages`` list of the payload.
+    """
+    if isinstance(message, dict):
+        try:
+            validated_msg = ChatMessage(**message)
+        except ValidationError as e:
+            raise QwenAPIError(f"Error validating message: {e}")
+    else:
+        validated_msg = message
+
+    if validated_msg.role == "system":
+        if (
+            validated_msg.web_development
+            and validated_msg.content
+            and WEB_DEVELOPMENT_PROMPT not in validated_msg.content
+        ):
+            updated_content = f"{validated_msg.content}\n\n{WEB_DEVELOPMENT_PROMPT}"
+            validated_msg = ChatMessage(
+                **{**validated_msg.model_dump(), "content": updated_content}
+            )
+
+    return {
+        "role": (
+            MessageRole.FUNCTION
+            if validated_msg.role == MessageRole.TOOL
+            else (
+                validated_msg.role
+                if validated_msg.role == MessageRole.SYSTEM
+                else MessageRole.USER
+            )
+        ),
+        "content": (
+            validated_msg.blocks[0].text
+            if len(validated_msg.blocks) == 1
+            and validated_msg.blocks[0].block_type == "text"
+            else [
+                (
+                    {"type": "text", "text": block.text}
+                    if block.block_type == "text"
+                    else (
+                        {"type": "image", "image": str(block.url)}
+                        if block.block_type == "image"
+                        else {"type": block.block_type}
+                    )
+                )
+                for block in validated_msg.blocks
+            ]
+        ),
+        "chat_type": (
+            "artifacts"
+            if getattr(validated_msg, "web_development", False)
+            else ("search" if getattr(validated_msg, "web_search", False) else "t2t")
+        ),
+        "feature_config": {
+            "thinking_enabled": getattr(validated_msg, "thinking", False),
+            "thinking_budget": getattr(validated_msg, "thinking_budget", 0),
+            "output_schema": getattr(validated_msg, "output_schema", None),
+        },
+        "extra": {},
+    }
+
+
+class ContentPart(TypedDict, total=False):
+    """OpenAI-style content part (``text``, ``image_url`` or ``image``)."""
+
+    type: Required[str]
+    text: str
+    image_url: Union[str, Dict[str, str]]
+    image: str
+
+
+class MessageDict(TypedDict):
+    """OpenAI-style message accepted by the ``validate=False`` fast path."""
+
+    role: str
+    content: Union[str, List[ContentPart]]
+    web_search: NotRequired[bool]
+    web_development: NotRequired[bool]
+    thinking: NotRequired[bool]
+    thinking_budget: NotRequired[Optional[int]]
+    output_schema: NotRequired[Optional[Literal["phase"]]]
+
+
+_WIRE_ROLES = {
+    "system": MessageRole.SYSTEM,
+    "tool": MessageRole.FUNCTION,
+}
+
+
+def _part_to_wire(part: Any) -> Dict[str, Any]:
+    if isinstance(part, str):
+        return {"type": "text", "text": part}
+    part_type = part.get("type") if isinstance(part, dict) else None
+    if part_type == "text":
+        return {"type": "text", "text": part["text"]}
+    if part_type == "image_url":
+        image_url = part["image_url"]
+        return {
+            "type": "image",
+            "image": image_url["url"] if isinstance(image_url, dict) else image_url,
+        }
+    if part_type == "image":
+        return {"type": "image", "image": part["image"]}
+    raise QwenAPIError(f"Unsupported content part: {part!r}")
+
+
+def dict_to_wire(message: MessageDict) -> Dict[str, Any]:
+    """
+    Map a trusted OpenAI-style message dict straight to the wire format.
+
+    This skips ``ChatMessage`` construction and validation entirely and only
+    checks what is needed to build the payload. The output matches
+    :func:`message_to_wire` for the equivalent ``ChatMessage``.
+    """
+    try:
+        role = message["role"]
+        content = message["content"]
+    except (KeyError, TypeError):
+        raise QwenAPIError(f"Message must have 'role' and 'content': {message!r}")
+
+    web_development = message.get("web_development", False)
+    if isinstance(content, str):
+        if (
+            role == "system"
+            and web_development
+            and content
+            and WEB_DEVELOPMENT_PROMPT not in content
+        ):
+            content = f"{content}\n\n{WEB_DEVELOPMENT_PROMPT}"
+    elif isinstance(content, list):
+        content = [_part_to_wire(part) for part in content]
+        if len(content) == 1 and content[0]["type"] == "text":
+            content = content[0]["text"]
+    else:
+        raise QwenAPIError(f"Invalid message content: {content!r}")
+
+    return {
+        "role": _WIRE_ROLES.get(role, MessageRole.USER),
+        "content": content,
+        "chat_type": (
+            "artifacts"
+            if web_development
+            else ("search" if message.get("web_search", False) else "t2t")
+        ),
+        "feature_config": {
+            "thinking_enabled": message.get("thinking", False),
+            "thinking_budget": message.get("thinking_budget"),
+            "output_schema": message.get("output_schema"),
+        },
+        "extra": {},
+    }
+
+
+def build_payload_head(
+    model: str, temperature: float, max_tokens: Optional[int]
+) -> Dict[str, Any]:
+    """Every payload field except ``messages``."""
+    return {
+        "stream": True,
+        "model": model,
+        "incremental_output": True,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+
+def payload_key(data: bytes) -> str:
+    """Hash of an encoded payload, identifying identical requests."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
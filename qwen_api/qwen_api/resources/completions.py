@@ -1,14 +1,18 @@
-import os
-import mimetypes
 import datetime as dt
-import aiohttp
-import requests
 import asyncio
+import threading
+import time
+from functools import partial
 from oss2.utils import http_date
 from oss2.utils import content_type_by_name
-from oss2 import Auth, Bucket
+from concurrent.futures import ThreadPoolExecutor
+from oss2 import Bucket, PartIterator
+from oss2.exceptions import OssError, RequestError
+from oss2.models import PartInfo
 from typing import (
     AsyncGenerator,
+    AsyncIterable,
+    Callable,
     Dict,
     Generator,
     List,
@@ -17,63 +21,267 @@ from typing import (
     Iterable,
     overload,
     Literal,
+    TypeVar,
 )
 from ..core.types.upload_file import FileResult
-from ..core.exceptions import QwenAPIError, RateLimitError
+from ..core.multipart import UploadCheckpoint, read_exactly, skip_bytes
+from ..core.upload_source import UploadInput, UploadSource, upload_source
+from ..core.exceptions import QwenAPIError, RateLimitError, StreamTimeoutError
+from ..core.response_cache import areplay, arecord, record
+from ..core.retry import parse_retry_after
+from ..core.timeouts import Timeouts
 from ..core.types.chat import (
     ChatResponseStream,
     ChatResponse,
     ChatMessage,
     Choice,
     Message,
+    StreamChunk,
 )
 from ..core.types.chat_model import ChatModel
 from ..core.types.endpoint_api import EndpointAPI
 from ..core.types.response.tool_param import ToolParam
+from ..core.conversation import Conversation
+from ..core.wire import MessageDict, payload_key
+from ..core.stream import AsyncChatStream, ChatStream, StreamMode, TextAccumulator
 from .tool_handle import using_tools, async_using_tools
 
+T = TypeVar("T")
+
+
+def _tool_stream_chunk(tool_response: ChatResponse) -> StreamChunk:
+    message = tool_response.choices.message
+    return StreamChunk(message.role, message.content, tool_calls=message.tool_calls)
+
 
 class Completion:
     def __init__(self, client):
         self._client = client
 
+    def _oss_call(self, call: Callable[[], T]) -> T:
+        """An OSS request retried per the client's retry policy."""
+        policy = self._client.retry_policy
+        retry = policy.start()
+        while True:
+            self._client.rate_limiter.acquire()
+            try:
+                return call()
+            except OssError as e:
+                if isinstance(e, RequestError) or e.status in policy.retry_statuses:
+                    delay = retry.backoff(parse_retry_after(e.headers or {}))
+                    if delay is not None:
+                        self._client.logger.warning(
+                            f"Upload failed ({e.status}), "
+                            f"retry {retry.attempt} in {delay:.2f}s"
+                        )
+                        time.sleep(delay)
+                        continue
+                if e.status == 429:
+                    self._client.logger.error("Too many requests")
+                    raise RateLimitError("Too many requests") from e
+                raise
+
+    def _put_object(
+        self, bucket: Bucket, key: str, source: UploadSource, headers: dict
+    ):
+        """
+        ``bucket.put_object``, retried. The bytes are streamed from
+        ``source``, read again from their start on every attempt.
+        """
+        return self._oss_call(
+            lambda: bucket.put_object(key=key, data=source.reader(), headers=headers)
+        )
+
+    def _resume_multipart(self, checkpoint: UploadCheckpoint) -> None:
+        """
+        Check the parts of an interrupted upload against OSS, or reset the
+        checkpoint when its upload can no longer be resumed.
+        """
+        upload = checkpoint.upload
+        if upload is None:
+            return
+        bucket = self._client.oss_pool.bucket(
+            upload["region"],
+            upload["bucketname"],
+            upload["access_key_id"],
+            upload["access_key_secret"],
+        )
+        headers = {"x-oss-security-token": upload["security_token"]}
+        try:
+            uploaded = {
+                part.part_number: part
+                for part in PartIterator(
+                    bucket, upload["file_path"], checkpoint.upload_id, headers=headers
+                )
+            }
+        except OssError as e:
+            self._client.logger.info(
+                f"Upload checkpoint not resumable ({e.status}), starting over"
+            )
+            checkpoint.reset()
+            return
+        checkpoint.parts = {
+            number: etag
+            for number, etag in checkpoint.parts.items()
+            if number in uploaded
+            and uploaded[number].etag == etag
+            and uploaded[number].size == checkpoint.part_range(number)[1]
+        }
+        self._client.logger.info(
+            f"Resuming upload of {upload['file_path']}: "
+            f"{len(checkpoint.parts)}/{checkpoint.part_count} parts done"
+        )
+
+    def _put_multipart(
+        self,
+        bucket: Bucket,
+        upload: dict,
+        source: UploadSource,
+        headers: dict,
+        checkpoint: UploadCheckpoint,
+    ):
+        """
+        Upload ``source`` in parts over a bounded thread pool, recording the
+        finished parts in ``checkpoint``.
+        """
+        key = upload["file_path"]
+        token_headers = {"x-oss-security-token": headers["x-oss-security-token"]}
+        if checkpoint.upload_id is None:
+            checkpoint.upload = upload
+            checkpoint.upload_id = self._oss_call(
+                lambda: bucket.init_multipart_upload(key, headers=headers)
+            ).upload_id
+            checkpoint.save()
+        upload_id = checkpoint.upload_id
+
+        def upload_part(number: int, data: bytes) -> None:
+            result = self._oss_call(
+                lambda: bucket.upload_part(
+                    key, upload_id, number, data, headers=token_headers
+                )
+            )
+            checkpoint.add_part(number, result.etag)
+
+        max_workers = self._client.multipart_policy.max_workers
+        # Parts read but not uploaded yet, which bounds the memory held
+        pending = threading.BoundedSemaphore(max_workers)
+        failed = threading.Event()
+
+        def part_done(future) -> None:
+            if future.exception() is not None:
+                failed.set()
+            pending.release()
+
+        reader = source.reader()
+        futures = []
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="qwen-upload"
+        ) as pool:
+            for number in range(1, checkpoint.part_count + 1):
+                _, length = checkpoint.part_range(number)
+                if number in checkpoint.parts:
+                    skip_bytes(reader, length)
+                    continue
+                pending.acquire()
+                if failed.is_set():
+                    pending.release()
+                    break
+                future = pool.submit(upload_part, number, read_exactly(reader, length))
+                future.add_done_callback(part_done)
+                futures.append(future)
+        for future in futures:
+            future.result()
+
+        parts = [
+            PartInfo(number, etag) for number, etag in sorted(checkpoint.parts.items())
+        ]
+        result = self._oss_call(
+            lambda: bucket.complete_multipart_upload(
+                key, upload_id, parts, headers=token_headers
+            )
+        )
+        checkpoint.remove()
+        return result
+
     @overload
     def create(
         self,
-        messages: List[ChatMessage],
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
         model: ChatModel = "qwen-max-latest",
         stream: Literal[False] = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2048,
         tools: Optional[Iterable[ToolParam]] | Optional[List[Dict]] = None,
+        stream_mode: StreamMode = "cumulative",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
     ) -> ChatResponse: ...
 
     @overload
     def create(
         self,
-        messages: List[ChatMessage],
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
         model: ChatModel = "qwen-max-latest",
         stream: Literal[True] = True,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2048,
         tools: Optional[Iterable[ToolParam]] | Optional[List[Dict]] = None,
+        stream_mode: Literal["cumulative"] = "cumulative",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
     ) -> Generator[ChatResponseStream, None, None]: ...
 
+    @overload
+    def create(
+        self,
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
+        model: ChatModel = "qwen-max-latest",
+        stream: Literal[True] = True,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = 2048,
+        tools: Optional[Iterable[ToolParam]] | Optional[List[Dict]] = None,
+        stream_mode: Literal["delta"] = "delta",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
+    ) -> ChatStream: ...
+
     def create(
         self,
-        messages: List[ChatMessage],
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
         model: ChatModel = "qwen-max-latest",
         stream: bool = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2048,
         tools: Optional[Iterable[ToolParam]] | Optional[List[Dict]] = None,
-    ) -> Union[ChatResponse, Generator[ChatResponseStream, None, None], None]:
+        stream_mode: StreamMode = "cumulative",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
+    ) -> Union[
+        ChatResponse, Generator[ChatResponseStream, None, None], ChatStream, None
+    ]:
+        if stream_mode not in ("cumulative", "delta"):
+            raise QwenAPIError(f"Invalid stream_mode: {stream_mode}")
+
+        timeouts = timeouts or self._client.timeouts
 
         if tools:
             # Directly use tools without selection logic
-            tool_response = using_tools(
-                messages, tools, model, temperature, max_tokens, stream, self._client
-            )
+            def call_tools():
+                return using_tools(
+                    messages,
+                    tools,
+                    model,
+                    temperature,
+                    max_tokens,
+                    stream,
+                    self._client,
+                    timeouts,
+                )
+
+            try:
+                tool_response = call_tools()
+            except StreamTimeoutError as e:
+                tool_response = self._client._retry_stalled(e, call_tools, timeouts)
 
             if stream:
                 # Convert ChatResponse to a generator for streaming compatibility
@@ -104,85 +312,186 @@ class Completion:
                     )
                     yield stream_response
 
+                if stream_mode == "delta":
+
+                    def tool_delta_generator():
+                        yield _tool_stream_chunk(tool_response)
+
+                    accumulator = TextAccumulator()
+                    accumulator.append(tool_response.choices.message.content)
+                    return ChatStream(tool_delta_generator(), accumulator)
                 return tool_stream_generator()
             else:
                 return tool_response
 
-        payload = self._client._build_payload(
+        payload = self._client._encode_payload(
             messages=messages,
             model=model,
             temperature=temperature,
             max_tokens=max_tokens,
+            validate=validate,
         )
+        key = payload_key(payload)
+        cache = self._client._cache_for(temperature)
+        semantic = self._client._semantic_cache_for(temperature)
+
+        def save(match, events):
+            # Store a response read to its end
+            if cache is not None:
+                cache.set(key, events)
+            if match is not None:
+                semantic.add(match, events)
+
+        def send():
+            return self._client._post(
+                EndpointAPI.completions,
+                payload=payload,
+                hold_stream=True,
+                timeouts=timeouts,
+                model=model,
+            )
 
-        response = requests.post(
-            url=self._client.base_url + EndpointAPI.completions,
-            headers=self._client._build_headers(),
-            json=payload,
-            timeout=self._client.timeout,
-            stream=stream,
-        )
+        def open_upstream(match=None):
+            # Only non-streaming calls are hedged
+            if stream or self._client.hedge_policy is None:
+                response = send()
+                events = self._client._iter_events(response)
+            else:
+                response, events = self._client._hedged(
+                    send, self._client.hedge_policy
+                )
+            self._client.logger.info(f"Response: {response.status_code}")
+            if cache is not None or match is not None:
+                events = record(events, partial(save, match))
+            return response, events
+
+        def open_response():
+            if cache is not None:
+                cached = cache.get(key)
+                if cached is not None:
+                    self._client.logger.info("Response served from cache")
+                    return None, iter(cached)
+            match = semantic.match(payload) if semantic is not None else None
+            if match is not None and match.events is not None:
+                self._client.logger.info(
+                    f"Response served from semantic cache ({match.similarity:.3f})"
+                )
+                return None, iter(match.events)
+            # Identical requests in flight share one upstream response
+            if self._client.coalescer is None:
+                return open_upstream(match)
+            return None, self._client.coalescer.subscribe(
+                key, partial(open_upstream, match)
+            )
 
-        if not response.ok:
-            error_text = response.json()
-            self._client.logger.error(f"API Error: {response.status_code} {error_text}")
-            raise QwenAPIError(f"API Error: {response.status_code} {error_text}")
+        if stream:
+            accumulator = TextAccumulator() if stream_mode == "delta" else None
 
-        if response.status_code == 429:
-            self._client.logger.error("Too many requests")
-            raise RateLimitError("Too many requests")
+            def reopen():
+                response, events = open_response()
+                return self._client._process_stream(response, accumulator, events)
 
-        self._client.logger.info(f"Response: {response.status_code}")
+            chunks = self._client._retry_stalled_stream(reopen(), reopen, timeouts)
+            if accumulator is not None:
+                return ChatStream(chunks, accumulator)
+            return chunks
+
+        def complete():
+            return self._client._process_response(*open_response())
+
+        try:
+            response, events = open_response()
+        except StreamTimeoutError as e:
+            return self._client._retry_stalled(e, complete, timeouts)
 
-        if stream:
-            return self._client._process_stream(response)
         try:
-            return self._client._process_response(response)
+            return self._client._process_response(response, events)
+        except StreamTimeoutError as e:
+            return self._client._retry_stalled(e, complete, timeouts)
         except Exception as e:
             self._client.logger.error(f"Error: {e}")
 
     @overload
     async def acreate(
         self,
-        messages: List[ChatMessage],
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
         model: ChatModel = "qwen-max-latest",
         stream: Literal[False] = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2048,
         tools: Optional[Iterable[ToolParam]] | List[Dict] = None,
+        stream_mode: StreamMode = "cumulative",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
     ) -> ChatResponse: ...
 
     @overload
     async def acreate(
         self,
-        messages: List[ChatMessage],
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
         model: ChatModel = "qwen-max-latest",
         stream: Literal[True] = True,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2048,
         tools: Optional[Iterable[ToolParam]] | List[Dict] = None,
+        stream_mode: Literal["cumulative"] = "cumulative",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
     ) -> AsyncGenerator[ChatResponseStream, None]: ...
 
+    @overload
     async def acreate(
         self,
-        messages: List[ChatMessage],
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
+        model: ChatModel = "qwen-max-latest",
+        stream: Literal[True] = True,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = 2048,
+        tools: Optional[Iterable[ToolParam]] | List[Dict] = None,
+        stream_mode: Literal["delta"] = "delta",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
+    ) -> AsyncChatStream: ...
+
+    async def acreate(
+        self,
+        messages: Union[List[ChatMessage], List[MessageDict], Conversation],
         model: ChatModel = "qwen-max-latest",
         stream: bool = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2048,
         tools: Optional[Iterable[ToolParam]] | List[Dict] = None,
-    ) -> Union[ChatResponse, AsyncGenerator[ChatResponseStream, None], None]:
-        session = None
+        stream_mode: StreamMode = "cumulative",
+        validate: bool = True,
+        timeouts: Optional[Timeouts] = None,
+    ) -> Union[
+        ChatResponse, AsyncGenerator[ChatResponseStream, None], AsyncChatStream, None
+    ]:
+        if stream_mode not in ("cumulative", "delta"):
+            raise QwenAPIError(f"Invalid stream_mode: {stream_mode}")
+
+        timeouts = timeouts or self._client.timeouts
+        response = None
         try:
             if tools:
-                tool_response = await async_using_tools(
-                    messages,
-                    tools,
-                    model,
-                    temperature,
-                    max_tokens,
-                    self._client,
-                )
+
+                async def call_tools():
+                    return await async_using_tools(
+                        messages,
+                        tools,
+                        model,
+                        temperature,
+                        max_tokens,
+                        self._client,
+                        timeouts,
+                    )
+
+                try:
+                    tool_response = await call_tools()
+                except StreamTimeoutError as e:
+                    tool_response = await self._client._aretry_stalled(
+                        e, call_tools, timeouts
+                    )
 
                 if stream:
                     # Convert ChatResponse to an async generator for streaming compatibility
@@ -213,157 +522,174 @@ class Completion:
                         )
                         yield stream_response
 
+                    if stream_mode == "delta":
+
+                        async def tool_adelta_generator():
+                            yield _tool_stream_chunk(tool_response)
+
+                        accumulator = TextAccumulator()
+                        accumulator.append(tool_response.choices.message.content)
+                        return AsyncChatStream(tool_adelta_generator(), accumulator)
                     return tool_astream_generator()
                 else:
                     return tool_response
             else:
 
-                payload = self._client._build_payload(
+                payload = self._client._encode_payload(
                     messages=messages,
                     model=model,
                     temperature=temperature,
                     max_tokens=max_tokens,
+                    validate=validate,
                 )
+                key = payload_key(payload)
+                cache = self._client._cache_for(temperature)
+                semantic = self._client._semantic_cache_for(temperature)
+
+                def save(match, events):
+                    # Store a response read to its end
+                    if cache is not None:
+                        cache.set(key, events)
+                    if match is not None:
+                        semantic.add(match, events)
+
+                async def send():
+                    return await self._client._apost(
+                        EndpointAPI.completions,
+                        payload=payload,
+                        hold_stream=True,
+                        model=model,
+                        timeouts=timeouts,
+                    )
 
-                session = aiohttp.ClientSession()
-                # Track this session
-                self._client._active_sessions.append(session)
+                async def open_upstream(match=None):
+                    # Only non-streaming calls are hedged
+                    if stream or self._client.hedge_policy is None:
+                        upstream = await send()
+                        events = self._client._aiter_events(upstream)
+                    else:
+                        upstream, events = await self._client._ahedged(
+                            send, self._client.hedge_policy
+                        )
+                    self._client.logger.info(f"Response status: {upstream.status}")
+                    if cache is not None or match is not None:
+                        events = arecord(events, partial(save, match))
+                    return upstream, events
+
+                async def open_response():
+                    if cache is not None:
+                        cached = cache.get(key)
+                        if cached is not None:
+                            self._client.logger.info("Response served from cache")
+                            return None, areplay(cached)
+                    match = None
+                    if semantic is not None:
+                        # Embedding is CPU-bound, keep it off the event loop
+                        match = await asyncio.get_running_loop().run_in_executor(
+                            None, semantic.match, payload
+                        )
+                    if match is not None and match.events is not None:
+                        self._client.logger.info(
+                            "Response served from semantic cache "
+                            f"({match.similarity:.3f})"
+                        )
+                        return None, areplay(match.events)
+                    # Identical requests in flight share one upstream response
+                    if self._client.coalescer is None:
+                        return await open_upstream(match)
+                    return None, await self._client.coalescer.asubscribe(
+                        key, partial(open_upstream, match)
+                    )
 
-                response = await session.post(
-                    url=self._client.base_url + EndpointAPI.completions,
-                    headers=self._client._build_headers(),
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=self._client.timeout),
-                )
+                if stream:
+                    accumulator = TextAccumulator() if stream_mode == "delta" else None
+
+                    async def reopen():
+                        response, events = await open_response()
+                        return self._client._process_astream(
+                            response, accumulator, events
+                        )
 
-                if not response.ok:
-                    error_text = await response.text()
-                    self._client.logger.error(
-                        f"API Error: {response.status} {error_text}"
+                    chunks = self._client._aretry_stalled_stream(
+                        await reopen(), reopen, timeouts
                     )
-                    raise QwenAPIError(f"API Error: {response.status} {error_text}")
+                    if accumulator is not None:
+                        return AsyncChatStream(chunks, accumulator)
+                    return chunks
 
-                if response.status == 429:
-                    self._client.logger.error("Too many requests")
-                    raise RateLimitError("Too many requests")
+                async def complete():
+                    return await self._client._process_aresponse(
+                        *await open_response()
+                    )
 
-                self._client.logger.info(f"Response status: {response.status}")
+                try:
+                    response, events = await open_response()
+                except StreamTimeoutError as e:
+                    return await self._client._aretry_stalled(e, complete, timeouts)
 
-                if stream:
-                    return self._client._process_astream(response, session)
                 try:
-                    return await self._client._process_aresponse(response, session)
+                    return await self._client._process_aresponse(response, events)
+                except StreamTimeoutError as e:
+                    return await self._client._aretry_stalled(e, complete, timeouts)
                 except Exception as e:
                     self._client.logger.error(f"Error: {e}")
 
         except Exception as e:
             self._client.logger.error(f"Error in acreate: {e}")
-            if session and not session.closed:
-                # Remove from active sessions
-                if session in self._client._active_sessions:
-                    self._client._active_sessions.remove(session)
-                await session.close()
+            if response is not None:
+                self._client._release_response(response)
             raise
 
-    def upload_file(
-        self, file_path: Optional[str] = None, base64_data: Optional[str] = None
-    ):
-        if not file_path and not base64_data:
-            raise QwenAPIError("Either file_path or base64_data must be provided")
-
-        # If base64_data is provided, process it directly
+    @staticmethod
+    def _upload_source(
+        file_path: Optional[str],
+        base64_data: Optional[str],
+        file: Union[UploadInput, Iterable[bytes], None],
+        filename: Optional[str],
+    ) -> UploadSource:
+        if file is not None:
+            return upload_source(file, filename)
         if base64_data:
-            # Process base64 data
-            import base64
-            from io import BytesIO
-
-            # Check if this is a data URI and extract the base64 part
-            if base64_data.startswith("data:image/"):
-                try:
-                    header, data = base64_data.split(",", 1)
-                    mime_type = header.split(";")[0].split(":")[1]
-                    is_base64 = True
-                except QwenAPIError:
-                    # Invalid data URI format, treat as regular base64 string
-                    mime_type = "image/png"  # Default if we can't parse
-                    data = base64_data
-                    is_base64 = False
-            else:
-                data = base64_data
-                mime_type = "image/png"
-                is_base64 = True
-
-            # Decode the base64 data
-            try:
-                file_content = base64.b64decode(data)
-            except Exception as e:
-                raise QwenAPIError(f"Invalid base64 data: {e}")
-
-            # Create a temporary file name
-            filename = "uploaded_image.png"
-            if ";" in mime_type:
-                mime_type = mime_type.split(";")[0]
-
-            if "/" in mime_type:
-                ext = mime_type.split("/")[-1].lower()
-                if ext in ["jpeg", "jpg"]:
-                    filename = f"uploaded_image.jpg"
-                elif ext == "png":
-                    filename = f"uploaded_image.png"
-                elif ext == "gif":
-                    filename = f"uploaded_image.gif"
-                elif ext == "webp":
-                    filename = f"uploaded_image.webp"
-
-            # Get file size
-            file_size = len(file_content)
-
-        elif file_path and os.path.isfile(file_path):
-            # Read file content
-            with open(file_path, "rb") as file:
-                file_content = file.read()
-
-            file_size = os.path.getsize(file_path)
-            filename = os.path.basename(file_path)
-
-        else:
-            raise QwenAPIError(f"File {file_path} does not exist")
-
-        detected_mime_type = None
-        if not base64_data and file_path:
-            detected_mime_type, _ = mimetypes.guess_type(file_path)
-
-        mime_type = detected_mime_type
-        if base64_data:
-            mime_type = mime_type or "image/png"
+            return UploadSource.from_base64(base64_data)
+        if file_path:
+            return UploadSource.from_path(file_path, filename)
+        raise QwenAPIError("Either file, file_path or base64_data must be provided")
 
+    def upload_file(
+        self,
+        file_path: Optional[str] = None,
+        base64_data: Optional[str] = None,
+        file: Union[UploadInput, Iterable[bytes], None] = None,
+        filename: Optional[str] = None,
+    ):
+        """
+        Upload a file to OSS from ``file_path``, ``base64_data`` or ``file``.
+
+        ``file`` is a path, an open binary file, a bytes-like object, an
+        iterable of byte chunks or an ``UploadSource``. Sources passed in
+        belong to the caller and are left open; the ones built here are
+        closed once uploaded.
+        """
+        source = self._upload_source(file_path, base64_data, file, filename)
+        if source is file:
+            return self._upload(source)
+        with source:
+            return self._upload(source)
+
+    def _request_upload(self, source: UploadSource) -> dict:
+        """Ask for the OSS location and credentials of an upload."""
         payload = {
-            "filename": filename,
-            "filesize": file_size,
-            "filetype": mime_type.split("/")[0] if mime_type else "image",
+            "filename": source.filename,
+            "filesize": source.size,
+            "filetype": source.mime_type.split("/")[0] if source.mime_type else "image",
         }
 
         headers = self._client._build_headers()
         headers["Content-Type"] = "application/json"
-        response = requests.post(
-            url=self._client.base_url + EndpointAPI.upload_file,
-            headers=headers,
-            json=payload,
-            timeout=self._client.timeout,
+        response = self._client._post(
+            EndpointAPI.upload_file, payload=payload, headers=headers
         )
 
-        if not response.ok:
-            try:
-                error_text = response.json()
-            except Exception:
-                error_text = response.text
-            self._client.logger.error(f"API Error: {response.status_code} {error_text}")
-            raise QwenAPIError(f"API Error: {response.status_code} {error_text}")
-
-        if response.status_code == 429:
-            self._client.logger.error("Too many requests")
-            raise RateLimitError("Too many requests")
-
         try:
             response_data = response.json()
         except Exception:
@@ -371,6 +697,36 @@ class Completion:
 
         if not isinstance(response_data, dict):
             raise QwenAPIError(f"Invalid response format: {response_data}")
+        return response_data
+
+    def _upload(self, source: UploadSource) -> FileResult:
+        filename = source.filename
+        mime_type = source.mime_type
+        # Files of unknown type are stored with the type OSS guesses from
+        # their name, and asked for as "image" uploads
+        content_type = mime_type or content_type_by_name(filename)
+
+        upload_cache = self._client.upload_cache
+        if upload_cache is not None:
+            digest = source.sha256()
+            cached = upload_cache.get(digest, mime_type)
+            if cached is not None:
+                self._client.logger.info(f"Upload of {filename} served from cache")
+                return cached
+
+        checkpoint = None
+        multipart = self._client.multipart_policy
+        if multipart.applies(source.size):
+            checkpoint = multipart.checkpoint(
+                source, digest if upload_cache is not None else None
+            )
+            self._resume_multipart(checkpoint)
+
+        if checkpoint is not None and checkpoint.upload is not None:
+            # Resume the upload to where the interrupted one was going
+            response_data = checkpoint.upload
+        else:
+            response_data = self._request_upload(source)
 
         # Extract credentials correctly
         access_key_id = response_data["access_key_id"]
@@ -392,21 +748,18 @@ class Completion:
         # Create minimal required headers for signing
         request_datetime = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
 
-        # Use oss2 library to generate signed headers instead of manual signing
-        endpoint = f"https://{region}.aliyuncs.com"
-        auth = Auth(access_key_id, access_key_secret)
-        bucket = Bucket(auth, endpoint, response_data["bucketname"])
+        # Use oss2 library to generate signed headers instead of manual signing,
+        # over the connections of the client's OSS pool
+        bucket = self._client.oss_pool.bucket(
+            region, response_data["bucketname"], access_key_id, access_key_secret
+        )
 
         # Get current date in OSS format
         date_str = http_date()
 
         # Create basic headers
         oss_headers = {
-            "Content-Type": (
-                mime_type or content_type_by_name(file_path)
-                if not base64_data
-                else mime_type
-            ),
+            "Content-Type": content_type,
             "Date": date_str,
             "x-oss-security-token": security_token,
             "x-oss-content-sha256": "UNSIGNED-PAYLOAD",
@@ -417,9 +770,14 @@ class Completion:
         oss_headers["date"] = request_datetime
 
         # Use the bucket's put_object method which handles signing automatically
-        oss_response = bucket.put_object(
-            key=response_data["file_path"], data=file_content, headers=oss_headers
-        )
+        if checkpoint is not None:
+            oss_response = self._put_multipart(
+                bucket, response_data, source, oss_headers, checkpoint
+            )
+        else:
+            oss_response = self._put_object(
+                bucket, response_data["file_path"], source, oss_headers
+            )
 
         # Add additional required headers for the OSS request
         oss_headers.update(
@@ -435,203 +793,173 @@ class Completion:
             self._client.logger.error(f"API Error: {oss_response.status} {error_text}")
             raise QwenAPIError(f"API Error: {oss_response.status} {error_text}")
 
-        if oss_response.status == 429:
-            self._client.logger.error("Too many requests")
-            raise RateLimitError("Too many requests")
-
         result = {
             "file_url": response_data["file_url"],
             "file_id": response_data["file_id"],
-            "image_mimetype": mime_type,
+            "image_mimetype": content_type,
         }
-        return FileResult(**result)
+        file_result = FileResult(**result)
+        if upload_cache is not None:
+            upload_cache.set(digest, mime_type, file_result)
+        return file_result
 
     async def async_upload_file(
-        self, file_path: Optional[str] = None, base64_data: Optional[str] = None
+        self,
+        file_path: Optional[str] = None,
+        base64_data: Optional[str] = None,
+        file: Union[UploadInput, Iterable[bytes], AsyncIterable[bytes], None] = None,
+        filename: Optional[str] = None,
     ):
-        if not file_path and not base64_data:
-            raise QwenAPIError("Either file_path or base64_data must be provided")
-
-        # If base64_data is provided, process it directly
-        if base64_data:
-            # Process base64 data
-            import base64
-            from io import BytesIO
-
-            # Check if this is a data URI and extract the base64 part
-            if base64_data.startswith("data:image/"):
-                try:
-                    header, data = base64_data.split(",", 1)
-                    mime_type = header.split(";")[0].split(":")[1]
-                    is_base64 = True
-                except QwenAPIError:
-                    # Invalid data URI format, treat as regular base64 string
-                    mime_type = "image/png"  # Default if we can't parse
-                    data = base64_data
-                    is_base64 = False
-            else:
-                data = base64_data
-                mime_type = "image/png"
-                is_base64 = True
-
-            # Decode the base64 data
-            try:
-                file_content = base64.b64decode(data)
-            except Exception as e:
-                raise QwenAPIError(f"Invalid base64 data: {e}")
-
-            # Create a temporary file name
-            filename = "uploaded_image.png"
-            if ";" in mime_type:
-                mime_type = mime_type.split(";")[0]
-
-            if "/" in mime_type:
-                ext = mime_type.split("/")[-1].lower()
-                if ext in ["jpeg", "jpg"]:
-                    filename = f"uploaded_image.jpg"
-                elif ext == "png":
-                    filename = f"uploaded_image.png"
-                elif ext == "gif":
-                    filename = f"uploaded_image.gif"
-                elif ext == "webp":
-                    filename = f"uploaded_image.webp"
-
-            # Get file size
-            file_size = len(file_content)
-
-        elif file_path and os.path.isfile(file_path):
-            # Read file content
-            with open(file_path, "rb") as file:
-                file_content = file.read()
-
-            file_size = os.path.getsize(file_path)
-            filename = os.path.basename(file_path)
-
-        detected_mime_type = None
-        if not base64_data and file_path:
-            detected_mime_type, _ = mimetypes.guess_type(file_path)
-
-        mime_type = detected_mime_type
-        if base64_data:
-            mime_type = mime_type or "image/png"
+        """Async version of :meth:`upload_file`, also taking async iterables."""
+        loop = asyncio.get_running_loop()
+        if isinstance(file, AsyncIterable):
+            source = await UploadSource.from_async_iterable(file, filename)
+        else:
+            # Spooling an iterator or decoding base64 would block the event
+            # loop
+            source = await loop.run_in_executor(
+                None, self._upload_source, file_path, base64_data, file, filename
+            )
+        if source is file:
+            return await self._aupload(source)
+        with source:
+            return await self._aupload(source)
 
+    async def _arequest_upload(self, source: UploadSource) -> dict:
+        """Async version of :meth:`_request_upload`."""
         payload = {
-            "filename": filename,
-            "filesize": file_size,
-            "filetype": mime_type.split("/")[0] if mime_type else "image",
+            "filename": source.filename,
+            "filesize": source.size,
+            "filetype": source.mime_type.split("/")[0] if source.mime_type else "image",
         }
 
         headers = self._client._build_headers()
         headers["Content-Type"] = "application/json"
 
-        async with aiohttp.ClientSession() as session:
-            response = await session.post(
-                url=self._client.base_url + EndpointAPI.upload_file,
-                headers=headers,
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=self._client.timeout),
+        async with await self._client._apost(
+            EndpointAPI.upload_file, payload=payload, headers=headers
+        ) as response:
+            return await response.json()
+
+    async def _aupload(self, source: UploadSource) -> FileResult:
+        loop = asyncio.get_running_loop()
+        filename = source.filename
+        mime_type = source.mime_type
+        # Files of unknown type are stored with the type OSS guesses from
+        # their name, and asked for as "image" uploads
+        content_type = mime_type or content_type_by_name(filename)
+
+        upload_cache = self._client.upload_cache
+        if upload_cache is not None:
+            # Hashing a large file would block the event loop
+            digest = await loop.run_in_executor(None, source.sha256)
+            cached = upload_cache.get(digest, mime_type)
+            if cached is not None:
+                self._client.logger.info(f"Upload of {filename} served from cache")
+                return cached
+
+        checkpoint = None
+        multipart = self._client.multipart_policy
+        if multipart.applies(source.size):
+            checkpoint = multipart.checkpoint(
+                source, digest if upload_cache is not None else None
             )
+            await loop.run_in_executor(None, self._resume_multipart, checkpoint)
 
-            if not response.ok:
-                error_text = response.json()
-                self._client.logger.error(f"API Error: {response.status} {error_text}")
-                raise QwenAPIError(f"API Error: {response.status} {error_text}")
-
-            if response.status == 429:
-                self._client.logger.error("Too many requests")
-                raise RateLimitError("Too many requests")
-
-            response_data = await response.json()
-
-            # Extract credentials correctly
-            access_key_id = response_data["access_key_id"]
-            access_key_secret = response_data["access_key_secret"]
-            region = response_data["region"]
-            bucket_name = response_data.get("bucketname", "qwen-webui-prod")
-
-            # Validate credentials
-            if not access_key_id:
-                raise QwenAPIError("AccessKey ID cannot be empty")
-            if not access_key_secret:
-                raise QwenAPIError("AccessKey Secret cannot be empty")
-
-            # Get security token from response data
-            security_token = response_data.get("security_token")
-            if not security_token:
-                raise QwenAPIError("Security token cannot be empty")
-
-            # Create minimal required headers for signing
-            request_datetime = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-
-            # Use oss2 library to generate signed headers instead of manual signing
-            endpoint = f"https://{region}.aliyuncs.com"
-            auth = Auth(access_key_id, access_key_secret)
-            bucket = Bucket(auth, endpoint, response_data["bucketname"])
-
-            # Get current date in OSS format
-            date_str = http_date()
-
-            # Create basic headers
-            oss_headers = {
-                "Content-Type": (
-                    mime_type or content_type_by_name(file_path)
-                    if not base64_data
-                    else mime_type
-                ),
-                "Date": date_str,
-                "x-oss-security-token": security_token,
-                "x-oss-content-sha256": "UNSIGNED-PAYLOAD",
-            }
+        if checkpoint is not None and checkpoint.upload is not None:
+            # Resume the upload to where the interrupted one was going
+            response_data = checkpoint.upload
+        else:
+            response_data = await self._arequest_upload(source)
+
+        # Extract credentials correctly
+        access_key_id = response_data["access_key_id"]
+        access_key_secret = response_data["access_key_secret"]
+        region = response_data["region"]
+        bucket_name = response_data.get("bucketname", "qwen-webui-prod")
 
-            # Get current UTC time for signing
-            request_datetime = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-            oss_headers["date"] = request_datetime
+        # Validate credentials
+        if not access_key_id:
+            raise QwenAPIError("AccessKey ID cannot be empty")
+        if not access_key_secret:
+            raise QwenAPIError("AccessKey Secret cannot be empty")
 
-            # Use an async executor to run the synchronous oss2 operations
-            loop = asyncio.get_event_loop()
-            # session = aiohttp.ClientSession()
+        # Get security token from response data
+        security_token = response_data.get("security_token")
+        if not security_token:
+            raise QwenAPIError("Security token cannot be empty")
 
-            try:
-                # Use the bucket's put_object method which handles signing automatically
-                oss_response = await loop.run_in_executor(
-                    None,
-                    lambda: bucket.put_object(
-                        key=response_data["file_path"],
-                        data=file_content if not base64_data else file_content,
-                        headers=oss_headers,
-                    ),
-                )
+        # Create minimal required headers for signing
+        request_datetime = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
 
-                # Add additional required headers for the OSS request
-                oss_headers.update(
-                    {
-                        "x-oss-date": request_datetime,
-                        "Host": f"{bucket_name}.{region}.aliyuncs.com",
-                    }
-                )
+        # Use oss2 library to generate signed headers instead of manual signing,
+        # over the connections of the client's OSS pool
+        bucket = self._client.oss_pool.bucket(
+            region, response_data["bucketname"], access_key_id, access_key_secret
+        )
 
-                # Check if the upload was successful
-                if oss_response.status != 200 and oss_response.status != 203:
-                    error_text = str(oss_response)
-                    self._client.logger.error(
-                        f"API Error: {oss_response.status} {error_text}"
-                    )
-                    raise QwenAPIError(f"API Error: {oss_response.status} {error_text}")
+        # Get current date in OSS format
+        date_str = http_date()
 
-                if oss_response.status == 429:
-                    self._client.logger.error("Too many requests")
-                    raise RateLimitError("Too many requests")
+        # Create basic headers
+        oss_headers = {
+            "Content-Type": content_type,
+            "Date": date_str,
+            "x-oss-security-token": security_token,
+            "x-oss-content-sha256": "UNSIGNED-PAYLOAD",
+        }
+
+        # Get current UTC time for signing
+        request_datetime = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        oss_headers["date"] = request_datetime
 
-                result = {
-                    "file_url": response_data["file_url"],
-                    "file_id": response_data["file_id"],
-                    "image_mimetype": mime_type,
+        try:
+            # Use the bucket's put_object method which handles signing automatically
+            if checkpoint is not None:
+                put = partial(
+                    self._put_multipart,
+                    bucket,
+                    response_data,
+                    source,
+                    oss_headers,
+                    checkpoint,
+                )
+            else:
+                put = partial(
+                    self._put_object,
+                    bucket,
+                    response_data["file_path"],
+                    source,
+                    oss_headers,
+                )
+            oss_response = await loop.run_in_executor(None, put)
+
+            # Add additional required headers for the OSS request
+            oss_headers.update(
+                {
+                    "x-oss-date": request_datetime,
+                    "Host": f"{bucket_name}.{region}.aliyuncs.com",
                 }
-                return FileResult(**result)
+            )
 
-            except Exception as e:
-                self._client.logger.error(f"Error: {e}")
-                raise
-            finally:
-                # Pastikan session ditutup
-                self._client.logger.debug("Closing session")
+            # Check if the upload was successful
+            if oss_response.status != 200 and oss_response.status != 203:
+                error_text = str(oss_response)
+                self._client.logger.error(
+                    f"API Error: {oss_response.status} {error_text}"
+                )
+                raise QwenAPIError(f"API Error: {oss_response.status} {error_text}")
+
+            result = {
+                "file_url": response_data["file_url"],
+                "file_id": response_data["file_id"],
+                "image_mimetype": content_type,
+            }
+            file_result = FileResult(**result)
+            if upload_cache is not None:
+                upload_cache.set(digest, mime_type, file_result)
+            return file_result
+
+        except Exception as e:
+            self._client.logger.error(f"Error: {e}")
+            raise
@@ -1,16 +1,23 @@
 import json
-import requests
-import aiohttp
+from functools import partial
+from pydantic import ValidationError
 from ..core.types.chat import ChatMessage
 from ..utils.tool_prompt import TOOL_PROMPT_SYSTEM
 from ..core.types.endpoint_api import EndpointAPI
-from ..core.exceptions import QwenAPIError, RateLimitError
+from ..core import json_codec
+from ..core.exceptions import StreamTimeoutError
+from ..core.response_cache import areplay, arecord, record
+from ..core.wire import payload_key
+from ..core.types.sse_event import SSE_EVENT_ADAPTER
 
 
-def using_tools(messages, tools, model, temperature, max_tokens, stream, client):
+def using_tools(
+    messages, tools, model, temperature, max_tokens, stream, client, timeouts=None
+):
     """
     Sync version of tool handling - simplified without selection logic
     """
+    messages = list(messages)
     # Convert tools to individual JSON objects separated by newlines (no array brackets)
     tools_str = "\n".join([json.dumps(tool, ensure_ascii=False) for tool in tools])
 
@@ -26,53 +33,60 @@ def using_tools(messages, tools, model, temperature, max_tokens, stream, client)
         # Create new system message and include all original messages
         msg_tool = [ChatMessage(role="system", content=system_content)] + messages
 
-    payload_tools = client._build_payload(
-        messages=msg_tool, model=model, temperature=temperature, max_tokens=max_tokens
-    )
-
-    response_tool = requests.post(
-        url=client.base_url + EndpointAPI.completions,
-        headers=client._build_headers(),
-        json=payload_tools,
-        timeout=client.timeout,
-        stream=stream,
+    payload_tools = json_codec.dumps(
+        client._build_payload(
+            messages=msg_tool,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
     )
+    # The tools are part of the payload, hence of the cache key
+    key = payload_key(payload_tools)
+    cache = client._cache_for(temperature)
+    cached = cache.get(key) if cache is not None else None
+
+    if cached is not None:
+        client.logger.info("Tool response served from cache")
+        response_tool = None
+        events = iter(cached)
+    else:
+        response_tool = client._post(
+            EndpointAPI.completions,
+            payload=payload_tools,
+            hold_stream=True,
+            timeouts=timeouts,
+            model=model,
+        )
 
-    if not response_tool.ok:
-        error_text = response_tool.text
-        client.logger.error(f"API Error: {response_tool.status_code} {error_text}")
-        raise QwenAPIError(f"API Error: {response_tool.status_code} {error_text}")
-
-    if response_tool.status_code == 429:
-        client.logger.error("Too many requests")
-        raise RateLimitError("Too many requests")
-
-    client.logger.info(f"Response status: {response_tool.status_code}")
-    client.logger.info(
-        f"Response content-type: {response_tool.headers.get('content-type', 'unknown')}"
-    )
+        client.logger.info(f"Response status: {response_tool.status_code}")
+        client.logger.info(
+            f"Response content-type: {response_tool.headers.get('content-type', 'unknown')}"
+        )
 
-    # Parse tool response directly
-    try:
+        events = None
         # Check if response is streaming format
         content_type = response_tool.headers.get("content-type", "")
         if "text/event-stream" in content_type:
+            events = client._iter_events(response_tool)
+            if cache is not None:
+                events = record(events, partial(cache.set, key))
+
+    # Parse tool response directly
+    try:
+        if events is not None:
             # Handle streaming response
             content = ""
-            for line in response_tool.iter_lines(decode_unicode=True):
-                if line.startswith("data: ") and not line.endswith("[DONE]"):
+            for data_part in events:
+                if data_part and data_part != b"[DONE]":
                     try:
-                        data_part = line[6:]  # Remove 'data: ' prefix
-                        if data_part and data_part != "[DONE]":
-                            chunk_data = json.loads(data_part)
-                            delta_content = (
-                                chunk_data.get("choices", [{}])[0]
-                                .get("delta", {})
-                                .get("content", "")
-                            )
-                            if delta_content:
-                                content += delta_content
-                    except json.JSONDecodeError:
+                        chunk_data = SSE_EVENT_ADAPTER.validate_json(data_part)
+                        delta_content = chunk_data["choices"][0]["delta"].get(
+                            "content", ""
+                        )
+                        if delta_content:
+                            content += delta_content
+                    except ValidationError:
                         continue
         else:
             # Handle regular JSON response
@@ -127,6 +141,8 @@ def using_tools(messages, tools, model, temperature, max_tokens, stream, client)
 
         return chat_response
 
+    except StreamTimeoutError:
+        raise
     except Exception as e:
         client.logger.error(f"Error parsing tool response: {e}")
         # Return error response
@@ -139,12 +155,17 @@ def using_tools(messages, tools, model, temperature, max_tokens, stream, client)
         choice = Choice(message=message, extra=None)
 
         return ChatResponse(choices=choice)
+    finally:
+        client._release_response(response_tool)
 
 
-async def async_using_tools(messages, tools, model, temperature, max_tokens, client):
+async def async_using_tools(
+    messages, tools, model, temperature, max_tokens, client, timeouts=None
+):
     """
     Main function for handling tools - simplified version without selection logic
     """
+    messages = list(messages)
     # Convert tools to individual JSON objects separated by newlines (no array brackets)
     tools_str = "\n".join([json.dumps(tool, ensure_ascii=False) for tool in tools])
 
@@ -160,57 +181,60 @@ async def async_using_tools(messages, tools, model, temperature, max_tokens, cli
         # Create new system message and include all original messages
         msg_tool = [ChatMessage(role="system", content=system_content)] + messages
 
-    payload_tools = client._build_payload(
-        messages=msg_tool, model=model, temperature=temperature, max_tokens=max_tokens
-    )
-
-    session = aiohttp.ClientSession()
-    try:
-        response_tool = await session.post(
-            url=client.base_url + EndpointAPI.completions,
-            headers=client._build_headers(),
-            json=payload_tools,
-            timeout=aiohttp.ClientTimeout(total=client.timeout),
+    payload_tools = json_codec.dumps(
+        client._build_payload(
+            messages=msg_tool,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
         )
-
-        if not response_tool.ok:
-            error_text = await response_tool.text()
-            client.logger.error(f"API Error: {response_tool.status} {error_text}")
-            raise QwenAPIError(f"API Error: {response_tool.status} {error_text}")
-
-        if response_tool.status == 429:
-            client.logger.error("Too many requests")
-            raise RateLimitError("Too many requests")
-
-        client.logger.info(f"Response status: {response_tool.status}")
-        client.logger.info(
-            f"Response content-type: {response_tool.headers.get('content-type', 'unknown')}"
+    )
+    # The tools are part of the payload, hence of the cache key
+    key = payload_key(payload_tools)
+    cache = client._cache_for(temperature)
+    cached = cache.get(key) if cache is not None else None
+
+    if cached is not None:
+        client.logger.info("Tool response served from cache")
+        response_tool = None
+        events = areplay(cached)
+    else:
+        response_tool = await client._apost(
+            EndpointAPI.completions,
+            payload=payload_tools,
+            hold_stream=True,
+            model=model,
+            timeouts=timeouts,
         )
-
-        # Parse tool response directly
-        try:
+        events = None
+    try:
+        if response_tool is not None:
+            client.logger.info(f"Response status: {response_tool.status}")
+            client.logger.info(
+                f"Response content-type: {response_tool.headers.get('content-type', 'unknown')}"
+            )
             # Check if response is streaming format
             content_type = response_tool.headers.get("content-type", "")
             if "text/event-stream" in content_type:
+                events = client._aiter_events(response_tool)
+                if cache is not None:
+                    events = arecord(events, partial(cache.set, key))
+
+        # Parse tool response directly
+        try:
+            if events is not None:
                 # Handle streaming response
                 content = ""
-                async for line in response_tool.content:
-                    line_str = line.decode("utf-8").strip()
-                    if line_str.startswith("data: ") and not line_str.endswith(
-                        "[DONE]"
-                    ):
+                async for data_part in events:
+                    if data_part and data_part != b"[DONE]":
                         try:
-                            data_part = line_str[6:]  # Remove 'data: ' prefix
-                            if data_part and data_part != "[DONE]":
-                                chunk_data = json.loads(data_part)
-                                delta_content = (
-                                    chunk_data.get("choices", [{}])[0]
-                                    .get("delta", {})
-                                    .get("content", "")
-                                )
-                                if delta_content:
-                                    content += delta_content
-                        except json.JSONDecodeError:
+                            chunk_data = SSE_EVENT_ADAPTER.validate_json(data_part)
+                            delta_content = chunk_data["choices"][0]["delta"].get(
+                                "content", ""
+                            )
+                            if delta_content:
+                                content += delta_content
+                        except ValidationError:
                             continue
             else:
                 # Handle regular JSON response
@@ -268,6 +292,8 @@ async def async_using_tools(messages, tools, model, temperature, max_tokens, cli
 
             return chat_response
 
+        except StreamTimeoutError:
+            raise
         except Exception as e:
             client.logger.error(f"Error parsing tool response: {e}")
             # Return error response
@@ -281,4 +307,4 @@ async def async_using_tools(messages, tools, model, temperature, max_tokens, cli
 
             return ChatResponse(choices=choice)
     finally:
-        await session.close()
+        client._release_response(response_tool)
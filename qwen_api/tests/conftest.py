@@ -0,0 +1,75 @@
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import oss2
+import pytest
+from oss2.exceptions import NoSuchUpload, ServerError
+from oss2.models import PartInfo
+
+
+class FakeOSS:
+    """Bucket API of ``oss2`` keeping objects and multipart uploads in memory."""
+
+    def __init__(self):
+        self.objects = {}
+        # upload id -> part number -> bytes
+        self.uploads = {}
+        # Part numbers answered with a 500 error
+        self.fail_parts = set()
+        self.parts_sent = []
+        self._lock = threading.Lock()
+
+    def put_object(self, bucket, key, data, headers=None, progress_callback=None):
+        self.objects[key] = data.read()
+        return SimpleNamespace(status=200)
+
+    def init_multipart_upload(self, bucket, key, headers=None, params=None):
+        with self._lock:
+            upload_id = f"upload-{len(self.uploads) + 1}"
+            self.uploads[upload_id] = {}
+        return SimpleNamespace(upload_id=upload_id)
+
+    def upload_part(
+        self, bucket, key, upload_id, number, data, progress_callback=None, headers=None
+    ):
+        if number in self.fail_parts:
+            raise ServerError(500, {}, b"", {})
+        with self._lock:
+            self.uploads[upload_id][number] = bytes(data)
+            self.parts_sent.append(number)
+        return SimpleNamespace(etag=hashlib.md5(data).hexdigest())
+
+    def list_parts(
+        self, bucket, key, upload_id, marker="", max_parts=1000, headers=None
+    ):
+        if upload_id not in self.uploads:
+            raise NoSuchUpload(404, {}, b"", {})
+        parts = [
+            PartInfo(number, hashlib.md5(data).hexdigest(), size=len(data))
+            for number, data in sorted(self.uploads[upload_id].items())
+        ]
+        return SimpleNamespace(parts=parts, is_truncated=False, next_marker="")
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts, headers=None):
+        uploaded = self.uploads.pop(upload_id)
+        self.objects[key] = b"".join(uploaded[part.part_number] for part in parts)
+        return SimpleNamespace(status=200)
+
+
+@pytest.fixture
+def oss(monkeypatch):
+    """``FakeOSS`` standing in for every ``oss2.Bucket``."""
+    fake = FakeOSS()
+    for name in (
+        "put_object",
+        "init_multipart_upload",
+        "upload_part",
+        "list_parts",
+        "complete_multipart_upload",
+    ):
+        method = getattr(fake, name)
+        monkeypatch.setattr(
+            oss2.Bucket, name, lambda bucket, *a, _m=method, **kw: _m(bucket, *a, **kw)
+        )
+    return fake
@@ -0,0 +1,98 @@
+"""Local aiohttp server standing in for the Qwen API in tests."""
+
+import asyncio
+import json
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator
+
+from aiohttp import web
+
+from qwen_api.core.types.endpoint_api import EndpointAPI
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+def sse_event(content: str) -> bytes:
+    """SSE event of an answer chunk."""
+    data = {
+        "choices": [
+            {
+                "delta": {
+                    "role": "assistant",
+                    "content": content,
+                    "phase": "answer",
+                    "status": "typing",
+                }
+            }
+        ],
+        "usage": {"input_tokens": 1, "output_tokens": 1, "total_tokens": 2},
+    }
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+async def answer(request: web.Request, content: str = "Hello") -> web.StreamResponse:
+    """Stream ``content`` as a one-event answer."""
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    await response.write(sse_event(content))
+    return response
+
+
+def sts_token(requests: list) -> Handler:
+    """
+    ``getstsToken`` handler granting uploads to ``FakeOSS``, recording the
+    requests it got in ``requests``.
+    """
+
+    async def handler(request: web.Request) -> web.Response:
+        body = await request.json()
+        requests.append(body)
+        key = f"uploads/{len(requests)}/{body['filename']}"
+        return web.json_response(
+            {
+                "access_key_id": "id",
+                "access_key_secret": "secret",
+                "security_token": "token",
+                "region": "oss-test",
+                "bucketname": "bucket",
+                "file_path": key,
+                "file_url": f"https://bucket.oss-test.aliyuncs.com/{key}"
+                "?Expires=9999999999",
+                "file_id": f"file-{len(requests)}",
+            }
+        )
+
+    return handler
+
+
+@contextmanager
+def serve(
+    completions: Handler, path: str = EndpointAPI.completions, **routes: Handler
+) -> Iterator[str]:
+    """
+    Run a server answering POSTs to ``path`` with ``completions``, and to
+    the other paths of ``routes`` (keyed by ``EndpointAPI`` attribute), on
+    a thread of its own. Yields its base URL.
+    """
+    loop = asyncio.new_event_loop()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    app = web.Application()
+    app.router.add_post(path, completions)
+    for name, handler in routes.items():
+        app.router.add_post(getattr(EndpointAPI, name), handler)
+    # Cancel stalled handlers once the client aborts their request
+    runner = web.AppRunner(app, handler_cancellation=True, shutdown_timeout=0.1)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.SockSite(runner, sock).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
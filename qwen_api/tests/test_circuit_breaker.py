@@ -0,0 +1,88 @@
+import time
+
+import pytest
+from aiohttp import web
+
+from qwen_api import CircuitBreaker, Qwen, RetryPolicy
+from qwen_api.core.exceptions import CircuitOpenError, QwenAPIError
+from qwen_api.core.types.chat import ChatMessage
+from server import answer, serve
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+OPEN_DURATION = 0.3
+
+
+def _breaker(transitions: list) -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_rate=0.5,
+        window=4,
+        min_calls=4,
+        open_duration=OPEN_DURATION,
+        half_open_probes=2,
+        on_state_change=transitions.append,
+    )
+
+
+def test_circuit_opens_probes_and_closes():
+    calls = []
+    healthy = [False]
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        calls.append(request)
+        if not healthy[0]:
+            return web.Response(status=500, text="upstream down")
+        return await answer(request)
+
+    transitions = []
+    with serve(completions) as base_url:
+        client = Qwen(
+            api_key="key",
+            cookie="cookie",
+            base_url=base_url,
+            circuit_breaker=_breaker(transitions),
+            retry_policy=RetryPolicy(max_attempts=1),
+            log_level="CRITICAL",
+        )
+        for _ in range(4):
+            with pytest.raises(QwenAPIError):
+                client.chat.create(messages=MESSAGES)
+        # Rejected without reaching the server
+        with pytest.raises(CircuitOpenError) as error:
+            client.chat.create(messages=MESSAGES)
+        assert 0 < error.value.retry_after <= OPEN_DURATION
+        assert len(calls) == 4
+
+        healthy[0] = True
+        time.sleep(OPEN_DURATION)
+        for _ in range(2):
+            response = client.chat.create(messages=MESSAGES)
+            assert response.choices.message.content == "Hello"
+        client.close()
+
+    assert [(t.previous, t.state) for t in transitions] == [
+        ("closed", "open"),
+        ("open", "half_open"),
+        ("half_open", "closed"),
+    ]
+    assert len(calls) == 6
+
+
+def test_failed_probe_reopens_circuit():
+    transitions = []
+    breaker = _breaker(transitions)
+    for _ in range(4):
+        breaker.begin("chat", "model").fail()
+    assert breaker.state("chat", "model") == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.begin("chat", "model")
+
+    time.sleep(OPEN_DURATION)
+    probe = breaker.begin("chat", "model")
+    assert probe.probe
+    assert breaker.state("chat", "model") == "half_open"
+    probe.fail()
+    assert breaker.state("chat", "model") == "open"
+    # Other models keep their own circuit
+    assert breaker.state("chat", "other") == "closed"
+    assert [t.state for t in transitions] == ["open", "half_open", "open"]
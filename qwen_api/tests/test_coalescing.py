@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from qwen_api import Qwen
+from qwen_api.core.types.chat import ChatMessage
+from server import answer, serve
+
+CALLERS = 8
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+
+def _slow_answer():
+    calls = []
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        calls.append(request)
+        # Long enough for every caller to join the flight
+        await asyncio.sleep(0.5)
+        return await answer(request, f"answer {len(calls)}")
+
+    return calls, completions
+
+
+def _client(base_url: str) -> Qwen:
+    return Qwen(
+        api_key="key",
+        cookie="cookie",
+        base_url=base_url,
+        coalesce_requests=True,
+        log_level="CRITICAL",
+    )
+
+
+def test_concurrent_callers_share_one_call_sync():
+    calls, completions = _slow_answer()
+    with serve(completions) as base_url:
+        client = _client(base_url)
+
+        def ask(stream: bool) -> str:
+            response = client.chat.create(messages=MESSAGES, stream=stream)
+            if stream:
+                return "".join(chunk.choices[0].delta.content for chunk in response)
+            return response.choices.message.content
+
+        with ThreadPoolExecutor(CALLERS) as pool:
+            answers = list(pool.map(ask, [i % 2 == 0 for i in range(CALLERS)]))
+        stats = client.coalescer.stats()
+        client.close()
+    assert len(calls) == 1
+    assert answers == ["answer 1"] * CALLERS
+    assert (stats.flights, stats.coalesced, stats.in_flight) == (1, CALLERS - 1, 0)
+
+
+def test_concurrent_callers_share_one_call_async():
+    calls, completions = _slow_answer()
+
+    async def run(base_url):
+        client = _client(base_url)
+        try:
+            responses = await asyncio.gather(
+                *(client.chat.acreate(messages=MESSAGES) for _ in range(CALLERS))
+            )
+            return responses, client.coalescer.stats()
+        finally:
+            await client.aclose()
+
+    with serve(completions) as base_url:
+        responses, stats = asyncio.run(run(base_url))
+    assert len(calls) == 1
+    assert [r.choices.message.content for r in responses] == ["answer 1"] * CALLERS
+    assert (stats.flights, stats.coalesced, stats.in_flight) == (1, CALLERS - 1, 0)
+
+
+def test_later_requests_go_upstream_again():
+    calls, completions = _slow_answer()
+    with serve(completions) as base_url:
+        client = _client(base_url)
+        first = client.chat.create(messages=MESSAGES)
+        second = client.chat.create(messages=MESSAGES)
+        client.close()
+    assert len(calls) == 2
+    assert first.choices.message.content == "answer 1"
+    assert second.choices.message.content == "answer 2"
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from qwen_api import HedgePolicy, Qwen
+from qwen_api.core.types.chat import ChatMessage
+from server import answer, serve
+
+# Seconds the first request waits before sending its headers
+SLOW_HEADERS = 2.0
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+
+def _slow_first_request():
+    calls = []
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(SLOW_HEADERS)
+            return await answer(request, "slow")
+        return await answer(request, "fast")
+
+    return completions
+
+
+def _client(base_url: str, policy: HedgePolicy) -> Qwen:
+    return Qwen(
+        api_key="key",
+        cookie="cookie",
+        base_url=base_url,
+        hedge_policy=policy,
+        log_level="CRITICAL",
+    )
+
+
+def test_hedge_wins_over_slow_headers_sync():
+    policy = HedgePolicy(initial_delay=0.2)
+    with serve(_slow_first_request()) as base_url:
+        client = _client(base_url, policy)
+        started = time.monotonic()
+        response = client.chat.create(messages=MESSAGES)
+        elapsed = time.monotonic() - started
+        client.close()
+    assert response.choices.message.content == "fast"
+    assert elapsed < 1.0
+    assert policy.stats().hedge_wins == 1
+
+
+def test_hedge_wins_over_slow_headers_async():
+    policy = HedgePolicy(initial_delay=0.2)
+
+    async def run(base_url):
+        client = _client(base_url, policy)
+        try:
+            started = time.monotonic()
+            response = await client.chat.acreate(messages=MESSAGES)
+            return response, time.monotonic() - started
+        finally:
+            await client.aclose()
+
+    with serve(_slow_first_request()) as base_url:
+        response, elapsed = asyncio.run(run(base_url))
+    assert response.choices.message.content == "fast"
+    assert elapsed < 1.0
+    assert policy.stats().hedge_wins == 1
@@ -0,0 +1,111 @@
+import json
+import os
+import stat
+
+import pytest
+from oss2.exceptions import OssError
+
+from qwen_api import MultipartPolicy, Qwen, RetryPolicy
+from qwen_api.core.multipart import MIN_PART_SIZE, UploadCheckpoint
+from server import answer, serve, sts_token
+
+PARTS = 11
+FAILING_PART = 5
+
+
+@pytest.fixture
+def big_file(tmp_path):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(os.urandom(MIN_PART_SIZE * (PARTS - 1) + 123))
+    return path
+
+
+def _client(base_url: str, checkpoint_dir) -> Qwen:
+    return Qwen(
+        api_key="key",
+        cookie="cookie",
+        base_url=base_url,
+        multipart_policy=MultipartPolicy(
+            threshold=2 * MIN_PART_SIZE,
+            part_size=MIN_PART_SIZE,
+            max_workers=2,
+            checkpoint_dir=str(checkpoint_dir),
+        ),
+        retry_policy=RetryPolicy(max_attempts=1),
+        log_level="CRITICAL",
+    )
+
+
+def test_interrupted_upload_resumes_from_checkpoint(oss, tmp_path, big_file):
+    checkpoints = tmp_path / "checkpoints"
+    requests = []
+    with serve(answer, upload_file=sts_token(requests)) as base_url:
+        client = _client(base_url, checkpoints)
+        oss.fail_parts = {FAILING_PART}
+        with pytest.raises(OssError):
+            client.chat.upload_file(file_path=str(big_file))
+        first_parts = set(oss.parts_sent)
+        assert FAILING_PART not in first_parts
+        (checkpoint,) = checkpoints.iterdir()
+        assert stat.S_IMODE(checkpoint.stat().st_mode) == 0o600
+        saved = json.loads(checkpoint.read_text())
+        assert set(map(int, saved["parts"])) == first_parts
+
+        # A new client, as after a restart
+        oss.fail_parts = set()
+        oss.parts_sent.clear()
+        client = _client(base_url, checkpoints)
+        result = client.chat.upload_file(file_path=str(big_file))
+        client.close()
+
+    assert set(oss.parts_sent) == set(range(1, PARTS + 1)) - first_parts
+    # The resumed upload goes where the interrupted one was going
+    assert len(requests) == 1
+    assert result.file_id == "file-1"
+    assert oss.objects[saved["upload"]["file_path"]] == big_file.read_bytes()
+    assert not list(checkpoints.iterdir())
+
+
+def test_upload_gone_from_oss_starts_over(oss, tmp_path, big_file):
+    checkpoints = tmp_path / "checkpoints"
+    requests = []
+    with serve(answer, upload_file=sts_token(requests)) as base_url:
+        client = _client(base_url, checkpoints)
+        oss.fail_parts = {FAILING_PART}
+        with pytest.raises(OssError):
+            client.chat.upload_file(file_path=str(big_file))
+        # Aborted, or removed by the lifecycle rules of the bucket
+        oss.uploads.clear()
+        oss.fail_parts = set()
+        oss.parts_sent.clear()
+        result = client.chat.upload_file(file_path=str(big_file))
+        client.close()
+
+    assert sorted(oss.parts_sent) == list(range(1, PARTS + 1))
+    assert len(requests) == 2
+    assert result.file_id == "file-2"
+    assert not list(checkpoints.iterdir())
+
+
+def test_small_uploads_are_sent_whole(oss, tmp_path):
+    requests = []
+    with serve(answer, upload_file=sts_token(requests)) as base_url:
+        client = _client(base_url, tmp_path)
+        client.chat.upload_file(file=b"small", filename="note.txt")
+        client.close()
+    assert list(oss.objects.values()) == [b"small"]
+    assert not oss.parts_sent
+
+
+def test_checkpoint_of_other_bytes_is_not_resumed(tmp_path):
+    path = str(tmp_path / "upload.json")
+    checkpoint = UploadCheckpoint(path, size=1000, part_size=MIN_PART_SIZE)
+    checkpoint.upload = {"file_url": "https://bucket/key?Expires=9999999999"}
+    checkpoint.upload_id = "upload-1"
+    checkpoint.add_part(1, "etag")
+
+    resumed = UploadCheckpoint.load(path, 1000, MIN_PART_SIZE)
+    assert (resumed.upload_id, resumed.parts) == ("upload-1", {1: "etag"})
+    stale = UploadCheckpoint.load(path, 2000, MIN_PART_SIZE)
+    assert stale.upload_id is None
+    assert not os.path.exists(path)
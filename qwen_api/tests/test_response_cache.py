@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from aiohttp import web
+
+from qwen_api import Qwen, ResponseCache, SQLiteResponseCache
+from qwen_api.core.types.chat import ChatMessage
+from server import answer, serve
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+
+@pytest.fixture(scope="module")
+def server():
+    """Server numbering its answers, with the list of calls it got."""
+    calls = []
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        calls.append(request)
+        return await answer(request, f"answer {len(calls)}")
+
+    with serve(completions) as base_url:
+        yield base_url, calls
+
+
+def _client(base_url: str, cache) -> Qwen:
+    return Qwen(
+        api_key="key",
+        cookie="cookie",
+        base_url=base_url,
+        response_cache=cache,
+        log_level="CRITICAL",
+    )
+
+
+def _ask(client: Qwen, content: str = "hi", stream: bool = False, **kwargs) -> str:
+    messages = [ChatMessage(role="user", content=content)]
+    response = client.chat.create(
+        messages=messages, stream=stream, temperature=0.0, **kwargs
+    )
+    if stream:
+        return "".join(chunk.choices[0].delta.content for chunk in response)
+    return response.choices.message.content
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return ResponseCache()
+    return SQLiteResponseCache(str(tmp_path / "responses.db"))
+
+
+def test_repeated_request_is_served_from_cache(server, cache):
+    base_url, calls = server
+    client = _client(base_url, cache)
+    before = len(calls)
+    first = _ask(client)
+    # Streaming and non-streaming callers share an entry
+    assert _ask(client, stream=True) == first
+    assert _ask(client) == first
+    assert len(calls) == before + 1
+    # Other questions and sampled answers go upstream
+    _ask(client, "other")
+    client.chat.create(messages=MESSAGES, temperature=0.7)
+    assert len(calls) == before + 3
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (2, 2, 2)
+    client.close()
+
+
+def test_cached_response_served_async(server, cache):
+    base_url, calls = server
+
+    async def run():
+        client = _client(base_url, cache)
+        try:
+            return [
+                (
+                    await client.chat.acreate(messages=MESSAGES, temperature=0.0)
+                ).choices.message.content
+                for _ in range(2)
+            ]
+        finally:
+            await client.aclose()
+
+    before = len(calls)
+    first, second = asyncio.run(run())
+    assert first == second
+    assert len(calls) == before + 1
+
+
+def test_entries_expire_and_are_evicted():
+    cache = ResponseCache(max_entries=2, ttl=0.2)
+    cache.set("a", [b"1"])
+    cache.set("b", [b"2"])
+    cache.set("c", [b"3"])
+    assert cache.get("a") is None
+    assert cache.get("c") == (b"3",)
+    time.sleep(0.2)
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert (stats.evictions, stats.expirations, stats.entries) == (1, 1, 1)
+
+
+def test_sqlite_cache_survives_restarts_and_evicts(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = SQLiteResponseCache(path, max_entries=2)
+    cache.set("a", [b"1", b"2"])
+    cache.set("b", [b"3"])
+    cache.close()
+
+    reopened = SQLiteResponseCache(path, max_entries=2)
+    assert reopened.get("a") == (b"1", b"2")
+    reopened.set("c", [b"4"])
+    # "a" was stored, and last read, first
+    assert reopened.get("a") is None
+    assert reopened.stats().evictions == 1
+    reopened.delete("b")
+    assert reopened.get("b") is None
+    reopened.clear()
+    assert reopened.stats().entries == 0
+    reopened.close()
+
+
+def test_sqlite_cache_errors_are_misses(tmp_path, caplog):
+    path = tmp_path / "responses.db"
+    cache = SQLiteResponseCache(str(path))
+    cache.set("a", [b"1"])
+    # The open connection does not create the table again
+    cache._connect().execute("DROP TABLE responses")
+    with caplog.at_level(logging.WARNING, logger="qwen_api"):
+        assert cache.get("a") is None
+        cache.set("b", [b"2"])
+        cache.delete("a")
+        cache.clear()
+        stats = cache.stats()
+    assert (stats.misses, stats.entries, stats.bytes) == (1, 0, 0)
+    assert len(caplog.records) == 5
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+from aiohttp import web
+
+from qwen_api import Qwen, RetryPolicy
+from qwen_api.core.exceptions import RateLimitError
+from qwen_api.core.retry import parse_retry_after
+from qwen_api.core.types.chat import ChatMessage
+from server import answer, serve
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+RETRY_AFTER = 0.3
+
+
+def _rate_limited(times: int, retry_after: float = RETRY_AFTER):
+    """Completions answering 429 to the first ``times`` calls."""
+    calls = []
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        calls.append(time.monotonic())
+        if len(calls) <= times:
+            return web.Response(
+                status=429,
+                text="slow down",
+                headers={"Retry-After": str(retry_after)},
+            )
+        return await answer(request)
+
+    return calls, completions
+
+
+def _client(base_url: str, policy: RetryPolicy) -> Qwen:
+    return Qwen(
+        api_key="key",
+        cookie="cookie",
+        base_url=base_url,
+        retry_policy=policy,
+        log_level="CRITICAL",
+    )
+
+
+# Backoff far shorter than Retry-After, so only the header explains the wait
+FAST_BACKOFF = RetryPolicy(base_delay=0.01, max_delay=0.05)
+
+
+def test_retry_waits_for_retry_after_sync():
+    calls, completions = _rate_limited(1)
+    with serve(completions) as base_url:
+        client = _client(base_url, FAST_BACKOFF)
+        response = client.chat.create(messages=MESSAGES)
+        client.close()
+    assert response.choices.message.content == "Hello"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= RETRY_AFTER
+
+
+def test_retry_waits_for_retry_after_async():
+    calls, completions = _rate_limited(1)
+
+    async def run(base_url):
+        client = _client(base_url, FAST_BACKOFF)
+        try:
+            return await client.chat.acreate(messages=MESSAGES)
+        finally:
+            await client.aclose()
+
+    with serve(completions) as base_url:
+        response = asyncio.run(run(base_url))
+    assert response.choices.message.content == "Hello"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= RETRY_AFTER
+
+
+def test_retry_after_beyond_total_budget_is_not_waited_for():
+    calls, completions = _rate_limited(1, retry_after=10)
+    policy = RetryPolicy(base_delay=0.01, max_delay=0.05, total_budget=1.0)
+    with serve(completions) as base_url:
+        client = _client(base_url, policy)
+        started = time.monotonic()
+        with pytest.raises(RateLimitError):
+            client.chat.create(messages=MESSAGES)
+        elapsed = time.monotonic() - started
+        client.close()
+    assert len(calls) == 1
+    assert elapsed < 1.0
+
+
+def test_retry_budget_limits_retries_across_requests():
+    calls, completions = _rate_limited(100, retry_after=0)
+    # No tokens from requests or time: only the one the bucket starts with
+    policy = RetryPolicy(
+        max_attempts=5,
+        base_delay=0.01,
+        max_delay=0.01,
+        budget_ratio=0.0,
+        budget_min_retries=0.0,
+    )
+    with serve(completions) as base_url:
+        client = _client(base_url, policy)
+        with pytest.raises(RateLimitError):
+            client.chat.create(messages=MESSAGES)
+        assert len(calls) == 2
+        with pytest.raises(RateLimitError):
+            client.chat.create(messages=MESSAGES)
+        assert len(calls) == 3
+        client.close()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"Retry-After": "2.5"}) == 2.5
+    assert parse_retry_after({"Retry-After": "-1"}) == 0.0
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"Retry-After": "soon"}) is None
+    date = formatdate(time.time() + 60, usegmt=True)
+    assert 55 < parse_retry_after({"Retry-After": date}) <= 60
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from qwen_api import Qwen, Timeouts
+from qwen_api.core.exceptions import StreamTimeoutError
+from qwen_api.core.types.chat import ChatMessage
+from server import serve, sse_event
+
+# Seconds the server goes silent after its first event
+STALL = 30
+
+
+async def _stalling_completions(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    await response.write(sse_event("Hello"))
+    await asyncio.sleep(STALL)
+    return response
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    """URL of a server whose streams stall after their first event."""
+    with serve(_stalling_completions) as url:
+        yield url
+
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+# The idle deadline must fire long before the first-token deadline, and with
+# first_token=None before the socket read timeout
+TIMEOUTS = [
+    Timeouts(first_token=10.0, idle=0.5),
+    Timeouts(first_token=None, idle=0.5),
+]
+
+
+def _client(base_url: str) -> Qwen:
+    return Qwen(api_key="key", cookie="cookie", base_url=base_url, log_level="CRITICAL")
+
+
+@pytest.mark.parametrize("timeouts", TIMEOUTS)
+@pytest.mark.parametrize("stream", [False, True])
+def test_idle_stall_aborts_sync(base_url, timeouts, stream):
+    client = _client(base_url)
+    started = time.monotonic()
+    with pytest.raises(StreamTimeoutError) as error:
+        response = client.chat.create(
+            messages=MESSAGES, stream=stream, timeouts=timeouts
+        )
+        if stream:
+            for _ in response:
+                pass
+    assert error.value.phase == "idle"
+    assert time.monotonic() - started < 3.0
+    client.close()
+
+
+@pytest.mark.parametrize("timeouts", TIMEOUTS)
+@pytest.mark.parametrize("stream", [False, True])
+def test_idle_stall_aborts_async(base_url, timeouts, stream):
+    async def run():
+        client = _client(base_url)
+        started = time.monotonic()
+        try:
+            with pytest.raises(StreamTimeoutError) as error:
+                response = await client.chat.acreate(
+                    messages=MESSAGES, stream=stream, timeouts=timeouts
+                )
+                if stream:
+                    async for _ in response:
+                        pass
+        finally:
+            await client.aclose()
+        return error.value, time.monotonic() - started
+
+    error, elapsed = asyncio.run(run())
+    assert error.phase == "idle"
+    assert elapsed < 3.0
+
+
+def test_socket_read_timeout_outlasts_deadlines():
+    assert Timeouts(first_token=None, idle=0.5).read > 600.0
+    assert Timeouts(first_token=30.0, idle=5.0).read > 30.0
+    assert Timeouts(first_token=None, idle=None, total=None).read is None
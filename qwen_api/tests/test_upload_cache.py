@@ -0,0 +1,93 @@
+import logging
+import sqlite3
+import time
+
+from qwen_api import Qwen, UploadCache
+from qwen_api.core.types.upload_file import FileResult
+from qwen_api.core.upload_cache import url_expiry
+from server import answer, serve, sts_token
+
+
+def _client(base_url: str, cache: UploadCache) -> Qwen:
+    return Qwen(
+        api_key="key",
+        cookie="cookie",
+        base_url=base_url,
+        upload_cache=cache,
+        log_level="CRITICAL",
+    )
+
+
+def _result(n: int, expires: float = 9999999999) -> FileResult:
+    return FileResult(
+        file_url=f"https://bucket.oss-test.aliyuncs.com/{n}?Expires={expires:.0f}",
+        file_id=f"file-{n}",
+        image_mimetype="image/png",
+    )
+
+
+def test_same_bytes_are_uploaded_once(oss, tmp_path):
+    first, copy, other = (tmp_path / n for n in ("a.png", "b.png", "c.jpg"))
+    first.write_bytes(b"png bytes")
+    copy.write_bytes(b"png bytes")
+    other.write_bytes(b"png bytes")
+    requests = []
+    cache = UploadCache()
+    with serve(answer, upload_file=sts_token(requests)) as base_url:
+        client = _client(base_url, cache)
+        uploaded = client.chat.upload_file(file_path=str(first))
+        again = client.chat.upload_file(file_path=str(copy))
+        # Uploaded again under another MIME type
+        client.chat.upload_file(file_path=str(other))
+        client.close()
+    assert again == uploaded
+    assert len(requests) == 2
+    assert len(oss.objects) == 2
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 2, 2)
+
+
+def test_sqlite_entries_survive_restarts(oss, tmp_path):
+    path = str(tmp_path / "uploads.db")
+    requests = []
+    with serve(answer, upload_file=sts_token(requests)) as base_url:
+        client = _client(base_url, UploadCache(path=path))
+        uploaded = client.chat.upload_file(file=b"bytes", filename="a.png")
+        client.close()
+        client = _client(base_url, UploadCache(path=path))
+        again = client.chat.upload_file(file=b"bytes", filename="a.png")
+        client.close()
+    assert again == uploaded
+    assert len(requests) == 1
+
+
+def test_urls_about_to_expire_are_not_cached():
+    cache = UploadCache(margin=300)
+    cache.set("digest", "image/png", _result(1, expires=time.time() + 60))
+    assert cache.get("digest", "image/png") is None
+    assert url_expiry(_result(1, expires=1700000000).file_url) == 1700000000
+
+
+def test_sqlite_file_is_pruned_and_capped(tmp_path):
+    path = str(tmp_path / "uploads.db")
+    # Entries expire with their URL, soonest first
+    cache = UploadCache(ttl=float("inf"), max_entries=2, path=path)
+    db = sqlite3.connect(path, isolation_level=None)
+    cache.set("old", "image/png", _result(0))
+    db.execute("UPDATE uploads SET expires = ?", (time.time() - 1,))
+    for n in range(1, 4):
+        cache.set(f"digest-{n}", "image/png", _result(n, expires=9999999990 + n))
+    keys = sorted(key for (key,) in db.execute("SELECT key FROM uploads"))
+    assert keys == ["digest-2:image/png", "digest-3:image/png"]
+    db.close()
+
+
+def test_sqlite_errors_are_logged(tmp_path, caplog):
+    cache = UploadCache(path=str(tmp_path / "uploads.db"))
+    # The open connection does not create the table again
+    cache._connect().execute("DROP TABLE uploads")
+    with caplog.at_level(logging.WARNING, logger="qwen_api"):
+        assert cache.get("digest", "image/png") is None
+        cache.set("digest", "image/png", _result(1))
+        cache.clear()
+    assert len(caplog.records) == 3